@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Conformité et débit des moteurs Markdown → HTML (ocr_markdown) sur des pages OCR.
+Le corpus est formé de pages générées à l'image des résultats de Mistral OCR (titres, tableaux,
+notes de bas de page, blocs de code, formules, listes, images), ou des pages de résultats
+JSON réels passés avec --results. Chaque moteur installé est comparé à markdown2, la référence:
+- identique: même HTML, aux espaces près;
+- équivalent: même suite de balises et de textes (attributs, conteneurs des notes et liens
+  de retour ignorés), c'est-à-dire le même document affiché.
+Le script affiche ensuite le débit de chaque moteur en pages par seconde et en Mo/s.
+Les moteurs non installés sont ignorés.
+
+Usage:
+    python benchmarks/bench_markdown.py [--pages 300] [--repeat 5] [--results resultat.json ...]
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import difflib
+import argparse
+from html.parser import HTMLParser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ocr_markdown import render_markdown, available_backends, MARKDOWN_BACKENDS  # noqa: E402
+
+REFERENCE_BACKEND = "markdown2"
+
+# Balises sans effet sur le contenu affiché, ou propres au rendu des notes d'un moteur
+IGNORED_TAGS = {"div", "section", "span", "a", "sup", "hr"}
+
+WORDS = ("rapport annuel résultat exercice montant total charges produits société analyse données "
+         "tableau valeur moyenne période croissance marché client article section annexe note").split()
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    """Phrase de mots tirés au hasard."""
+    text = " ".join(rng.choice(WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + "."
+
+
+def make_page(rng: random.Random, index: int) -> str:
+    """
+    Génère le Markdown d'une page, tel que produit par l'OCR puis _enhance_tables_and_math.
+
+    Args:
+        rng: Générateur aléatoire (corpus reproductible)
+        index: Numéro de la page
+
+    Returns:
+        Markdown de la page
+    """
+    blocks = [f"# {sentence(rng, 3)[:-1]}", sentence(rng, 25) + f" Voir la note[^{index}]."]
+    if rng.random() < 0.6:
+        columns = rng.randint(3, 6)
+        rows = ["| " + " | ".join(f"Colonne {c}" for c in range(columns)) + " |",
+                "| " + " | ".join("---" for _ in range(columns)) + " |"]
+        for _ in range(rng.randint(3, 15)):
+            rows.append("| " + " | ".join(f"{rng.randint(0, 99999):,}".replace(",", " ")
+                                          for _ in range(columns)) + " |")
+        blocks.append("\n".join(rows))
+    if rng.random() < 0.5:
+        blocks.append(f"La variance vaut $$\\sigma^2 = \\frac{{1}}{{n}} \\sum_{{i=1}}^{{n}} (x_i - \\bar{{x}})^2$$ "
+                      f"pour $$n = {rng.randint(2, 500)}$$ observations.")
+        blocks.append("$$\n\\int_0^1 f(x) \\, dx = F(1) - F(0), \\quad a_{i} * b_{j} < c\n$$")
+    if rng.random() < 0.3:
+        blocks.append("```python\nfor ligne in tableau:\n    total += ligne['montant'] * taux\n```")
+    if rng.random() < 0.5:
+        blocks.append("\n".join(f"- {sentence(rng, 6)}" for _ in range(rng.randint(2, 6))))
+        blocks.append("1. **Premier point** : " + sentence(rng, 8) + "\n2. *Second point* : " + sentence(rng, 8))
+    if rng.random() < 0.3:
+        blocks.append(f"![img-{index}.jpeg](img-{index}.jpeg)")
+    blocks.append(f"## {sentence(rng, 4)[:-1]}")
+    blocks.append(sentence(rng, 40) + " ~~Ancien montant~~ remplacé.")
+    blocks.append(f"[^{index}]: {sentence(rng, 10)}")
+    return "\n\n".join(blocks) + "\n"
+
+
+def load_pages(results: list, count: int) -> list:
+    """
+    Charge le Markdown des pages de résultats JSON, ou génère le corpus synthétique.
+
+    Args:
+        results: Fichiers JSON de résultats OCR (vide pour le corpus synthétique)
+        count: Nombre de pages générées sans --results
+
+    Returns:
+        Liste de pages Markdown
+    """
+    if not results:
+        rng = random.Random(42)
+        return [make_page(rng, i) for i in range(count)]
+    pages = []
+    for path in results:
+        with open(path, encoding="utf-8") as f:
+            result = json.load(f)
+        pages.extend(page.get("markdown", "") for page in result.get("pages", []))
+    return pages
+
+
+class StructureParser(HTMLParser):
+    """Réduit un fragment HTML à sa suite de balises et de textes."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.tokens = []
+        self._text = []
+
+    def _flush(self):
+        text = " ".join("".join(self._text).replace("\xa0", " ").split())
+        # Liens de retour des notes (↩) et numéros entre crochets selon les moteurs
+        text = text.replace("↩︎", "").replace("↩", "").replace("[", "").replace("]", "").strip()
+        if text:
+            self.tokens.append(text)
+        self._text = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag not in IGNORED_TAGS:
+            self._flush()
+            self.tokens.append(f"<{tag}>")
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if tag not in IGNORED_TAGS:
+            self._flush()
+            self.tokens.append(f"</{tag}>")
+
+    def handle_data(self, data):
+        self._text.append(data)
+
+    def close(self):
+        super().close()
+        self._flush()
+
+
+def structure(fragment: str) -> list:
+    """Suite de balises et de textes d'un fragment HTML."""
+    parser = StructureParser()
+    parser.feed(fragment)
+    parser.close()
+    return parser.tokens
+
+
+def normalize(fragment: str) -> str:
+    """HTML aux espaces près."""
+    return re.sub(r"\s+", " ", re.sub(r">\s+<", "><", fragment)).strip()
+
+
+def conformance(pages: list, backend: str, reference: list) -> dict:
+    """
+    Compare le rendu d'un moteur à celui de la référence, page par page.
+
+    Returns:
+        Nombre de pages identiques et équivalentes, et le premier écart trouvé
+    """
+    identical = equivalent = 0
+    first_diff = None
+    for index, (page, expected) in enumerate(zip(pages, reference)):
+        rendered = render_markdown(page, backend)
+        if normalize(rendered) == normalize(expected):
+            identical += 1
+        expected_tokens, tokens = structure(expected), structure(rendered)
+        if tokens == expected_tokens:
+            equivalent += 1
+        elif first_diff is None:
+            diff = difflib.unified_diff(expected_tokens, tokens, REFERENCE_BACKEND, backend, lineterm="", n=1)
+            first_diff = (index, list(diff)[2:14])
+    return {"identical": identical, "equivalent": equivalent, "first_diff": first_diff}
+
+
+def throughput(pages: list, backend: str, repeat: int) -> float:
+    """Meilleur temps (en secondes) de rendu de toutes les pages sur repeat passes."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for page in pages:
+            render_markdown(page, backend)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Comparer les moteurs Markdown → HTML sur des pages OCR")
+    parser.add_argument("--pages", type=int, default=300, help="Pages du corpus synthétique (par défaut: 300)")
+    parser.add_argument("--repeat", type=int, default=5, help="Passes de mesure du débit (par défaut: 5)")
+    parser.add_argument("--results", nargs="+", default=[],
+                        help="Résultats OCR JSON dont les pages forment le corpus (par défaut: corpus synthétique)")
+    parser.add_argument("--show-diff", action="store_true", help="Afficher le premier écart de chaque moteur")
+    args = parser.parse_args()
+
+    backends = available_backends()
+    missing = [backend for backend in MARKDOWN_BACKENDS if backend not in backends]
+    if missing:
+        print(f"Moteurs non installés (ignorés): {', '.join(missing)}")
+    if not backends:
+        sys.exit(1)
+
+    pages = load_pages(args.results, args.pages)
+    size_mb = sum(len(page.encode("utf-8")) for page in pages) / (1024 * 1024)
+    print(f"{len(pages)} pages, {size_mb:.2f} Mo de Markdown\n")
+
+    reference = None
+    if REFERENCE_BACKEND in backends:
+        reference = [render_markdown(page, REFERENCE_BACKEND) for page in pages]
+
+    print(f"{'moteur':<12} {'pages/s':>9} {'Mo/s':>7} {'identiques':>11} {'équivalentes':>13}")
+    diffs = {}
+    for backend in backends:
+        elapsed = throughput(pages, backend, args.repeat)
+        identical = equivalent = "-"
+        if reference is not None:
+            report = conformance(pages, backend, reference)
+            identical = f"{report['identical'] / len(pages):.0%}"
+            equivalent = f"{report['equivalent'] / len(pages):.0%}"
+            if report["first_diff"] is not None:
+                diffs[backend] = report["first_diff"]
+        print(f"{backend:<12} {len(pages) / elapsed:>9.0f} {size_mb / elapsed:>7.2f} {identical:>11} {equivalent:>13}")
+
+    if args.show_diff:
+        for backend, (index, lines) in diffs.items():
+            print(f"\nPremier écart de {backend} (page {index}):")
+            print("\n".join(lines))
+
+
+if __name__ == "__main__":
+    main()
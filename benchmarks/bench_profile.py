@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Étapes profilées simultanément dans plusieurs threads (ocr_profile).
+Comme le traitement web (plusieurs tâches profilées, chacune avec son profileur) et --batch ou
+--watch --profile (un profileur partagé par les workers), plusieurs threads mesurent des étapes
+imbriquées en même temps. Depuis Python 3.12, cProfile n'accepte qu'un profileur actif par
+processus: aucune étape ne doit pourtant échouer, et chaque appel doit être compté.
+
+Usage:
+    python benchmarks/bench_profile.py [--threads 4] [--calls 20]
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ocr_profile import StageProfiler  # noqa: E402
+
+
+def work(profiler: StageProfiler, calls: int, barrier: threading.Barrier, errors: list):
+    """Enchaîne des étapes imbriquées (ocr puis model_dump), démarrées en même temps dans chaque thread."""
+    try:
+        barrier.wait()
+        for _ in range(calls):
+            with profiler.stage("ocr"):
+                sum(i * i for i in range(20000))
+                time.sleep(0.001)
+                with profiler.stage("model_dump"):
+                    [str(i) for i in range(5000)]
+    except Exception as e:
+        errors.append(f"{type(e).__name__}: {e}")
+
+
+def run(profilers: list, threads: int, calls: int) -> list:
+    """Lance les threads, chacun avec le profileur profilers[i % len(profilers)]; retourne les erreurs."""
+    errors = []
+    barrier = threading.Barrier(threads)
+    workers = [threading.Thread(target=work, args=(profilers[i % len(profilers)], calls, barrier, errors))
+               for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    for profiler in profilers:
+        profiler.stop()
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vérifier le profilage d'étapes simultanées")
+    parser.add_argument("--threads", type=int, default=4, help="Threads simultanés (par défaut: 4)")
+    parser.add_argument("--calls", type=int, default=20, help="Étapes par thread (par défaut: 20)")
+    args = parser.parse_args()
+
+    failed = False
+    for label, count in (("profileur partagé", 1), ("un profileur par thread", args.threads)):
+        profilers = [StageProfiler() for _ in range(count)]
+        errors = run(profilers, args.threads, args.calls)
+        summaries = [profiler.summary() for profiler in profilers]
+        calls = sum(summary["ocr"]["calls"] for summary in summaries if "ocr" in summary)
+        profiled = sum(summary["ocr"]["profiled_calls"] for summary in summaries if "ocr" in summary)
+
+        problems = []
+        if errors:
+            problems.append(f"{len(errors)} thread(s) en erreur ({errors[0]})")
+        if calls != args.threads * args.calls:
+            problems.append(f"{calls} appels comptés au lieu de {args.threads * args.calls}")
+        if profiled == 0:
+            problems.append("aucun appel profilé par cProfile")
+        status = "ÉCHEC" if problems else "OK"
+        print(f"{label}: {status} - {calls} appels, dont {profiled} profilés par cProfile")
+        for problem in problems:
+            print(f"    {problem}")
+        failed = failed or bool(problems)
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
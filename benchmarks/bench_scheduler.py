@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Comparaison des ordonnancements de la file des traitements web (FIFO et SJF avec vieillissement).
+Une charge mixte est simulée: beaucoup d'images d'une page et quelques gros PDF, arrivant
+de façon aléatoire. Chaque travail dure un temps proportionnel à son coût estimé. Le script
+affiche les latences p50/p95 (de la soumission à la fin du traitement) pour chaque politique.
+
+Usage:
+    python benchmarks/bench_scheduler.py [--jobs 400] [--workers 4] [--load 0.9] [--scale 0.002]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ocr_scheduler import JobScheduler, estimate_job_cost
+
+
+def make_workload(jobs: int, seed: int) -> list:
+    """
+    Génère une charge mixte reproductible.
+
+    Args:
+        jobs: Nombre de travaux
+        seed: Graine du générateur aléatoire
+
+    Returns:
+        Liste de (coût estimé, type) dans l'ordre d'arrivée
+    """
+    rng = random.Random(seed)
+    workload = []
+    for _ in range(jobs):
+        kind = rng.random()
+        if kind < 0.80:
+            workload.append((estimate_job_cost(output_formats=["json", "md", "html"], page_count=1), "image"))
+        elif kind < 0.95:
+            pages = rng.randint(5, 20)
+            workload.append((estimate_job_cost(output_formats=["json", "md", "html"], page_count=pages), "pdf"))
+        else:
+            pages = rng.randint(100, 300)
+            workload.append((estimate_job_cost(output_formats=["json", "md", "html", "pdf"], page_count=pages),
+                             "gros pdf"))
+    return workload
+
+
+def percentile(values: list, q: float) -> float:
+    """Percentile q (entre 0 et 1) d'une liste de valeurs."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def run(policy: str, workload: list, workers: int, load: float, scale: float, seed: int) -> dict:
+    """
+    Exécute la charge avec une politique d'ordonnancement.
+
+    Args:
+        policy: "fifo" ou "sjf"
+        workload: Travaux générés par make_workload
+        workers: Nombre de travaux simultanés
+        load: Taux d'occupation visé des workers (arrivées aléatoires)
+        scale: Durée réelle (s) d'une unité de coût
+        seed: Graine des instants d'arrivée
+
+    Returns:
+        Latences p50/p95 globales et par type de travail, en secondes
+    """
+    # Le coût est exprimé en secondes estimées: le vieillissement suit la même échelle de temps
+    scheduler = JobScheduler(workers=workers, policy=policy, aging_rate=0.5 / scale)
+    rng = random.Random(seed)
+    mean_cost = statistics.mean(cost for cost, _ in workload)
+    # Intervalle moyen entre deux arrivées pour occuper les workers au taux visé
+    mean_gap = mean_cost * scale / (workers * load)
+
+    latencies = []
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def job(cost, kind, submitted):
+        time.sleep(cost * scale)
+        with lock:
+            latencies.append((kind, time.perf_counter() - submitted))
+            if len(latencies) == len(workload):
+                done.set()
+
+    for cost, kind in workload:
+        scheduler.submit(job, cost, kind, time.perf_counter(), cost=cost)
+        time.sleep(rng.expovariate(1 / mean_gap))
+    done.wait()
+
+    stats = {"all": [latency for _, latency in latencies]}
+    for kind, latency in latencies:
+        stats.setdefault(kind, []).append(latency)
+    return {
+        kind: (percentile(values, 0.50), percentile(values, 0.95), len(values))
+        for kind, values in stats.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Comparer les ordonnancements FIFO et SJF de la file web")
+    parser.add_argument("--jobs", type=int, default=400, help="Nombre de travaux simulés (par défaut: 400)")
+    parser.add_argument("--workers", type=int, default=4, help="Traitements simultanés (par défaut: 4)")
+    parser.add_argument("--load", type=float, default=0.9, help="Occupation visée des workers (par défaut: 0.9)")
+    parser.add_argument("--scale", type=float, default=0.002,
+                        help="Durée réelle en secondes d'une unité de coût (par défaut: 0.002)")
+    parser.add_argument("--seed", type=int, default=1, help="Graine aléatoire (par défaut: 1)")
+    args = parser.parse_args()
+
+    workload = make_workload(args.jobs, args.seed)
+    results = {}
+    for policy in ("fifo", "sjf"):
+        results[policy] = run(policy, workload, args.workers, args.load, args.scale, args.seed)
+
+    print(f"{args.jobs} travaux, {args.workers} workers, occupation {args.load:.0%}")
+    print(f"{'type':<10} {'n':>5} {'fifo p50':>10} {'fifo p95':>10} {'sjf p50':>10} {'sjf p95':>10}")
+    for kind in ("all", "image", "pdf", "gros pdf"):
+        if kind not in results["fifo"]:
+            continue
+        fifo_p50, fifo_p95, count = results["fifo"][kind]
+        sjf_p50, sjf_p95, _ = results["sjf"][kind]
+        print(f"{kind:<10} {count:>5} {fifo_p50:>9.3f}s {fifo_p95:>9.3f}s {sjf_p50:>9.3f}s {sjf_p95:>9.3f}s")
+
+    fifo_p50, fifo_p95, _ = results["fifo"]["all"]
+    sjf_p50, sjf_p95, _ = results["sjf"]["all"]
+    print(f"\nSJF + vieillissement: p50 x{fifo_p50 / max(sjf_p50, 1e-9):.1f}, "
+          f"p95 x{fifo_p95 / max(sjf_p95, 1e-9):.1f} par rapport à FIFO")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Mesure du temps de démarrage de mistral_ocr et de l'application web.
+Chaque import est mesuré dans un interpréteur neuf. Le seuil porte sur le temps propre du module:
+sa médiane moins celle de son framework (Flask pour l'application web), mesurée dans la même
+exécution, pour ne pas dépendre de la machine ni de la version de Flask. Le script échoue (code 1)
+si ce temps dépasse le seuil, si l'import affiche quelque chose, ou si une dépendance lourde
+est chargée dès l'import.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 10] [--max-ms 150]
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules qui ne doivent être importés qu'au moment où ils servent
+HEAVY_MODULES = ["mistralai", "markdown2", "markdown_it", "mistune", "dotenv", "weasyprint", "requests", "pyarrow", "watchdog", "PIL"]
+
+# Code exécuté dans l'interpréteur neuf: importe le module et rapporte durée et modules chargés
+PROBE = """
+import sys, time, json, io, contextlib
+sys.path[:0] = {paths!r}
+buffer = io.StringIO()
+start = time.perf_counter()
+with contextlib.redirect_stdout(buffer):
+    import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    "ms": elapsed * 1000,
+    "output": buffer.getvalue(),
+    "heavy": [m for m in {heavy!r} if m in sys.modules],
+}}))
+"""
+
+
+def measure(module: str, paths: list, runs: int) -> dict:
+    """
+    Importe un module dans des interpréteurs neufs et agrège les mesures.
+
+    Args:
+        module: Nom du module à importer
+        paths: Chemins ajoutés à sys.path
+        runs: Nombre de mesures
+
+    Returns:
+        Médiane et maximum en ms, sortie affichée et dépendances lourdes chargées
+    """
+    code = PROBE.format(paths=paths, module=module, heavy=HEAVY_MODULES)
+    samples = []
+    last = None
+    for _ in range(runs):
+        completed = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=ROOT)
+        if completed.returncode != 0:
+            return {"error": completed.stderr.strip().splitlines()[-1] if completed.stderr else "échec"}
+        last = json.loads(completed.stdout.strip().splitlines()[-1])
+        samples.append(last["ms"])
+    return {
+        "median_ms": round(statistics.median(samples), 1),
+        "max_ms": round(max(samples), 1),
+        "output": last["output"],
+        "heavy": last["heavy"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mesurer le temps d'import de mistral_ocr et de l'application web")
+    parser.add_argument("--runs", type=int, default=10, help="Nombre de mesures par module (par défaut: 10)")
+    parser.add_argument("--max-ms", type=float, default=150.0,
+                        help="Temps d'import médian maximal accepté en ms, au-delà de celui du framework "
+                             "(par défaut: 150)")
+    args = parser.parse_args()
+
+    # Module mesuré, chemins ajoutés à sys.path, framework dont le temps d'import est déduit et
+    # dépendances attendues à l'import (l'application web lit sa configuration dans le fichier .env)
+    targets = [
+        ("mistral_ocr", [ROOT], None, ()),
+        ("app", [os.path.join(ROOT, "mistral_ocr_web"), ROOT], "flask", ("dotenv",)),
+    ]
+
+    failed = False
+    for module, paths, baseline_module, expected in targets:
+        result = measure(module, paths, args.runs)
+        if "error" in result:
+            # L'application web nécessite Flask: on ne peut pas la mesurer sans lui
+            print(f"{module}: non mesuré ({result['error']})")
+            continue
+        baseline_ms = 0.0
+        if baseline_module is not None:
+            baseline = measure(baseline_module, paths, args.runs)
+            baseline_ms = baseline.get("median_ms", 0.0)
+        own_ms = round(result["median_ms"] - baseline_ms, 1)
+
+        problems = []
+        if own_ms > args.max_ms:
+            problems.append(f"temps propre {own_ms} ms > {args.max_ms} ms")
+        if result["output"]:
+            problems.append(f"affichage pendant l'import: {result['output'][:80]!r}")
+        heavy = [name for name in result["heavy"] if name not in expected]
+        if heavy:
+            problems.append(f"dépendances chargées à l'import: {', '.join(heavy)}")
+
+        status = "ÉCHEC" if problems else "OK"
+        reference = f" (dont {baseline_module} {baseline_ms} ms, propre {own_ms} ms)" if baseline_module else ""
+        print(f"{module}: {status} - médiane {result['median_ms']} ms{reference}, max {result['max_ms']} ms")
+        for problem in problems:
+            print(f"  - {problem}")
+        failed = failed or bool(problems)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Aller-retour et vitesse de lecture du stockage compact des résultats (ocr_store).
+Un résultat synthétique est écrit avec write_result_store, puis relu page par page (read_page)
+et en entier (to_result): chaque page relue doit être identique à l'originale. Le Markdown des
+pages contient des caractères que json.dumps(ensure_ascii=False) laisse tels quels et que
+str.splitlines() prend pour des fins de ligne (U+2028, U+2029, U+0085, \\x1c-\\x1e, \\v, \\f).
+Le script affiche ensuite le temps de lecture d'une page et du document complet.
+
+Usage:
+    python benchmarks/bench_store.py [--pages 500] [--block-size 32] [--format jsonl]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ocr_store import write_result_store, OCRResultStore, DEFAULT_BLOCK_SIZE  # noqa: E402
+
+# Séparateurs de lignes Unicode et caractères de contrôle conservés par json.dumps(ensure_ascii=False)
+LINE_BREAKERS = ["\u2028", "\u2029", "\u0085", "\x1c", "\x1d", "\x1e", "\x0b", "\x0c"]
+
+
+def make_result(pages: int, seed: int = 42) -> dict:
+    """
+    Génère un résultat OCR dont une page sur trois contient des séparateurs de lignes.
+
+    Args:
+        pages: Nombre de pages
+        seed: Graine du générateur (résultat reproductible)
+
+    Returns:
+        Résultat au format de la réponse de l'API
+    """
+    rng = random.Random(seed)
+    result = {"model": "mistral-ocr-latest", "usage_info": {"pages_processed": pages}, "pages": []}
+    for index in range(pages):
+        markdown = f"# Page {index}\n\nTexte de la page {index}."
+        if index % 3 == 0:
+            markdown += " avant" + rng.choice(LINE_BREAKERS) + "après"
+        page = {"index": index, "markdown": markdown, "images": [],
+                "dimensions": {"dpi": 200, "height": 2200, "width": 1700}}
+        if index % 5 == 0:
+            # Colonne absente de certaines pages
+            page["header"] = "En-tête" + rng.choice(LINE_BREAKERS)
+        result["pages"].append(page)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vérifier l'aller-retour du stockage compact des résultats OCR")
+    parser.add_argument("--pages", type=int, default=500, help="Pages du résultat synthétique (par défaut: 500)")
+    parser.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE,
+                        help=f"Pages par bloc compressé (par défaut: {DEFAULT_BLOCK_SIZE})")
+    parser.add_argument("--format", choices=["jsonl", "parquet"], default="jsonl",
+                        help="Format du stockage (par défaut: jsonl)")
+    args = parser.parse_args()
+
+    result = make_result(args.pages)
+    with tempfile.TemporaryDirectory() as tmp:
+        store_dir = write_result_store(result, os.path.join(tmp, "resultat.ocrstore"), args.format,
+                                       args.block_size)
+        store = OCRResultStore(store_dir)
+
+        start = time.perf_counter()
+        pages = [store.read_page(i) for i in range(store.page_count)]
+        per_page = (time.perf_counter() - start) / max(1, store.page_count)
+        start = time.perf_counter()
+        full = store.to_result()
+        whole = time.perf_counter() - start
+
+    errors = [i for i, page in enumerate(result["pages"]) if pages[i] != page]
+    if full != result:
+        errors.append("to_result")
+    print(f"{args.pages} pages ({args.format}, blocs de {args.block_size})")
+    print(f"read_page: {per_page * 1000:.2f} ms par page, to_result: {whole * 1000:.1f} ms")
+    if errors:
+        print(f"ÉCHEC - pages relues différentes: {errors[:10]}")
+        sys.exit(1)
+    print("OK - aller-retour identique")
+
+
+if __name__ == "__main__":
+    main()
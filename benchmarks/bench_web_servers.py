@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test de charge comparant les deux serveurs de l'application web: app.py servi par Waitress
+(threads) et asgi.py servi par Hypercorn (boucle d'événements).
+Chaque serveur est lancé dans un processus séparé avec une tâche terminée déjà enregistrée.
+Des centaines de clients se connectent en même temps: la plupart interrogent /status à
+intervalle régulier, les autres téléchargent lentement le résultat (/download), comme des
+connexions lentes qui restent ouvertes. Le script affiche, pour chaque serveur, le nombre de
+requêtes /status servies, leurs latences p50/p95, les échecs et les téléchargements terminés.
+Aucun appel à l'API Mistral n'est effectué.
+
+Usage:
+    python benchmarks/bench_web_servers.py [--connections 500] [--slow 0.2] [--duration 20]
+"""
+
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WEB_DIR = os.path.join(ROOT, "mistral_ocr_web")
+
+# Tâche terminée enregistrée dans chaque serveur avant le test
+TASK_ID = "bench-task"
+
+
+def percentile(values: list, q: float) -> float:
+    """Percentile q (entre 0 et 1) d'une liste de valeurs."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def serve(server: str, port: int, result_file: str, threads: int):
+    """
+    Démarre un serveur (dans le processus lancé par run_server) avec une tâche terminée.
+
+    Args:
+        server: "waitress" ou "hypercorn"
+        port: Port d'écoute
+        result_file: Fichier servi comme résultat HTML de la tâche
+        threads: Nombre de threads de Waitress
+    """
+    sys.path.insert(0, WEB_DIR)
+    import app as web
+    web.ensure_runtime_ready()
+    web.ocr_tasks[TASK_ID] = {'status': 'completed', 'progress': 100, 'result_paths': {'html': result_file},
+                              'error': None}
+
+    if server == "waitress":
+        from waitress import serve as waitress_serve
+        waitress_serve(web.app, host="127.0.0.1", port=port, threads=threads, _quiet=True)
+    else:
+        import asgi
+        from hypercorn.asyncio import serve as hypercorn_serve
+        from hypercorn.config import Config
+        config = Config()
+        config.bind = [f"127.0.0.1:{port}"]
+        config.accesslog = None
+        asyncio.run(hypercorn_serve(asgi.app, config))
+
+
+def run_server(server: str, port: int, result_file: str, threads: int) -> subprocess.Popen:
+    """Lance un serveur dans un processus séparé et attend qu'il accepte les connexions."""
+    process = subprocess.Popen([
+        sys.executable, os.path.abspath(__file__), "--serve", server, "--port", str(port),
+        "--result-file", result_file, "--threads", str(threads)
+    ], stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Le serveur {server} s'est arrêté au démarrage (dépendance manquante ?)")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"Le serveur {server} ne répond pas")
+
+
+async def http_get(port: int, path: str, read_delay: float = 0.0) -> int:
+    """
+    Requête GET minimale (une connexion par requête), lue jusqu'à la fin.
+
+    Args:
+        port: Port du serveur
+        path: Chemin demandé
+        read_delay: Pause entre deux lectures de 64 Ko (client lent)
+
+    Returns:
+        Code HTTP de la réponse
+    """
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n".encode("ascii"))
+        await writer.drain()
+        status = int((await reader.readline()).split()[1])
+        while await reader.read(65536):
+            if read_delay:
+                await asyncio.sleep(read_delay)
+        return status
+    finally:
+        writer.close()
+
+
+async def load(port: int, connections: int, slow: float, duration: float, poll_interval: float,
+               read_delay: float, timeout: float) -> dict:
+    """
+    Exécute la charge contre un serveur.
+
+    Returns:
+        Latences des requêtes /status, nombre d'échecs et de téléchargements terminés
+    """
+    deadline = time.monotonic() + duration
+    latencies = []
+    counts = {"errors": 0, "downloads": 0}
+
+    async def poller():
+        while time.monotonic() < deadline:
+            start = time.monotonic()
+            try:
+                status = await asyncio.wait_for(http_get(port, f"/status/{TASK_ID}"), timeout)
+                if status == 200:
+                    latencies.append(time.monotonic() - start)
+                else:
+                    counts["errors"] += 1
+            except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+                counts["errors"] += 1
+            await asyncio.sleep(poll_interval)
+
+    async def downloader():
+        while time.monotonic() < deadline:
+            try:
+                if await http_get(port, f"/download/{TASK_ID}/html", read_delay) == 200:
+                    counts["downloads"] += 1
+                else:
+                    counts["errors"] += 1
+            except (OSError, ValueError, IndexError):
+                counts["errors"] += 1
+
+    slow_count = int(connections * slow)
+    clients = [downloader() for _ in range(slow_count)] + [poller() for _ in range(connections - slow_count)]
+    await asyncio.gather(*clients)
+    return {"latencies": latencies, **counts}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Comparer Waitress (app.py) et Hypercorn (asgi.py) sous charge")
+    parser.add_argument("--connections", type=int, default=500, help="Clients simultanés (par défaut: 500)")
+    parser.add_argument("--slow", type=float, default=0.2,
+                        help="Part des clients qui téléchargent lentement le résultat (par défaut: 0.2)")
+    parser.add_argument("--duration", type=float, default=20, help="Durée du test en secondes (par défaut: 20)")
+    parser.add_argument("--poll-interval", type=float, default=1.0,
+                        help="Intervalle entre deux requêtes /status d'un client (par défaut: 1 s)")
+    parser.add_argument("--download-mb", type=float, default=2,
+                        help="Taille du résultat téléchargé en Mo (par défaut: 2)")
+    parser.add_argument("--read-delay", type=float, default=0.05,
+                        help="Pause des clients lents entre deux lectures de 64 Ko (par défaut: 0.05 s)")
+    parser.add_argument("--timeout", type=float, default=10, help="Délai maximal d'une requête /status (par défaut: 10 s)")
+    parser.add_argument("--threads", type=int, default=4, help="Threads de Waitress (par défaut: 4, comme app.py)")
+    parser.add_argument("--port", type=int, default=5091, help="Port utilisé pour les tests (par défaut: 5091)")
+    parser.add_argument("--serve", choices=["waitress", "hypercorn"], help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port, args.result_file, args.threads)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        result_file = os.path.join(tmp_dir, "result.html")
+        with open(result_file, "wb") as f:
+            f.write(b"<p>" + b"x" * int(args.download_mb * 1024 * 1024) + b"</p>")
+
+        results = {}
+        for server in ("waitress", "hypercorn"):
+            process = run_server(server, args.port, result_file, args.threads)
+            try:
+                results[server] = asyncio.run(load(
+                    args.port, args.connections, args.slow, args.duration, args.poll_interval,
+                    args.read_delay, args.timeout
+                ))
+            finally:
+                process.terminate()
+                process.wait()
+
+    print(f"{args.connections} clients ({args.slow:.0%} de téléchargements lents), {args.duration:.0f} s")
+    print(f"{'serveur':<10} {'/status':>8} {'req/s':>7} {'p50':>8} {'p95':>8} {'échecs':>7} {'téléch.':>8}")
+    for server, result in results.items():
+        latencies = result["latencies"]
+        p50 = f"{percentile(latencies, 0.50) * 1000:.0f}ms" if latencies else "-"
+        p95 = f"{percentile(latencies, 0.95) * 1000:.0f}ms" if latencies else "-"
+        print(f"{server:<10} {len(latencies):>8} {len(latencies) / args.duration:>7.0f} {p50:>8} {p95:>8} "
+              f"{result['errors']:>7} {result['downloads']:>8}")
+
+
+if __name__ == "__main__":
+    main()
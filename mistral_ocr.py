@@ -8,74 +8,363 @@ Ce script permet de traiter des fichiers PDF, des images et des URL de documents
 
 import os
 import sys
+import re
+import time
+import uuid
+import copy
 import argparse
+import contextlib
 import json
 import base64
+import concurrent.futures
 from pathlib import Path
-from typing import Optional, Dict, Any, List, Union
-from dotenv import load_dotenv
-
-# Charger les variables d'environnement depuis le fichier .env
-load_dotenv()
-
-# Import de la librairie Mistral officielle
-try:
-    from mistralai import Mistral
-except ImportError:
-    print("La librairie mistralai n'est pas installée.")
-    print("Installez-la avec: pip install mistralai")
-    sys.exit(1)
-
-# Imports pour la conversion Markdown vers HTML
-try:
-    import markdown2
-    import re
-    import shutil
-    import uuid
-    import time
-except ImportError:
-    print("Des dépendances nécessaires sont manquantes.")
-    print("Installez toutes les dépendances avec: pip install -r requirements.txt")
-    sys.exit(1)
-
-# Importer WeasyPrint pour la conversion HTML vers PDF (DÉSACTIVÉ PAR DÉFAUT)
-# Cette fonctionnalité est optionnelle et nécessite des dépendances système supplémentaires
+from typing import Optional, Dict, Any, List, Union, Iterator
+
+# Les dépendances lourdes (mistralai, moteurs Markdown, dotenv, WeasyPrint) sont importées
+# au premier usage: importer ce module ne fait ni I/O ni affichage.
+
+# Index plein texte des résultats OCR
+from ocr_search import OCRSearchIndex, ChunkIndex, DEFAULT_INDEX_PATH, default_index_path
+# Stockage compact (JSONL compressé ou Parquet) des résultats
+from ocr_store import write_result_store, PageResultStore, URLResultStore, fetch_url
+# Journal de reprise des traitements par lot
+from ocr_journal import (
+    OCRJournal, LeaseLostError, file_hash,
+    STATE_PENDING, STATE_UPLOADED, STATE_OCR_DONE, STATE_WRITTEN, STATE_FAILED
+)
+# Surveillance d'un dossier de dépôt
+from ocr_watch import FolderWatcher
+# Contrôle adaptatif du nombre d'appels simultanés à l'API
+from ocr_concurrency import AdaptiveLimiter, HedgedCaller
+# Rendu PDF (WeasyPrint) dans des processus isolés
+from ocr_pdf import render_pdf
+# Profilage par étape (cProfile et tracemalloc)
+from ocr_profile import StageProfiler, format_profile
+# Traces des traitements (spans exportés hors ligne)
+from ocr_trace import span, traced, configure_tracing
+# Conversion Markdown → HTML (moteur au choix)
+from ocr_markdown import render_markdown, MARKDOWN_BACKENDS, DEFAULT_MARKDOWN_BACKEND
+# Optimisation des fichiers avant envoi
+from ocr_preprocess import (
+    PayloadOptimizer, PageFilter, format_report, subset_pdf, expand_pages, blank_page,
+    pdf_page_hashes, read_source, Source, PDFIUM_AVAILABLE
+)
+
+# Génération PDF via WeasyPrint (DÉSACTIVÉE PAR DÉFAUT)
+# Cette fonctionnalité est optionnelle et nécessite des dépendances système supplémentaires.
+# Pour l'activer, installez WeasyPrint puis changez PDF_AVAILABLE à True.
 PDF_AVAILABLE = False
-try:
-    # Pour activer WeasyPrint, décommentez la ligne ci-dessous
-    # from weasyprint import HTML
-    # Et changez PDF_AVAILABLE à True
-    # PDF_AVAILABLE = True
-    
-    if not PDF_AVAILABLE:
-        print("\n=== INFO: Génération PDF désactivée ===")
-        print("Pour activer la génération PDF sur macOS:")
-        print("1. Installez les dépendances système: brew install cairo pango gdk-pixbuf libffi")
-        print("2. Installez WeasyPrint: pip install weasyprint==52.5")
-        print("3. Modifiez ce fichier pour décommenter 'from weasyprint import HTML'")
-        print("4. Changez PDF_AVAILABLE à True")
-        print("================================\n")
-except Exception as e:
-    PDF_AVAILABLE = False
-    print(f"\n=== ERREUR: Impossible d'importer WeasyPrint ===")
-    print(f"Erreur: {str(e)}")
-    print("La génération de PDF ne sera pas disponible.")
-    print("Pour l'installer sur macOS:")
+
+
+def load_environment():
+    """Charge les variables d'environnement depuis le fichier .env (si python-dotenv est installé)."""
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        return
+    load_dotenv()
+
+
+def print_pdf_notice():
+    """Affiche les instructions d'activation de la génération PDF."""
+    print("\n=== INFO: Génération PDF désactivée ===")
+    print("Pour activer la génération PDF sur macOS:")
     print("1. Installez les dépendances système: brew install cairo pango gdk-pixbuf libffi")
     print("2. Installez WeasyPrint: pip install weasyprint==52.5")
+    print("3. Changez PDF_AVAILABLE à True dans mistral_ocr.py")
     print("================================\n")
 
 
+def _import_mistral():
+    """Importe le client Mistral officiel au premier usage."""
+    try:
+        from mistralai import Mistral
+    except ImportError:
+        raise ImportError("La librairie mistralai n'est pas installée. Installez-la avec: pip install mistralai")
+    return Mistral
+
+
+# Extensions des documents acceptés pour les traitements par lot
+SUPPORTED_EXTENSIONS = (".pdf", ".jpg", ".jpeg", ".png", ".gif", ".webp", ".tif", ".tiff", ".heic", ".heif")
+
+# Formats d'image que l'API n'accepte pas directement et qui sont toujours convertis avant envoi
+CONVERTED_IMAGE_EXTENSIONS = (".tif", ".tiff", ".heic", ".heif")
+
+# Nombre d'images regroupées par défaut dans une seule requête OCR multipage
+DEFAULT_PACK_SIZE = 20
+
+# Dossier créé à côté de chaque fichier surveillé par --watch pour ses sorties
+WATCH_OUTPUT_DIR_NAME = "_ocr"
+
+
+# Feuille de style des rendus HTML (intégrée au fichier unique, partagée par la visionneuse paginée)
+HTML_STYLE = """body {
+    font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
+    line-height: 1.6;
+    color: #333;
+    max-width: 1200px;
+    margin: 0 auto;
+    padding: 20px;
+    background-color: #f9f9f9;
+}
+.page {
+    background-color: white;
+    border-radius: 8px;
+    box-shadow: 0 2px 10px rgba(0, 0, 0, 0.1);
+    padding: 40px;
+    margin-bottom: 30px;
+    position: relative;
+}
+.page-number {
+    position: absolute;
+    top: 10px;
+    right: 10px;
+    background-color: #007bff;
+    color: white;
+    padding: 5px 10px;
+    border-radius: 15px;
+    font-size: 14px;
+}
+h1, h2, h3, h4, h5, h6 {
+    color: #2c3e50;
+    margin-top: 1.5em;
+    margin-bottom: 0.5em;
+}
+h1 { font-size: 2.2em; }
+h2 { font-size: 1.8em; }
+h3 { font-size: 1.5em; }
+h4 { font-size: 1.3em; }
+h5 { font-size: 1.1em; }
+h6 { font-size: 1em; }
+img {
+    max-width: 100%;
+    height: auto;
+    border-radius: 4px;
+    margin: 15px 0;
+}
+pre {
+    background-color: #f8f8f8;
+    border-left: 4px solid #007bff;
+    padding: 15px;
+    border-radius: 4px;
+    overflow-x: auto;
+}
+code {
+    font-family: 'Courier New', Courier, monospace;
+    background-color: #f0f0f0;
+    padding: 2px 4px;
+    border-radius: 3px;
+}
+blockquote {
+    border-left: 4px solid #ccc;
+    padding-left: 15px;
+    color: #666;
+    margin: 15px 0;
+}
+table {
+    border-collapse: collapse;
+    width: 100%;
+    margin: 15px 0;
+    overflow-x: auto;
+    display: block;
+}
+th, td {
+    border: 1px solid #ddd;
+    padding: 8px 12px;
+    text-align: left;
+}
+th {
+    background-color: #f2f2f2;
+    font-weight: bold;
+}
+tr:nth-child(even) {
+    background-color: #f9f9f9;
+}
+.header {
+    text-align: center;
+    margin-bottom: 30px;
+}
+.footer {
+    text-align: center;
+    margin-top: 30px;
+    color: #666;
+    font-size: 0.9em;
+}
+.math {
+    font-family: 'Cambria Math', 'STIX', serif;
+    font-style: italic;
+}
+@media print {
+    body {
+        background-color: white;
+    }
+    .page {
+        box-shadow: none;
+        margin-bottom: 0;
+        page-break-after: always;
+    }
+}
+.lazy-page {
+    min-height: 1100px;
+}
+.lazy-page[data-state="loaded"] {
+    min-height: 0;
+}
+"""
+
+# Chargement des pages de la visionneuse paginée au défilement: les pages proches de la zone
+# visible sont récupérées puis composées par MathJax, les pages très éloignées sont déchargées
+PAGED_VIEWER_SCRIPT = """(function () {
+    var pages = document.querySelectorAll('.lazy-page');
+
+    function load(page) {
+        if (page.dataset.state) return;
+        page.dataset.state = 'loading';
+        fetch(page.dataset.src)
+            .then(function (response) { return response.text(); })
+            .then(function (html) {
+                page.querySelector('.page-content').innerHTML = html;
+                page.style.minHeight = '';
+                page.dataset.state = 'loaded';
+                if (window.MathJax && MathJax.Hub) MathJax.Hub.Queue(['Typeset', MathJax.Hub, page]);
+            })
+            .catch(function () { delete page.dataset.state; });
+    }
+
+    function unload(page) {
+        if (page.dataset.state !== 'loaded') return;
+        // Garder la hauteur de la page pour ne pas décaler le défilement
+        page.style.minHeight = page.offsetHeight + 'px';
+        page.querySelector('.page-content').innerHTML = '';
+        delete page.dataset.state;
+    }
+
+    if (!('IntersectionObserver' in window)) {
+        pages.forEach(load);
+        return;
+    }
+    var near = new IntersectionObserver(function (entries) {
+        entries.forEach(function (entry) { if (entry.isIntersecting) load(entry.target); });
+    }, {rootMargin: '150% 0px'});
+    var far = new IntersectionObserver(function (entries) {
+        entries.forEach(function (entry) { if (!entry.isIntersecting) unload(entry.target); });
+    }, {rootMargin: '1000% 0px'});
+    pages.forEach(function (page) {
+        near.observe(page);
+        far.observe(page);
+    });
+})();
+"""
+
+
+def _indent(text: str, spaces: int) -> str:
+    """Indente chaque ligne non vide d'un texte."""
+    return "".join(" " * spaces + line if line.strip() else line for line in text.splitlines(True))
+
+
+def _source_name(source: Source, file_name: Optional[str] = None) -> str:
+    """Nom d'un document: nom fourni, sinon nom du chemin ou de l'objet fichier."""
+    if file_name:
+        return Path(file_name).name
+    if isinstance(source, (str, os.PathLike)):
+        return Path(source).name
+    name = getattr(source, "name", None)
+    return Path(name).name if isinstance(name, str) else "document"
+
+
+def _load_source(source: Source) -> Union[str, os.PathLike, bytes]:
+    """Garde un chemin ou des octets tels quels; lit une seule fois un objet fichier ou une memoryview."""
+    if isinstance(source, (str, os.PathLike, bytes)):
+        return source
+    return read_source(source)
+
+
+def renumber_page_images(pages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Renumérote les images (img-0.jpeg, img-1.jpeg...) dans l'ordre des pages, comme un traitement
+    complet du document, et met à jour leurs références dans le Markdown. Sert à réassembler des
+    pages issues d'appels OCR distincts, dont les numéros se chevauchent.
+    
+    Args:
+        pages: Pages du document, dans l'ordre (non modifiées)
+        
+    Returns:
+        Pages avec les identifiants d'images renumérotés
+    """
+    renumbered = []
+    counter = 0
+    for page in pages:
+        images = page.get("images") or []
+        if not images:
+            renumbered.append(page)
+            continue
+        mapping = {}
+        new_images = []
+        for img in images:
+            img = dict(img)
+            old_id = img.get("id")
+            new_id = f"img-{counter}{os.path.splitext(old_id)[1] if old_id else ''}"
+            counter += 1
+            if old_id:
+                mapping[old_id] = new_id
+                img["id"] = new_id
+            new_images.append(img)
+        page = dict(page, images=new_images)
+        if mapping and page.get("markdown"):
+            # Une seule substitution: un identifiant renuméroté n'est pas renuméroté une seconde fois
+            pattern = re.compile(r"(?<=[\[(])(" + "|".join(map(re.escape, mapping)) + r")(?=[\])])")
+            page["markdown"] = pattern.sub(lambda match: mapping[match.group(1)], page["markdown"])
+        renumbered.append(page)
+    return renumbered
+
+
 class MistralOCR:
     """Classe pour effectuer l'OCR avec l'API Mistral."""
 
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, optimizer: Optional[PayloadOptimizer] = None,
+                 page_filter: Optional[PageFilter] = None, page_store: Optional[PageResultStore] = None,
+                 limiter: Optional[AdaptiveLimiter] = None, hedger: Optional[HedgedCaller] = None,
+                 validate_key: bool = True, markdown_backend: str = DEFAULT_MARKDOWN_BACKEND,
+                 profiler: Optional[StageProfiler] = None, url_store: Optional[URLResultStore] = None):
         """
         Initialise le client Mistral API.
         
         Args:
             api_key: Clé API Mistral
+            optimizer: Optimisation locale des images et PDF avant envoi (désactivée si None)
+            page_filter: Détection des pages blanches et en double, non envoyées à l'OCR (désactivée si None)
+            page_store: Cache des résultats par page: seules les pages nouvelles ou modifiées
+                        des PDF sont envoyées à l'OCR (désactivé si None)
+            limiter: Limite adaptative des appels simultanés à ocr.process et files.upload,
+                     partageable entre instances (désactivée si None)
+            hedger: Relance en double des appels OCR anormalement lents (désactivée si None)
+            validate_key: Tester la clé dès l'initialisation (un appel à l'API); sinon une clé
+                          invalide n'apparaît qu'à la première requête
+            markdown_backend: Moteur de conversion Markdown → HTML des sorties html, html-pages
+                              et pdf (voir ocr_markdown.MARKDOWN_BACKENDS)
+            profiler: Mesure du temps et de la mémoire de chaque étape du traitement (désactivée si None)
+            url_store: Cache des documents distants: une URL est téléchargée localement (GET conditionnel)
+                       et un document inchangé n'est pas soumis à nouveau à l'OCR (désactivé si None)
         """
+        if markdown_backend not in MARKDOWN_BACKENDS:
+            raise ValueError(f"Moteur Markdown inconnu: {markdown_backend} "
+                             f"(disponibles: {', '.join(MARKDOWN_BACKENDS)})")
+        self.markdown_backend = markdown_backend
+        self.profiler = profiler
+        self.optimizer = optimizer
+        self.page_filter = page_filter
+        self.page_store = page_store
+        self.url_store = url_store
+        self.limiter = limiter
+        self.hedger = hedger
+        # Analyse des pages des PDF envoyés, par identifiant de fichier, en attendant leur OCR
+        self._page_analyses: Dict[str, Dict[str, Any]] = {}
+        Mistral = _import_mistral()
+        self.model = "mistral-ocr-latest"
+        if not validate_key:
+            self.client = Mistral(api_key=api_key)
+            self.is_valid = True
+            return
         try:
             self.client = Mistral(api_key=api_key)
             # Tester immédiatement si la clé fonctionne
@@ -91,9 +380,59 @@ class MistralOCR:
             self.is_valid = False
             # On crée quand même le client pour permettre d'autres opérations
             self.client = Mistral(api_key=api_key)
+
+    def profile_stage(self, name: str):
+        """
+        Mesure une étape du traitement si le profilage est activé.
+        
+        Args:
+            name: Nom de l'étape (upload, ocr, model_dump, enhance, markdown, images, write)
             
-        self.model = "mistral-ocr-latest"
+        Returns:
+            Gestionnaire de contexte couvrant l'étape
+        """
+        if self.profiler is None:
+            return contextlib.nullcontext()
+        return self.profiler.stage(name)
+
+    def _model_dump(self, response) -> Dict[str, Any]:
+        """Convertit une réponse de l'API en dictionnaire."""
+        with self.profile_stage("model_dump"):
+            return response.model_dump()
+
+    def _api_call(self, func, *args, **kwargs):
+        """
+        Appelle l'API Mistral, à travers la limite adaptative des appels simultanés si elle est activée.
+        
+        Args:
+            func: Méthode du client à appeler
+            *args, **kwargs: Arguments de l'appel
+            
+        Returns:
+            Réponse de l'API
+        """
+        if self.limiter is None:
+            return func(*args, **kwargs)
+        with self.limiter.slot():
+            return func(*args, **kwargs)
 
+    def _ocr_process(self, **kwargs):
+        """
+        Appelle ocr.process, en relançant un doublon si la réponse tarde (si la relance est activée).
+        
+        Args:
+            **kwargs: Arguments de ocr.process
+            
+        Returns:
+            Réponse de l'API
+        """
+        with self.profile_stage("ocr"), span("ocr.process", model=self.model, hedged=self.hedger is not None):
+            if self.hedger is None:
+                return self._api_call(self.client.ocr.process, **kwargs)
+            # Le doublon n'attend pas de place dans la limite adaptative: il est abandonné si elle est atteinte
+            return self.hedger.call_limited(self.limiter, self.client.ocr.process, **kwargs)
+
+    @traced("mistral_ocr.process_document_url")
     def process_document_url(self, url: str, include_images: bool = True) -> Dict[str, Any]:
         """
         Traite un document à partir d'une URL.
@@ -110,19 +449,9 @@ class MistralOCR:
             if not getattr(self, 'is_valid', True):
                 return {"error": "Clé API Mistral invalide ou non autorisée. Veuillez vérifier votre clé API ou en créer une nouvelle sur https://console.mistral.ai/api-keys/"}
             
-            # Utilisation de l'API OCR Mistral officielle
-            response = self.client.ocr.process(
-                model=self.model,
-                document={
-                    "type": "document_url",
-                    "document_url": url
-                },
-                include_image_base64=include_images
-            )
-            
-            # Conversion de la réponse en dictionnaire
-            response_dict = response.model_dump()
-            return response_dict
+            if self.url_store is not None:
+                return self._process_url_cached(url, include_images)
+            return self._ocr_document_url(url, include_images)
         except Exception as e:
             error_msg = str(e)
             if "401" in error_msg or "Unauthorized" in error_msg:
@@ -132,37 +461,233 @@ class MistralOCR:
                 print(f"Erreur lors du traitement de l'URL: {error_msg}")
                 return {"error": str(e)}
 
-    def process_pdf_file(self, file_path: str, include_images: bool = True) -> Dict[str, Any]:
+    def _ocr_document_url(self, url: str, include_images: bool) -> Dict[str, Any]:
         """
-        Traite un fichier PDF local.
+        Soumet une URL à l'OCR: le document est téléchargé par l'API Mistral.
         
         Args:
-            file_path: Chemin vers le fichier PDF
+            url: URL du document
             include_images: Inclure les images en base64 dans la réponse
             
         Returns:
             Résultat de l'OCR
         """
+        # Utilisation de l'API OCR Mistral officielle
+        response = self._ocr_process(
+            model=self.model,
+            document={
+                "type": "document_url",
+                "document_url": url
+            },
+            include_image_base64=include_images
+        )
+        
+        # Conversion de la réponse en dictionnaire
+        return self._model_dump(response)
+
+    @traced("mistral_ocr.process_url_cached")
+    def _process_url_cached(self, url: str, include_images: bool) -> Dict[str, Any]:
+        """
+        Traite une URL avec le cache des documents distants: le document est revalidé par un GET
+        conditionnel (ETag, Last-Modified), puis comparé par empreinte à la version en cache.
+        Seul un document nouveau ou modifié est soumis à l'OCR, à partir du contenu téléchargé.
+        
+        Args:
+            url: URL du document
+            include_images: Inclure les images en base64 dans la réponse
+            
+        Returns:
+            Résultat de l'OCR, avec le champ url_cache (status: not_modified, unchanged ou processed)
+        """
+        version = self.url_store.get_version(url, self.model, include_images) or {}
         try:
-            # Vérifier si le client est valide
-            if not getattr(self, 'is_valid', True):
-                return {"error": "Clé API Mistral invalide ou non autorisée. Veuillez vérifier votre clé API ou en créer une nouvelle sur https://console.mistral.ai/api-keys/"}
+            with span("url_cache.fetch", conditional=bool(version)) as fetch:
+                fetched = fetch_url(url, version.get("etag"), version.get("last_modified"),
+                                    allow_private=self.url_store.allow_private_hosts)
+                fetch.set_attribute("modified", fetched["modified"])
+            if not fetched["modified"]:
+                result = self.url_store.get_result(version["content_hash"], self.model, include_images)
+                if result is not None:
+                    self.url_store.touch(url, self.model, include_images)
+                    print("Cache des URL: document inchangé (304), résultat repris du cache")
+                    result["url_cache"] = {"status": "not_modified", "content_hash": version["content_hash"]}
+                    return result
+                # Résultat retiré du cache entre-temps: téléchargement complet
+                fetched = fetch_url(url, allow_private=self.url_store.allow_private_hosts)
+        except Exception as e:
+            # Document inaccessible d'ici (hôte non public refusé, ou trop volumineux): l'API le télécharge elle-même
+            print(f"Cache des URL: téléchargement impossible ({str(e)}), URL transmise à l'OCR")
+            return self._ocr_document_url(url, include_images)
+        
+        content_hash = URLResultStore.content_hash(fetched["content"])
+        result = self.url_store.get_result(content_hash, self.model, include_images)
+        if result is not None:
+            status = "unchanged"
+            print("Cache des URL: contenu identique à une version déjà traitée, résultat repris du cache")
+        else:
+            status = "processed"
+            result = self._process_fetched_document(url, fetched, include_images)
+            if "error" in result:
+                return result
+        with span("url_cache.store", status=status):
+            self.url_store.put(url, self.model, include_images, content_hash, fetched["etag"],
+                               fetched["last_modified"], result if status == "processed" else None)
+        result["url_cache"] = {"status": status, "content_hash": content_hash}
+        return result
+
+    def _process_fetched_document(self, url: str, fetched: Dict[str, Any], include_images: bool) -> Dict[str, Any]:
+        """
+        Soumet à l'OCR un document distant déjà téléchargé (PDF ou image), sans second téléchargement.
+        Les autres formats sont transmis par leur URL.
+        
+        Args:
+            url: URL du document
+            fetched: Réponse de fetch_url (contenu et type)
+            include_images: Inclure les images en base64 dans la réponse
             
-            # Upload the PDF file
-            with open(file_path, "rb") as f:
-                uploaded_file = self.client.files.upload(
+        Returns:
+            Résultat de l'OCR
+        """
+        import mimetypes  # importé au premier usage, comme les autres dépendances coûteuses
+        from urllib.parse import urlparse
+        
+        content = fetched["content"]
+        file_name = os.path.basename(urlparse(url).path) or "document"
+        if content.startswith(b"%PDF-"):
+            if not file_name.lower().endswith(".pdf"):
+                file_name += ".pdf"
+            return self.process_pdf_file(content, include_images, file_name=file_name)
+        if fetched["content_type"].startswith("image/"):
+            if not Path(file_name).suffix:
+                file_name += mimetypes.guess_extension(fetched["content_type"]) or ""
+            return self.process_image_file(content, include_images, file_name=file_name)
+        return self._ocr_document_url(url, include_images)
+
+    @traced("mistral_ocr.upload_pdf_file")
+    def upload_pdf_file(self, file_path: Source, file_name: Optional[str] = None) -> str:
+        """
+        Envoie un fichier PDF sur l'espace de fichiers Mistral.
+        
+        Args:
+            file_path: Chemin vers le fichier PDF, ou son contenu (octets, memoryview, objet fichier)
+            file_name: Nom du fichier envoyé (par défaut: celui du chemin)
+            
+        Returns:
+            Identifiant du fichier envoyé (lève une exception en cas d'erreur)
+        """
+        file_name = _source_name(file_path, file_name)
+        file_path = _load_source(file_path)
+        content, analysis = self._prepare_pdf_upload(file_path)
+        
+        if content is not None:
+            with self.profile_stage("upload"), span("files.upload", file_name=file_name, bytes=len(content)):
+                uploaded_file = self._api_call(
+                    self.client.files.upload,
                     file={
-                        "file_name": Path(file_path).name,
-                        "content": f
+                        "file_name": file_name,
+                        "content": content
                     },
                     purpose="ocr"
                 )
+            self._remember_analysis(uploaded_file.id, analysis)
+            return uploaded_file.id
+        
+        with open(file_path, "rb") as f, self.profile_stage("upload"), span("files.upload", file_name=file_name):
+            uploaded_file = self._api_call(
+                self.client.files.upload,
+                file={
+                    "file_name": file_name,
+                    "content": f
+                },
+                purpose="ocr"
+            )
+        self._remember_analysis(uploaded_file.id, None)
+        return uploaded_file.id
+
+    def _remember_analysis(self, file_id: str, analysis: Optional[Dict[str, Any]]):
+        """
+        Conserve l'analyse des pages d'un fichier envoyé jusqu'à son traitement.
+        None (aucune page ignorée) est aussi conservé: seule une reprise dans un autre processus
+        analyse de nouveau le PDF d'origine.
+        """
+        if self.page_filter is not None:
+            self._page_analyses[file_id] = analysis
+
+    def _prepare_pdf_upload(self, file_path: Union[str, os.PathLike, bytes]):
+        """
+        Prépare le contenu d'un PDF à envoyer: pages distinctes et non blanches, puis optimisation.
+        
+        Args:
+            file_path: Chemin vers le fichier PDF, ou son contenu
+            
+        Returns:
+            (contenu à envoyer, ou None pour envoyer le fichier tel quel; analyse des pages ou None)
+        """
+        content = None if isinstance(file_path, (str, os.PathLike)) else file_path
+        
+        # Ne garder que les pages distinctes et non blanches
+        analysis = self._analyze_pdf_pages(file_path)
+        if analysis is not None:
+            content = subset_pdf(file_path, analysis["kept"])
+        
+        if self.optimizer is not None:
+            content, report = self.optimizer.optimize_pdf(content if content is not None else file_path)
+            print(format_report(report))
+        return content, analysis
+
+    def _analyze_pdf_pages(self, file_path: Source) -> Optional[Dict[str, Any]]:
+        """
+        Repère les pages blanches et en double d'un PDF.
+        
+        Args:
+            file_path: Chemin vers le fichier PDF, ou son contenu
+            
+        Returns:
+            Analyse des pages, ou None si aucune page ne peut être ignorée (ou si le filtre est désactivé)
+        """
+        if self.page_filter is None:
+            return None
+        if not PDFIUM_AVAILABLE:
+            print("La détection des pages blanches et en double des PDF nécessite pypdfium2: pip install pypdfium2")
+            return None
+        
+        analysis = self.page_filter.analyze_pdf(file_path)
+        if not analysis["kept"]:
+            # Document entièrement blanc: envoyer quand même la première page
+            analysis["kept"] = [0]
+            analysis["blank"] = [i for i in analysis["blank"] if i != 0]
+        if len(analysis["kept"]) == analysis["page_count"]:
+            return None
+        
+        print(f"Pages ignorées: {len(analysis['blank'])} blanche(s), {len(analysis['duplicate_of'])} en double "
+              f"sur {analysis['page_count']}")
+        return analysis
+
+    @traced("mistral_ocr.process_uploaded_file")
+    def process_uploaded_file(self, file_id: str, include_images: bool = True,
+                              source_path: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Traite un fichier déjà envoyé avec upload_pdf_file.
+        
+        Args:
+            file_id: Identifiant du fichier envoyé
+            include_images: Inclure les images en base64 dans la réponse
+            source_path: Chemin du PDF d'origine, pour retrouver les pages ignorées après une reprise
+            
+        Returns:
+            Résultat de l'OCR
+        """
+        try:
+            # Vérifier si le client est valide
+            if not getattr(self, 'is_valid', True):
+                return {"error": "Clé API Mistral invalide ou non autorisée. Veuillez vérifier votre clé API ou en créer une nouvelle sur https://console.mistral.ai/api-keys/"}
             
             # Get a signed URL
-            signed_url = self.client.files.get_signed_url(file_id=uploaded_file.id)
+            with self.profile_stage("upload"), span("files.get_signed_url"):
+                signed_url = self.client.files.get_signed_url(file_id=file_id)
             
             # Process the document using the signed URL
-            response = self.client.ocr.process(
+            response = self._ocr_process(
                 model=self.model,
                 document={
                     "type": "document_url",
@@ -172,7 +697,16 @@ class MistralOCR:
             )
             
             # Conversion de la réponse en dictionnaire
-            response_dict = response.model_dump()
+            response_dict = self._model_dump(response)
+            
+            # Replacer les pages blanches et en double ignorées à l'envoi
+            if file_id in self._page_analyses:
+                analysis = self._page_analyses.pop(file_id)
+            else:
+                # Reprise d'un fichier envoyé par un autre processus
+                analysis = self._analyze_pdf_pages(source_path) if source_path else None
+            if analysis is not None:
+                response_dict = expand_pages(response_dict, analysis)
             return response_dict
         except Exception as e:
             error_msg = str(e)
@@ -183,13 +717,16 @@ class MistralOCR:
                 print(f"Erreur lors du traitement du PDF: {error_msg}")
                 return {"error": str(e)}
 
-    def process_image_file(self, file_path: str, include_images: bool = False) -> Dict[str, Any]:
+    @traced("mistral_ocr.process_pdf_file")
+    def process_pdf_file(self, file_path: Source, include_images: bool = True,
+                         file_name: Optional[str] = None) -> Dict[str, Any]:
         """
-        Traite un fichier image local.
+        Traite un fichier PDF, local ou déjà en mémoire.
         
         Args:
-            file_path: Chemin vers le fichier image
+            file_path: Chemin vers le fichier PDF, ou son contenu (octets, memoryview, objet fichier)
             include_images: Inclure les images en base64 dans la réponse
+            file_name: Nom du fichier envoyé (par défaut: celui du chemin)
             
         Returns:
             Résultat de l'OCR
@@ -199,44 +736,451 @@ class MistralOCR:
             if not getattr(self, 'is_valid', True):
                 return {"error": "Clé API Mistral invalide ou non autorisée. Veuillez vérifier votre clé API ou en créer une nouvelle sur https://console.mistral.ai/api-keys/"}
             
+            # Le contenu n'est lu qu'une fois, même s'il sert à plusieurs étapes
+            file_name = _source_name(file_path, file_name)
+            file_path = _load_source(file_path)
+            
+            if self.page_store is not None:
+                if PDFIUM_AVAILABLE:
+                    return self._process_pdf_incremental(file_path, include_images, file_name)
+                print("Le cache des pages nécessite pypdfium2 (pip install pypdfium2), traitement complet du PDF")
+            
+            # Upload the PDF file
+            file_id = self.upload_pdf_file(file_path, file_name)
+        except Exception as e:
+            error_msg = str(e)
+            if "401" in error_msg or "Unauthorized" in error_msg:
+                print(f"Erreur d'authentification lors du traitement du PDF: {error_msg}")
+                return {"error": "Clé API Mistral invalide ou non autorisée. Veuillez vérifier votre clé API ou en créer une nouvelle."}
+            else:
+                print(f"Erreur lors du traitement du PDF: {error_msg}")
+                return {"error": str(e)}
+        
+        source_path = file_path if isinstance(file_path, (str, os.PathLike)) else None
+        return self.process_uploaded_file(file_id, include_images, source_path=source_path)
+
+    @traced("mistral_ocr.process_pdf_incremental")
+    def _process_pdf_incremental(self, file_path: Union[str, bytes], include_images: bool,
+                                 file_name: str) -> Dict[str, Any]:
+        """
+        Traite un PDF en ne soumettant à l'OCR que les pages absentes du cache des pages.
+        Les pages identiques (dans le document ou d'une révision à l'autre) ne sont traitées qu'une fois.
+        
+        Args:
+            file_path: Chemin vers le fichier PDF, ou son contenu
+            include_images: Inclure les images en base64 dans la réponse
+            file_name: Nom du fichier envoyé
+            
+        Returns:
+            Résultat de l'OCR, avec les pages dans l'ordre du document
+        """
+        with span("pdf.page_hashes"):
+            hashes = pdf_page_hashes(file_path)
+        with span("page_cache.lookup", pages=len(hashes)) as lookup:
+            pages = self.page_store.get_many(hashes, self.model, include_images)
+            lookup.set_attribute("hits", len(pages))
+        
+        # Pages blanches et quasi identiques: analysées sur tout le document, comme sans cache, pour que
+        # le résultat ne dépende pas des pages déjà en cache
+        blank, duplicate_of = set(), {}
+        if self.page_filter is not None:
+            with span("pdf.page_filter", pages=len(hashes)):
+                analysis = self.page_filter.analyze_pdf(file_path)
+            blank, duplicate_of = set(analysis["blank"]), analysis["duplicate_of"]
+            if blank or duplicate_of:
+                print(f"Pages ignorées: {len(blank)} blanche(s), {len(duplicate_of)} en double "
+                      f"sur {len(hashes)}")
+        
+        # Première occurrence de chaque page inconnue
+        missing = []
+        queued = set()
+        for i, page_hash in enumerate(hashes):
+            if i in blank or i in duplicate_of:
+                continue
+            if page_hash not in pages and page_hash not in queued:
+                queued.add(page_hash)
+                missing.append(i)
+        print(f"Cache des pages: {len(missing)} page(s) à traiter sur {len(hashes)}")
+        
+        result = {"model": self.model}
+        if missing:
+            content = subset_pdf(file_path, missing) if len(missing) < len(hashes) else None
+            if self.optimizer is not None:
+                content, report = self.optimizer.optimize_pdf(content if content is not None else file_path)
+                print(format_report(report))
+            if content is None:
+                content = read_source(file_path)
+            with self.profile_stage("upload"), span("files.upload", file_name=file_name, bytes=len(content)):
+                uploaded_file = self._api_call(
+                    self.client.files.upload,
+                    file={
+                        "file_name": file_name,
+                        "content": content
+                    },
+                    purpose="ocr"
+                )
+            
+            result = self.process_uploaded_file(uploaded_file.id, include_images)
+            if "error" in result:
+                return result
+            if len(result.get("pages", [])) != len(missing):
+                return {"error": f"L'OCR a retourné {len(result.get('pages', []))} page(s) au lieu de {len(missing)}"}
+            
+            fresh = {hashes[i]: page for i, page in zip(missing, result["pages"])}
+            with span("page_cache.store", pages=len(fresh)):
+                self.page_store.put_many(fresh, self.model, include_images)
+            pages.update(fresh)
+        
+        # Les pages blanches et en double ne sont pas mises en cache: elles dépendent des réglages du filtre
+        document_pages = []
+        for i, page_hash in enumerate(hashes):
+            if i in blank:
+                document_pages.append(blank_page(i))
+                continue
+            original = duplicate_of.get(i)
+            page = pages[page_hash if original is None else hashes[original]]
+            page = {"index": i, **{key: value for key, value in page.items() if key != "index"}}
+            if original is not None:
+                page = copy.deepcopy(page)
+                page["duplicate_of"] = original
+            document_pages.append(page)
+        result["pages"] = renumber_page_images(document_pages)
+        skipped = len(blank) + len(duplicate_of)
+        # Mêmes champs de document qu'un traitement complet; usage_info ne compte que les pages envoyées
+        result.setdefault("usage_info", {"pages_processed": 0, "doc_size_bytes": None})
+        result.setdefault("document_annotation", None)
+        result["page_cache"] = {
+            "page_count": len(hashes),
+            "processed": len(missing),
+            "reused": len(hashes) - len(missing) - skipped,
+            "skipped": skipped,
+        }
+        return result
+
+    @traced("mistral_ocr.process_image_file")
+    def process_image_file(self, file_path: Source, include_images: bool = False,
+                           file_name: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Traite un fichier image, local ou déjà en mémoire.
+        
+        Args:
+            file_path: Chemin vers le fichier image, ou son contenu (octets, memoryview, objet fichier)
+            include_images: Inclure les images en base64 dans la réponse
+            file_name: Nom du fichier, pour en déduire le format (par défaut: celui du chemin)
+            
+        Returns:
+            Résultat de l'OCR
+        """
+        try:
+            # Vérifier si le client est valide
+            if not getattr(self, 'is_valid', True):
+                return {"error": "Clé API Mistral invalide ou non autorisée. Veuillez vérifier votre clé API ou en créer une nouvelle sur https://console.mistral.ai/api-keys/"}
+            
+            file_name = _source_name(file_path, file_name)
+            file_path = _load_source(file_path)
+            
+            # Une image blanche n'est pas envoyée
+            if self.page_filter is not None:
+                frame = (self.optimizer or PayloadOptimizer()).prepare_image(file_path)
+                if self.page_filter.analyze_images([frame])["blank"]:
+                    print(f"Image blanche ignorée: {file_name}")
+                    return {"model": self.model, "pages": [blank_page(0)]}
+            
+            document = self._image_document(file_path, file_name)
+            
+            # Traitement de l'image avec l'API officielle
+            response = self._ocr_process(
+                model=self.model,
+                document=document,
+                include_image_base64=include_images
+            )
+            
+            # Conversion de la réponse en dictionnaire
+            response_dict = self._model_dump(response)
+            return response_dict
+        except Exception as e:
+            error_msg = str(e)
+            if "401" in error_msg or "Unauthorized" in error_msg:
+                print(f"Erreur d'authentification lors du traitement de l'image: {error_msg}")
+                return {"error": "Clé API Mistral invalide ou non autorisée. Veuillez vérifier votre clé API ou en créer une nouvelle."}
+            else:
+                print(f"Erreur lors du traitement de l'image: {error_msg}")
+                return {"error": str(e)}
+
+    def _image_document(self, file_path: Union[str, os.PathLike, bytes], file_name: str) -> Dict[str, Any]:
+        """
+        Prépare le document envoyé à l'OCR pour une image (URL data en base64).
+        
+        Args:
+            file_path: Chemin vers le fichier image, ou son contenu
+            file_name: Nom du fichier, pour en déduire le format
+            
+        Returns:
+            Document au format attendu par ocr.process
+        """
+        extension = Path(file_name).suffix.lower()
+        if self.optimizer is not None or extension in CONVERTED_IMAGE_EXTENSIONS:
+            # Optimisation (ou simple conversion) locale avant l'envoi
+            optimizer = self.optimizer or PayloadOptimizer()
+            content, mime_type, report = optimizer.optimize_image(file_path)
+            print(format_report(report))
+            base64_image = base64.b64encode(content).decode('utf-8')
+        else:
             # Lecture et encodage de l'image en base64
-            with open(file_path, "rb") as image_file:
-                base64_image = base64.b64encode(image_file.read()).decode('utf-8')
+            base64_image = base64.b64encode(read_source(file_path)).decode('utf-8')
             
             # Détermination du type MIME en fonction de l'extension
-            extension = Path(file_path).suffix.lower()
             mime_type = "image/jpeg"  # Par défaut
             if extension == ".png":
                 mime_type = "image/png"
             elif extension == ".gif":
                 mime_type = "image/gif"
+            elif extension == ".webp":
+                mime_type = "image/webp"
             elif extension in [".jpg", ".jpeg"]:
                 mime_type = "image/jpeg"
+        
+        # Création de l'URL data
+        data_url = f"data:{mime_type};base64,{base64_image}"
+        
+        # Un TIFF multipage est converti en PDF et envoyé comme document
+        if mime_type == "application/pdf":
+            return {"type": "document_url", "document_url": data_url}
+        return {"type": "image_url", "image_url": data_url}
+
+    @traced("mistral_ocr.process_document_url")
+    async def process_document_url_async(self, url: str, include_images: bool = True) -> Dict[str, Any]:
+        """
+        Version asynchrone de process_document_url (méthodes *_async du client Mistral).
+        La limite adaptative et la relance des appels lents, propres aux threads, ne s'appliquent pas.
+        Avec le cache des documents distants, le traitement synchrone est exécuté dans un thread.
+        
+        Args:
+            url: URL du document
+            include_images: Inclure les images en base64 dans la réponse
             
-            # Création de l'URL data
-            data_url = f"data:{mime_type};base64,{base64_image}"
+        Returns:
+            Résultat de l'OCR
+        """
+        if self.url_store is not None:
+            import asyncio  # importé au premier usage, comme les autres dépendances coûteuses
+            return await asyncio.to_thread(self.process_document_url, url, include_images)
+        try:
+            response = await self.client.ocr.process_async(
+                model=self.model,
+                document={
+                    "type": "document_url",
+                    "document_url": url
+                },
+                include_image_base64=include_images
+            )
+            return self._model_dump(response)
+        except Exception as e:
+            return self._error_result(e, "l'URL")
+
+    @traced("mistral_ocr.process_pdf_file")
+    async def process_pdf_file_async(self, file_path: Source, include_images: bool = True,
+                                     file_name: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Version asynchrone de process_pdf_file: les appels à l'API n'occupent pas de thread,
+        la préparation locale du PDF (pages ignorées, optimisation) s'exécute dans un thread.
+        Avec le cache des pages, le traitement synchrone est exécuté dans un thread.
+        
+        Args:
+            file_path: Chemin vers le fichier PDF, ou son contenu (octets, memoryview, objet fichier)
+            include_images: Inclure les images en base64 dans la réponse
+            file_name: Nom du fichier envoyé (par défaut: celui du chemin)
+            
+        Returns:
+            Résultat de l'OCR
+        """
+        import asyncio  # importé au premier usage, comme les autres dépendances coûteuses
+        if self.page_store is not None:
+            return await asyncio.to_thread(self.process_pdf_file, file_path, include_images, file_name)
+        try:
+            file_name = _source_name(file_path, file_name)
+            file_path = _load_source(file_path)
+            content, analysis = await asyncio.to_thread(self._prepare_pdf_upload, file_path)
+            if content is None:
+                content = await asyncio.to_thread(read_source, file_path)
+            
+            uploaded_file = await self.client.files.upload_async(
+                file={
+                    "file_name": file_name,
+                    "content": content
+                },
+                purpose="ocr"
+            )
+            signed_url = await self.client.files.get_signed_url_async(file_id=uploaded_file.id)
+            response = await self.client.ocr.process_async(
+                model=self.model,
+                document={
+                    "type": "document_url",
+                    "document_url": signed_url.url
+                },
+                include_image_base64=include_images
+            )
+            
+            # Replacer les pages blanches et en double ignorées à l'envoi
+            response_dict = self._model_dump(response)
+            if analysis is not None:
+                response_dict = expand_pages(response_dict, analysis)
+            return response_dict
+        except Exception as e:
+            return self._error_result(e, "du PDF")
+
+    @traced("mistral_ocr.process_image_file")
+    async def process_image_file_async(self, file_path: Source, include_images: bool = False,
+                                       file_name: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Version asynchrone de process_image_file (l'encodage de l'image s'exécute dans un thread).
+        
+        Args:
+            file_path: Chemin vers le fichier image, ou son contenu (octets, memoryview, objet fichier)
+            include_images: Inclure les images en base64 dans la réponse
+            file_name: Nom du fichier, pour en déduire le format (par défaut: celui du chemin)
+            
+        Returns:
+            Résultat de l'OCR
+        """
+        import asyncio  # importé au premier usage, comme les autres dépendances coûteuses
+        try:
+            file_name = _source_name(file_path, file_name)
+            file_path = _load_source(file_path)
+            
+            # Une image blanche n'est pas envoyée
+            if self.page_filter is not None:
+                frame = await asyncio.to_thread((self.optimizer or PayloadOptimizer()).prepare_image, file_path)
+                if self.page_filter.analyze_images([frame])["blank"]:
+                    print(f"Image blanche ignorée: {file_name}")
+                    return {"model": self.model, "pages": [blank_page(0)]}
+            
+            document = await asyncio.to_thread(self._image_document, file_path, file_name)
+            response = await self.client.ocr.process_async(
+                model=self.model,
+                document=document,
+                include_image_base64=include_images
+            )
+            return self._model_dump(response)
+        except Exception as e:
+            return self._error_result(e, "de l'image")
+
+    def _error_result(self, error: Exception, subject: str) -> Dict[str, Any]:
+        """Résultat d'erreur d'un traitement, avec un message explicite pour une clé refusée."""
+        error_msg = str(error)
+        if "401" in error_msg or "Unauthorized" in error_msg:
+            print(f"Erreur d'authentification lors du traitement {subject}: {error_msg}")
+            return {"error": "Clé API Mistral invalide ou non autorisée. Veuillez vérifier votre clé API ou en créer une nouvelle."}
+        print(f"Erreur lors du traitement {subject}: {error_msg}")
+        return {"error": error_msg}
+
+    def process_image_batch(self, file_paths: List[str], include_images: bool = False,
+                            batch_size: int = DEFAULT_PACK_SIZE) -> List[Dict[str, Any]]:
+        """
+        Traite de nombreuses images en les regroupant dans des documents multipages:
+        une seule requête OCR par groupe au lieu d'une par image.
+        
+        Args:
+            file_paths: Chemins des images
+            include_images: Inclure les images en base64 dans la réponse
+            batch_size: Nombre d'images par requête
             
-            # Traitement de l'image avec l'API officielle
-            response = self.client.ocr.process(
-                model=self.model,
-                document={
-                    "type": "image_url",
-                    "image_url": data_url
-                },
-                include_image_base64=include_images
-            )
+        Returns:
+            Un résultat OCR par image, dans l'ordre (avec une clé "error" pour les images en échec)
+        """
+        results = []
+        for start in range(0, len(file_paths), max(1, batch_size)):
+            results += self._process_image_pack(file_paths[start:start + batch_size], include_images)
+        return results
+
+    @traced("mistral_ocr.process_image_pack")
+    def _process_image_pack(self, file_paths: List[str], include_images: bool) -> List[Dict[str, Any]]:
+        """
+        Envoie un groupe d'images dans un seul PDF et redécoupe les pages du résultat par image.
+        Une image illisible n'affecte que son propre résultat; si la requête groupée échoue,
+        les images du groupe sont traitées une par une.
+        
+        Args:
+            file_paths: Chemins des images du groupe
+            include_images: Inclure les images en base64 dans la réponse
             
-            # Conversion de la réponse en dictionnaire
-            response_dict = response.model_dump()
-            return response_dict
-        except Exception as e:
-            error_msg = str(e)
-            if "401" in error_msg or "Unauthorized" in error_msg:
-                print(f"Erreur d'authentification lors du traitement de l'image: {error_msg}")
-                return {"error": "Clé API Mistral invalide ou non autorisée. Veuillez vérifier votre clé API ou en créer une nouvelle."}
-            else:
-                print(f"Erreur lors du traitement de l'image: {error_msg}")
-                return {"error": str(e)}
+        Returns:
+            Un résultat OCR par image, dans l'ordre
+        """
+        # Vérifier si le client est valide
+        if not getattr(self, 'is_valid', True):
+            return [{"error": "Clé API Mistral invalide ou non autorisée. Veuillez vérifier votre clé API ou en créer une nouvelle sur https://console.mistral.ai/api-keys/"}
+                    for _ in file_paths]
+        
+        optimizer = self.optimizer or PayloadOptimizer()
+        results: List[Optional[Dict[str, Any]]] = [None] * len(file_paths)
+        
+        # Préparer chaque image séparément pour isoler les fichiers corrompus
+        frames, positions = [], []
+        for i, file_path in enumerate(file_paths):
+            try:
+                frames.append(optimizer.prepare_image(file_path))
+                positions.append(i)
+            except Exception as e:
+                print(f"Image ignorée ({file_path}): {str(e)}")
+                results[i] = {"error": f"Image illisible: {str(e)}"}
+        
+        # Les images blanches ou en double au sein du groupe ne sont pas envoyées
+        duplicate_of = {}
+        if self.page_filter is not None and frames:
+            analysis = self.page_filter.analyze_images(frames)
+            for k in analysis["blank"]:
+                results[positions[k]] = {"model": self.model, "pages": [blank_page(0)]}
+            duplicate_of = {positions[k]: positions[j] for k, j in analysis["duplicate_of"].items()}
+            frames = [frames[k] for k in analysis["kept"]]
+            positions = [positions[k] for k in analysis["kept"]]
+        
+        if len(positions) == 1:
+            results[positions[0]] = self.process_image_file(file_paths[positions[0]], include_images)
+        elif positions:
+            try:
+                pdf_content = optimizer.pack_images(frames)
+                if len(pdf_content) > optimizer.max_bytes:
+                    # Groupe trop volumineux pour l'API: le couper en deux (les doublons sont repris ci-dessous)
+                    middle = len(positions) // 2
+                    for group in (positions[:middle], positions[middle:]):
+                        for i, result in zip(group, self._process_image_pack([file_paths[j] for j in group], include_images)):
+                            results[i] = result
+                else:
+                    data_url = "data:application/pdf;base64," + base64.b64encode(pdf_content).decode('utf-8')
+                    response = self._ocr_process(
+                        model=self.model,
+                        document={
+                            "type": "document_url",
+                            "document_url": data_url
+                        },
+                        include_image_base64=include_images
+                    )
+                    response_dict = self._model_dump(response)
+                    
+                    pages = response_dict.get("pages", [])
+                    if len(pages) != len(positions):
+                        raise ValueError(f"{len(pages)} page(s) reçue(s) pour {len(positions)} image(s)")
+                    
+                    # Chaque page du document groupé redevient le résultat d'une image, avec les mêmes
+                    # identifiants d'images (img-0.jpeg...) qu'un traitement de l'image seule
+                    document_fields = {key: value for key, value in response_dict.items() if key != "pages"}
+                    for position, (i, page) in enumerate(zip(positions, pages)):
+                        page = dict(page)
+                        page["index"] = 0
+                        results[i] = dict(document_fields, pages=renumber_page_images([page]),
+                                          packed={"batch_size": len(positions), "position": position})
+                    print(f"{len(positions)} image(s) traitée(s) en une seule requête")
+            except Exception as e:
+                print(f"Échec de la requête groupée ({str(e)}), traitement image par image")
+                for i in positions:
+                    results[i] = self.process_image_file(file_paths[i], include_images)
+        
+        # Les doublons reprennent le résultat de l'image d'origine
+        for i, original in duplicate_of.items():
+            results[i] = dict(results[original], duplicate_of=original)
+        
+        return results
 
     def ask_question_about_document(self, document_url: str, question: str, model: str = "mistral-small-latest") -> str:
         """
@@ -277,6 +1221,57 @@ class MistralOCR:
             print(f"Erreur lors de la question sur le document: {str(e)}")
             return f"Erreur: {str(e)}"
 
+    def ask_question_about_result(self, result: Union[Dict[str, Any], ChunkIndex], question: str,
+                                  model: str = "mistral-small-latest", top_k: int = 5) -> str:
+        """
+        Pose une question sur un document déjà traité, en n'envoyant que les extraits pertinents.
+        
+        Le résultat OCR est découpé en extraits et indexé localement; seuls les top_k extraits
+        les plus proches de la question sont transmis au modèle. Fonctionne aussi pour les fichiers locaux.
+        
+        Args:
+            result: Résultat de l'OCR, ou ChunkIndex déjà construit (à réutiliser entre plusieurs questions)
+            question: Question à poser sur le document
+            model: Modèle à utiliser pour répondre
+            top_k: Nombre d'extraits envoyés au modèle
+            
+        Returns:
+            Réponse à la question
+        """
+        try:
+            chunk_index = result if isinstance(result, ChunkIndex) else ChunkIndex(result)
+            chunks = chunk_index.top_k(question, k=top_k)
+            if not chunks:
+                return "Erreur: le document ne contient aucun texte exploitable."
+            
+            context = "\n\n".join(
+                f"[Page {chunk['page_index']}]\n{chunk['text']}" for chunk in chunks
+            )
+            print(f"Contexte envoyé: {len(chunks)} extrait(s), {len(context)} caractères")
+            
+            messages = [
+                {
+                    "role": "system",
+                    "content": "Réponds à la question en t'appuyant uniquement sur les extraits du document fournis. "
+                               "Si la réponse n'y figure pas, dis-le. Cite les pages utilisées."
+                },
+                {
+                    "role": "user",
+                    "content": f"Extraits du document:\n\n{context}\n\nQuestion: {question}"
+                }
+            ]
+            
+            chat_response = self.client.chat.complete(
+                model=model,
+                messages=messages
+            )
+            
+            return chat_response.choices[0].message.content
+        except Exception as e:
+            print(f"Erreur lors de la question sur le document: {str(e)}")
+            return f"Erreur: {str(e)}"
+
+    @traced("mistral_ocr.save_ocr_result")
     def save_ocr_result(self, result: Dict[str, Any], output_file: str):
         """
         Sauvegarde le résultat de l'OCR dans un fichier.
@@ -309,6 +1304,28 @@ class MistralOCR:
         except Exception as e:
             print(f"Erreur lors de la sauvegarde du résultat: {str(e)}")
     
+    @traced("mistral_ocr.save_compact_result")
+    def save_compact_result(self, result: Dict[str, Any], store_dir: str, format: str = "jsonl") -> Optional[str]:
+        """
+        Sauvegarde le résultat de l'OCR dans un stockage compact, page par page et colonne par colonne.
+        
+        Args:
+            result: Résultat de l'OCR
+            store_dir: Répertoire de destination (ex: resultat.ocrstore)
+            format: "jsonl" (JSONL compressé) ou "parquet" (nécessite pyarrow)
+            
+        Returns:
+            Chemin du répertoire écrit, ou None en cas d'erreur
+        """
+        try:
+            write_result_store(result, store_dir, format=format)
+            print(f"Résultat OCR compact ({format}) sauvegardé dans {store_dir}")
+            return store_dir
+        except Exception as e:
+            print(f"Erreur lors de la sauvegarde du résultat compact: {str(e)}")
+            return None
+    
+    @traced("mistral_ocr.generate_html_output")
     def generate_html_output(self, result: Dict[str, Any], output_html_file: str):
         """
         Génère un fichier HTML à partir du résultat OCR avec un meilleur rendu visuel.
@@ -331,113 +1348,7 @@ class MistralOCR:
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>Résultat OCR Mistral</title>
     <style>
-        body {
-            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-            line-height: 1.6;
-            color: #333;
-            max-width: 1200px;
-            margin: 0 auto;
-            padding: 20px;
-            background-color: #f9f9f9;
-        }
-        .page {
-            background-color: white;
-            border-radius: 8px;
-            box-shadow: 0 2px 10px rgba(0, 0, 0, 0.1);
-            padding: 40px;
-            margin-bottom: 30px;
-            position: relative;
-        }
-        .page-number {
-            position: absolute;
-            top: 10px;
-            right: 10px;
-            background-color: #007bff;
-            color: white;
-            padding: 5px 10px;
-            border-radius: 15px;
-            font-size: 14px;
-        }
-        h1, h2, h3, h4, h5, h6 {
-            color: #2c3e50;
-            margin-top: 1.5em;
-            margin-bottom: 0.5em;
-        }
-        h1 { font-size: 2.2em; }
-        h2 { font-size: 1.8em; }
-        h3 { font-size: 1.5em; }
-        h4 { font-size: 1.3em; }
-        h5 { font-size: 1.1em; }
-        h6 { font-size: 1em; }
-        img {
-            max-width: 100%;
-            height: auto;
-            border-radius: 4px;
-            margin: 15px 0;
-        }
-        pre {
-            background-color: #f8f8f8;
-            border-left: 4px solid #007bff;
-            padding: 15px;
-            border-radius: 4px;
-            overflow-x: auto;
-        }
-        code {
-            font-family: 'Courier New', Courier, monospace;
-            background-color: #f0f0f0;
-            padding: 2px 4px;
-            border-radius: 3px;
-        }
-        blockquote {
-            border-left: 4px solid #ccc;
-            padding-left: 15px;
-            color: #666;
-            margin: 15px 0;
-        }
-        table {
-            border-collapse: collapse;
-            width: 100%;
-            margin: 15px 0;
-            overflow-x: auto;
-            display: block;
-        }
-        th, td {
-            border: 1px solid #ddd;
-            padding: 8px 12px;
-            text-align: left;
-        }
-        th {
-            background-color: #f2f2f2;
-            font-weight: bold;
-        }
-        tr:nth-child(even) {
-            background-color: #f9f9f9;
-        }
-        .header {
-            text-align: center;
-            margin-bottom: 30px;
-        }
-        .footer {
-            text-align: center;
-            margin-top: 30px;
-            color: #666;
-            font-size: 0.9em;
-        }
-        .math {
-            font-family: 'Cambria Math', 'STIX', serif;
-            font-style: italic;
-        }
-        @media print {
-            body {
-                background-color: white;
-            }
-            .page {
-                box-shadow: none;
-                margin-bottom: 0;
-                page-break-after: always;
-            }
-        }
-    </style>
+""" + _indent(HTML_STYLE, 8) + """    </style>
     <script type="text/javascript" async
         src="https://cdnjs.cloudflare.com/ajax/libs/mathjax/2.7.7/MathJax.js?config=TeX-MML-AM_CHTML">
     </script>
@@ -451,48 +1362,19 @@ class MistralOCR:
             
             # Traiter chaque page
             for page in result.get("pages", []):
-                page_index = page.get("index", 0)
-                page_markdown = page.get("markdown", "")
+                with span("render.page", page=page.get("index", 0)):
+                    page_index = page.get("index", 0)
+                    page_markdown = page.get("markdown", "")
                 
-                # Améliorer le formatage des tableaux et des expressions mathématiques
-                page_markdown = self._enhance_tables_and_math(page_markdown)
+                    # Améliorer le formatage des tableaux et des expressions mathématiques
+                    page_markdown = self._enhance_tables_and_math(page_markdown)
                 
-                # Extraire et sauvegarder les images
-                for i, img in enumerate(page.get("images", [])):
-                    if "base64" in img:
-                        # Extraire l'image en base64
-                        img_data = img["base64"]
-                        img_format = "jpeg"  # Format par défaut
-                        
-                        # Déterminer le format de l'image
-                        if img_data.startswith("data:image/"):
-                            mime_type = img_data.split(";")[0].split(":")[1]
-                            img_format = mime_type.split("/")[1]
-                            img_data = img_data.split(",")[1]
-                        
-                        # Sauvegarder l'image
-                        img_filename = f"page_{page_index}_img_{i}.{img_format}"
-                        img_path = os.path.join(images_dir, img_filename)
-                        
-                        try:
-                            with open(img_path, "wb") as img_file:
-                                img_file.write(base64.b64decode(img_data))
-                            
-                            # Remplacer la référence dans le markdown
-                            img_tag = f"![img-{i}.{img_format}](img-{i}.{img_format})"
-                            relative_img_path = os.path.join(os.path.basename(images_dir), img_filename)
-                            page_markdown = page_markdown.replace(img_tag, f"![Image {i}]({relative_img_path})")
-                        except Exception as e:
-                            print(f"Erreur lors de l'extraction de l'image {i} de la page {page_index}: {str(e)}")
+                    # Extraire et sauvegarder les images
+                    page_markdown = self._save_page_images(page, page_markdown, images_dir,
+                                                           os.path.basename(images_dir))
                 
-                # Convertir le markdown en HTML
-                html_page_content = markdown2.markdown(
-                    page_markdown,
-                    extras=[
-                        "tables", "fenced-code-blocks", "footnotes",
-                        "header-ids", "strike", "task_list"
-                    ]
-                )
+                    # Convertir le markdown en HTML
+                    html_page_content = self._markdown_to_html(page_markdown)
                 
                 # Ajouter la page au document HTML
                 html_content += f"""
@@ -519,6 +1401,169 @@ class MistralOCR:
         except Exception as e:
             print(f"Erreur lors de la génération du fichier HTML: {str(e)}")
     
+    @traced("mistral_ocr.generate_paged_html_output")
+    def generate_paged_html_output(self, result: Dict[str, Any], output_dir: str,
+                                   css_href: Optional[str] = None) -> Optional[str]:
+        """
+        Génère une visionneuse HTML paginée pour les gros documents: une page d'index légère et
+        un fragment HTML par page, chargé (et composé par MathJax) au défilement.
+        
+        Args:
+            result: Résultat de l'OCR
+            output_dir: Dossier de sortie (index.html, pages/ et ocr.css)
+            css_href: URL d'une feuille de style partagée (HTML_STYLE); par défaut ocr.css est
+                      écrit dans le dossier de sortie
+            
+        Returns:
+            Chemin de la page d'index, ou None en cas d'erreur
+        """
+        try:
+            pages_dir = os.path.join(output_dir, "pages")
+            images_dir = os.path.join(pages_dir, "images")
+            os.makedirs(images_dir, exist_ok=True)
+            
+            if css_href is None:
+                css_href = "ocr.css"
+                with open(os.path.join(output_dir, css_href), "w", encoding="utf-8") as f:
+                    f.write(HTML_STYLE)
+            
+            # Un fragment par page; les liens sont relatifs à la page d'index qui les insère
+            sections = []
+            for position, page in enumerate(result.get("pages", [])):
+                with span("render.page", page=page.get("index", position)):
+                    page_index = page.get("index", position)
+                    page_markdown = self._enhance_tables_and_math(page.get("markdown", ""))
+                    page_markdown = self._save_page_images(page, page_markdown, images_dir, "pages/images")
+                    fragment_name = f"page_{position}.html"
+                    with open(os.path.join(pages_dir, fragment_name), "w", encoding="utf-8") as f:
+                        f.write(self._markdown_to_html(page_markdown))
+                sections.append(
+                    f'    <section class="page lazy-page" id="page-{page_index}" data-src="pages/{fragment_name}">\n'
+                    f'        <div class="page-number">Page {page_index}</div>\n'
+                    f'        <div class="page-content"></div>\n'
+                    f'    </section>\n'
+                )
+            
+            index_file = os.path.join(output_dir, "index.html")
+            with open(index_file, "w", encoding="utf-8") as f:
+                f.write(f"""<!DOCTYPE html>
+<html lang="fr">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Résultat OCR Mistral</title>
+    <link rel="stylesheet" href="{css_href}">
+    <script type="text/x-mathjax-config">
+        MathJax.Hub.Config({{skipStartupTypeset: true}});
+    </script>
+    <script type="text/javascript" async
+        src="https://cdnjs.cloudflare.com/ajax/libs/mathjax/2.7.7/MathJax.js?config=TeX-MML-AM_CHTML">
+    </script>
+</head>
+<body>
+    <div class="header">
+        <h1>Document OCR par Mistral AI</h1>
+        <p>Traitement effectué le {time.strftime("%d/%m/%Y à %H:%M:%S")} - {len(sections)} page(s)</p>
+    </div>
+""")
+                f.writelines(sections)
+                f.write(f"""    <div class="footer">
+        <p>Document généré par Mistral OCR</p>
+    </div>
+    <script>
+{_indent(PAGED_VIEWER_SCRIPT, 8)}    </script>
+</body>
+</html>
+""")
+            
+            print(f"Visionneuse HTML paginée sauvegardée dans {index_file}")
+            return index_file
+        except Exception as e:
+            print(f"Erreur lors de la génération de la visionneuse HTML paginée: {str(e)}")
+            return None
+    
+    def _save_page_images(self, page: Dict[str, Any], page_markdown: str, images_dir: str, link_dir: str) -> str:
+        """
+        Enregistre les images base64 d'une page et remplace leurs références dans le markdown.
+        
+        Args:
+            page: Page du résultat OCR
+            page_markdown: Markdown de la page
+            images_dir: Dossier où enregistrer les images
+            link_dir: Chemin du dossier des images dans les liens du HTML
+            
+        Returns:
+            Markdown de la page avec les liens vers les images enregistrées
+        """
+        with self.profile_stage("images"):
+            page_index = page.get("index", 0)
+            for i, img in enumerate(page.get("images", [])):
+                if "base64" in img:
+                    # Extraire l'image en base64
+                    img_data = img["base64"]
+                    img_format = "jpeg"  # Format par défaut
+                
+                    # Déterminer le format de l'image
+                    if img_data.startswith("data:image/"):
+                        mime_type = img_data.split(";")[0].split(":")[1]
+                        img_format = mime_type.split("/")[1]
+                        img_data = img_data.split(",")[1]
+                
+                    # Sauvegarder l'image
+                    img_filename = f"page_{page_index}_img_{i}.{img_format}"
+                    img_path = os.path.join(images_dir, img_filename)
+                
+                    try:
+                        with open(img_path, "wb") as img_file:
+                            img_file.write(base64.b64decode(img_data))
+                    
+                        # Remplacer la référence dans le markdown
+                        img_tag = f"![img-{i}.{img_format}](img-{i}.{img_format})"
+                        relative_img_path = os.path.join(link_dir, img_filename)
+                        page_markdown = page_markdown.replace(img_tag, f"![Image {i}]({relative_img_path})")
+                    except Exception as e:
+                        print(f"Erreur lors de l'extraction de l'image {i} de la page {page_index}: {str(e)}")
+            return page_markdown
+    
+    def iter_page_records(self, result: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """
+        Post-traite les pages une à une, pour les diffuser avant la fin du rendu du document.
+        
+        Args:
+            result: Résultat de l'OCR
+            
+        Returns:
+            Itérateur d'enregistrements par page: index, markdown amélioré, fragment HTML
+            et références des images (sans leur contenu base64)
+        """
+        for page in result.get("pages", []):
+            # Le span se termine avant la diffusion de la page
+            with span("render.page", page=page.get("index", 0)):
+                page_markdown = self._enhance_tables_and_math(page.get("markdown", ""))
+                record = {
+                    "index": page.get("index", 0),
+                    "markdown": page_markdown,
+                    "html": self._markdown_to_html(page_markdown),
+                    "images": [
+                        {key: value for key, value in image.items() if "base64" not in key}
+                        for image in page.get("images", [])
+                    ],
+                }
+            yield record
+    
+    def _markdown_to_html(self, markdown_content: str) -> str:
+        """
+        Convertit le markdown d'une page en HTML.
+        
+        Args:
+            markdown_content: Contenu Markdown (déjà amélioré)
+            
+        Returns:
+            Fragment HTML
+        """
+        with self.profile_stage("markdown"):
+            return render_markdown(markdown_content, self.markdown_backend)
+    
     def _enhance_tables_and_math(self, markdown_content: str) -> str:
         """
         Améliore le formatage des tableaux et des expressions mathématiques dans le contenu Markdown.
@@ -529,13 +1574,14 @@ class MistralOCR:
         Returns:
             Contenu Markdown amélioré
         """
-        # Amélioration des tableaux
-        markdown_content = self._enhance_tables(markdown_content)
-        
-        # Amélioration des expressions mathématiques
-        markdown_content = self._enhance_math_expressions(markdown_content)
-        
-        return markdown_content
+        with self.profile_stage("enhance"):
+            # Amélioration des tableaux
+            markdown_content = self._enhance_tables(markdown_content)
+            
+            # Amélioration des expressions mathématiques
+            markdown_content = self._enhance_math_expressions(markdown_content)
+            
+            return markdown_content
     
     def _enhance_tables(self, markdown_content: str) -> str:
         """
@@ -717,6 +1763,436 @@ class MistralOCR:
         return enhanced_content
 
 
+@traced("mistral_ocr.write_outputs")
+def write_outputs(ocr: MistralOCR, result: Dict[str, Any], base_output: str,
+                  output_format: str = "all", store: Optional[str] = None) -> List[str]:
+    """
+    Écrit le résultat de l'OCR dans les formats demandés.
+    
+    Args:
+        ocr: Instance MistralOCR utilisée pour le rendu
+        result: Résultat de l'OCR
+        base_output: Chemin de sortie sans extension
+        output_format: json, md, html, html-pages, pdf ou all
+        store: Format du stockage compact à écrire en plus (jsonl, parquet) ou None
+        
+    Returns:
+        Liste des fichiers de sortie effectivement écrits
+    """
+    with ocr.profile_stage("write"):
+        expected = []
+    
+        if output_format == "json" or output_format == "all":
+            ocr.save_ocr_result(result, base_output + ".json")
+            # save_ocr_result génère aussi le markdown et le HTML
+            expected += [base_output + ".json", base_output + ".md", base_output + ".html"]
+    
+        if store:
+            if ocr.save_compact_result(result, base_output + ".ocrstore", format=store):
+                expected.append(base_output + ".ocrstore")
+    
+        if output_format == "md" or output_format == "all":
+            # Le fichier markdown est généré dans save_ocr_result
+            if output_format != "all":
+                md_file = base_output + ".md"
+                with open(md_file, "w", encoding="utf-8") as f:
+                    for page in result.get("pages", []):
+                        f.write(f"### Page {page.get('index')}\n\n")
+                        f.write(page.get("markdown", "") + "\n\n")
+                print(f"Contenu en markdown sauvegardé dans {md_file}")
+                expected.append(md_file)
+    
+        if output_format == "html" or output_format == "all":
+            html_file = base_output + ".html"
+            if output_format != "all":
+                ocr.generate_html_output(result, html_file)
+            else:
+                # Si on génère tous les formats, on a besoin du fichier HTML pour le PDF
+                ocr.generate_html_output(result, html_file)
+            expected.append(html_file)
+    
+        if output_format == "html-pages":
+            # Visionneuse paginée: index léger et un fragment par page, chargé au défilement
+            index_file = ocr.generate_paged_html_output(result, base_output + "_pages")
+            if index_file:
+                expected.append(index_file)
+    
+        if (output_format == "pdf" or output_format == "all") and PDF_AVAILABLE:
+            pdf_file = base_output + ".pdf"
+            html_file = base_output + ".html"
+        
+            # S'assurer que le fichier HTML existe
+            if not os.path.exists(html_file) and output_format == "pdf":
+                ocr.generate_html_output(result, html_file)
+        
+            # Convertir HTML en PDF, dans un processus isolé (durée et mémoire limitées)
+            try:
+                with span("render.pdf"):
+                    render_pdf(html_file, pdf_file)
+                print(f"Document PDF sauvegardé dans {pdf_file}")
+                expected.append(pdf_file)
+            except Exception as e:
+                print(f"Erreur lors de la génération du PDF: {str(e)}")
+        elif output_format == "pdf" and not PDF_AVAILABLE:
+            print_pdf_notice()
+    
+        # Dédupliquer en conservant l'ordre, et ne garder que ce qui a réellement été écrit
+        return [path for path in dict.fromkeys(expected) if os.path.exists(path)]
+
+
+def collect_input_files(paths: List[str]) -> List[str]:
+    """
+    Liste les documents à traiter à partir de fichiers et de dossiers (parcourus récursivement).
+    
+    Args:
+        paths: Chemins de fichiers ou de dossiers
+        
+    Returns:
+        Chemins absolus des PDF et images trouvés, triés
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files += [os.path.join(root, name) for name in names if name.lower().endswith(SUPPORTED_EXTENSIONS)]
+        elif os.path.isfile(path):
+            files.append(path)
+        else:
+            print(f"Avertissement: {path} n'existe pas et sera ignoré")
+    return sorted(set(os.path.abspath(f) for f in files))
+
+
+def batch_output_base(input_path: str, inputs: List[str], output_dir: str) -> str:
+    """
+    Détermine le chemin de sortie (sans extension) d'un document traité par lot.
+    Les fichiers trouvés dans un dossier conservent leur arborescence relative.
+    
+    Args:
+        input_path: Chemin absolu du document
+        inputs: Chemins (fichiers ou dossiers) donnés en entrée du lot
+        output_dir: Dossier de sortie
+        
+    Returns:
+        Chemin de sortie sans extension
+    """
+    for root in inputs:
+        root = os.path.abspath(root)
+        if os.path.isdir(root) and input_path.startswith(root + os.sep):
+            relative = os.path.relpath(input_path, root)
+            return os.path.join(output_dir, os.path.splitext(relative)[0])
+    return os.path.join(output_dir, Path(input_path).stem)
+
+
+@traced("mistral_ocr.batch_document")
+def process_journaled_file(ocr: MistralOCR, journal: OCRJournal, input_path: str, base_output: str,
+                           include_images: bool = True, output_format: str = "all",
+                           store: Optional[str] = None, index: Optional[OCRSearchIndex] = None) -> str:
+    """
+    Traite un document en enregistrant chaque étape dans le journal, en reprenant à la dernière étape atteinte.
+    
+    Args:
+        ocr: Instance MistralOCR
+        journal: Journal de reprise
+        input_path: Chemin absolu du document
+        base_output: Chemin de sortie sans extension
+        include_images: Inclure les images en base64 dans le résultat
+        output_format: json, md, html, html-pages, pdf ou all
+        store: Format du stockage compact à écrire en plus, ou None
+        index: Index de recherche à alimenter, ou None
+        
+    Returns:
+        "skipped" (déjà terminé ou pris par un autre processus), "written" ou "failed"
+    """
+    content_hash = file_hash(input_path)
+    entry = journal.claim(input_path, content_hash)
+    if entry is None:
+        return "skipped"
+    
+    state = entry["state"]
+    is_pdf = input_path.lower().endswith(".pdf")
+    result = None
+    
+    try:
+        # Un échec précédent reprend depuis le début
+        if state in (STATE_PENDING, STATE_FAILED):
+            state = STATE_PENDING
+            # Avec le cache par page, l'envoi se fait dans process_pdf_file (seulement les pages nouvelles)
+            if is_pdf and ocr.page_store is None:
+                file_id = ocr.upload_pdf_file(input_path)
+                journal.update(input_path, content_hash, state=STATE_UPLOADED, file_id=file_id, error=None)
+                entry["file_id"] = file_id
+                state = STATE_UPLOADED
+        
+        if state in (STATE_PENDING, STATE_UPLOADED):
+            if is_pdf and ocr.page_store is not None:
+                result = ocr.process_pdf_file(input_path, include_images)
+            elif is_pdf:
+                result = ocr.process_uploaded_file(entry["file_id"], include_images, source_path=input_path)
+            else:
+                result = ocr.process_image_file(input_path, include_images)
+            if "error" in result:
+                # Le fichier envoyé sera renvoyé à la prochaine tentative
+                journal.update(input_path, content_hash, state=STATE_FAILED, file_id=None, error=result["error"])
+                return "failed"
+            result_path = journal.save_checkpoint(content_hash, result)
+            journal.update(input_path, content_hash, state=STATE_OCR_DONE, result_path=result_path)
+            state = STATE_OCR_DONE
+        
+        if state == STATE_OCR_DONE:
+            if result is None:
+                print(f"Reprise de {input_path} à partir du résultat OCR déjà obtenu")
+                result = journal.load_checkpoint(entry["result_path"])
+            _write_journaled_outputs(ocr, journal, input_path, content_hash, result, base_output,
+                                     output_format, store, index)
+        
+        return "written"
+    except LeaseLostError as e:
+        # Un autre processus a repris le document: c'est lui qui le termine
+        print(str(e))
+        return "skipped"
+    except Exception as e:
+        print(f"Erreur lors du traitement de {input_path}: {str(e)}")
+        return _mark_failed(journal, input_path, content_hash, str(e))
+
+
+def _mark_failed(journal: OCRJournal, input_path: str, content_hash: str, error: str) -> str:
+    """Marque un document en échec dans le journal, sauf s'il a été repris par un autre processus."""
+    try:
+        journal.update(input_path, content_hash, state=STATE_FAILED, error=error)
+    except LeaseLostError as e:
+        print(str(e))
+        return "skipped"
+    return "failed"
+
+
+def _write_journaled_outputs(ocr: MistralOCR, journal: OCRJournal, input_path: str, content_hash: str,
+                             result: Dict[str, Any], base_output: str, output_format: str,
+                             store: Optional[str], index: Optional[OCRSearchIndex]):
+    """Écrit les sorties d'un document, l'indexe et le marque comme terminé dans le journal."""
+    os.makedirs(os.path.dirname(os.path.abspath(base_output)), exist_ok=True)
+    outputs = write_outputs(ocr, result, base_output, output_format, store)
+    if index is not None:
+        index.index_document(input_path, result, source=input_path)
+    journal.update(input_path, content_hash, state=STATE_WRITTEN, outputs=outputs)
+
+
+@traced("mistral_ocr.batch_image_pack")
+def process_journaled_image_pack(ocr: MistralOCR, journal: OCRJournal, input_paths: List[str],
+                                 base_outputs: List[str], include_images: bool = True,
+                                 output_format: str = "all", store: Optional[str] = None,
+                                 index: Optional[OCRSearchIndex] = None) -> List[str]:
+    """
+    Traite un groupe d'images en une seule requête OCR, avec le même suivi par journal que
+    process_journaled_file pour chaque image.
+    
+    Args:
+        ocr: Instance MistralOCR
+        journal: Journal de reprise
+        input_paths: Chemins absolus des images
+        base_outputs: Chemins de sortie (sans extension) correspondants
+        include_images: Inclure les images en base64 dans les résultats
+        output_format: json, md, html, html-pages, pdf ou all
+        store: Format du stockage compact à écrire en plus, ou None
+        index: Index de recherche à alimenter, ou None
+        
+    Returns:
+        Issue pour chaque image ("skipped", "written" ou "failed")
+    """
+    outcomes = ["skipped"] * len(input_paths)
+    to_process = []
+    
+    for i, input_path in enumerate(input_paths):
+        entry = None
+        try:
+            content_hash = file_hash(input_path)
+            entry = journal.claim(input_path, content_hash)
+            if entry is None:
+                continue
+            if entry["state"] == STATE_OCR_DONE:
+                # Résultat déjà obtenu: seules les sorties restent à écrire
+                print(f"Reprise de {input_path} à partir du résultat OCR déjà obtenu")
+                result = journal.load_checkpoint(entry["result_path"])
+                _write_journaled_outputs(ocr, journal, input_path, content_hash, result, base_outputs[i],
+                                         output_format, store, index)
+                outcomes[i] = "written"
+            else:
+                to_process.append((i, content_hash))
+        except LeaseLostError as e:
+            print(str(e))
+        except Exception as e:
+            print(f"Erreur lors du traitement de {input_path}: {str(e)}")
+            # Un document réservé est libéré: son bail serait sinon prolongé tant que le processus vit
+            outcomes[i] = "failed" if entry is None else _mark_failed(journal, input_path, content_hash, str(e))
+    
+    if not to_process:
+        return outcomes
+    
+    results = ocr.process_image_batch([input_paths[i] for i, _ in to_process], include_images,
+                                      batch_size=len(to_process))
+    for (i, content_hash), result in zip(to_process, results):
+        input_path = input_paths[i]
+        try:
+            if "error" in result:
+                journal.update(input_path, content_hash, state=STATE_FAILED, error=result["error"])
+                outcomes[i] = "failed"
+                continue
+            result_path = journal.save_checkpoint(content_hash, result)
+            journal.update(input_path, content_hash, state=STATE_OCR_DONE, result_path=result_path)
+            _write_journaled_outputs(ocr, journal, input_path, content_hash, result, base_outputs[i],
+                                     output_format, store, index)
+            outcomes[i] = "written"
+        except LeaseLostError as e:
+            print(str(e))
+        except Exception as e:
+            print(f"Erreur lors du traitement de {input_path}: {str(e)}")
+            outcomes[i] = _mark_failed(journal, input_path, content_hash, str(e))
+    
+    return outcomes
+
+
+def run_batch(ocr: MistralOCR, inputs: List[str], output_dir: str, journal: OCRJournal,
+              include_images: bool = True, output_format: str = "all", store: Optional[str] = None,
+              index: Optional[OCRSearchIndex] = None, workers: int = 4, pack_size: int = 0) -> Dict[str, int]:
+    """
+    Traite un lot de documents de façon reprenable: les documents déjà terminés sont ignorés.
+    
+    Args:
+        ocr: Instance MistralOCR
+        inputs: Fichiers ou dossiers à traiter
+        output_dir: Dossier de sortie
+        journal: Journal de reprise
+        include_images: Inclure les images en base64 dans les résultats
+        output_format: json, md, html, html-pages, pdf ou all
+        store: Format du stockage compact à écrire en plus, ou None
+        index: Index de recherche à alimenter, ou None
+        workers: Nombre de documents traités en parallèle
+        pack_size: Nombre d'images regroupées par requête OCR (0 ou 1: une requête par image)
+        
+    Returns:
+        Nombre de documents par issue (written, skipped, failed)
+    """
+    files = collect_input_files(inputs)
+    print(f"{len(files)} document(s) à traiter, journal: {journal.db_path}")
+    
+    # Les images peuvent être regroupées; les PDF sont toujours envoyés séparément
+    if pack_size > 1:
+        singles = [path for path in files if path.lower().endswith(".pdf")]
+        images = [path for path in files if not path.lower().endswith(".pdf")]
+        packs = [images[start:start + pack_size] for start in range(0, len(images), pack_size)]
+    else:
+        singles, packs = files, []
+    
+    counts = {"written": 0, "skipped": 0, "failed": 0}
+    done = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {
+            executor.submit(
+                process_journaled_file, ocr, journal, path, batch_output_base(path, inputs, output_dir),
+                include_images, output_format, store, index
+            ): [path]
+            for path in singles
+        }
+        for pack in packs:
+            future = executor.submit(
+                process_journaled_image_pack, ocr, journal, pack,
+                [batch_output_base(path, inputs, output_dir) for path in pack],
+                include_images, output_format, store, index
+            )
+            futures[future] = pack
+        
+        for future in concurrent.futures.as_completed(futures):
+            outcomes = future.result()
+            if isinstance(outcomes, str):
+                outcomes = [outcomes]
+            for path, outcome in zip(futures[future], outcomes):
+                done += 1
+                counts[outcome] += 1
+                concurrency = f" (limite: {ocr.limiter.limit} appels)" if ocr.limiter is not None else ""
+                print(f"[{done}/{len(files)}] {outcome}: {path}{concurrency}")
+    
+    return counts
+
+
+def run_watch(ocr: MistralOCR, args: argparse.Namespace):
+    """
+    Surveille un dossier et traite chaque nouveau document une fois complètement écrit.
+    Les sorties sont écrites dans un dossier miroir (--output-dir) ou à côté de chaque fichier.
+    
+    Args:
+        ocr: Instance MistralOCR
+        args: Arguments de la ligne de commande
+    """
+    watch_dir = os.path.abspath(args.watch)
+    if not os.path.isdir(watch_dir):
+        print(f"Erreur: {args.watch} n'est pas un dossier.")
+        sys.exit(1)
+    
+    output_dir = os.path.abspath(args.output_dir) if args.output_dir else None
+    journal_path = args.journal or os.path.join(output_dir or watch_dir, ".ocr_journal.db")
+    journal = OCRJournal(journal_path)
+    index = None if args.no_index else OCRSearchIndex(args.index_db)
+    
+    def handle(input_path: str) -> str:
+        if output_dir:
+            base_output = batch_output_base(input_path, [watch_dir], output_dir)
+        else:
+            base_output = os.path.join(os.path.dirname(input_path), WATCH_OUTPUT_DIR_NAME, Path(input_path).stem)
+        return process_journaled_file(ocr, journal, input_path, base_output, not args.no_images,
+                                      args.format, args.store, index)
+    
+    # Le dossier de sortie ne doit pas être surveillé s'il se trouve dans le dossier d'entrée
+    ignore_dir_names = [WATCH_OUTPUT_DIR_NAME]
+    if output_dir and output_dir.startswith(watch_dir + os.sep):
+        ignore_dir_names.append(os.path.relpath(output_dir, watch_dir).split(os.sep)[0])
+    
+    watcher = FolderWatcher(
+        watch_dir, handle, SUPPORTED_EXTENSIONS,
+        workers=args.workers,
+        settle_seconds=args.settle_seconds,
+        poll_interval=args.poll_interval,
+        report_interval=args.report_interval,
+        ignore_dir_names=tuple(ignore_dir_names),
+        force_polling=args.polling
+    )
+    try:
+        watcher.run()
+    finally:
+        if ocr.limiter is not None:
+            print_limiter_stats(ocr.limiter)
+        if ocr.hedger is not None:
+            print_hedger_stats(ocr.hedger)
+        journal.close()
+        if index is not None:
+            index.close()
+
+
+def print_limiter_stats(limiter: AdaptiveLimiter):
+    """Affiche la limite adaptative d'appels simultanés et ses ajustements."""
+    stats = limiter.stats()
+    line = (f"Concurrence adaptative: limite {stats['limit']}, {stats['calls']} appel(s), "
+            f"{stats['throttled']} erreur(s) 429, {stats['server_errors']} erreur(s) 5xx, "
+            f"{stats['increases']} hausse(s), {stats['decreases']} baisse(s)")
+    if "latency_p95_ms" in stats:
+        line += f", latence p50 {stats['latency_p50_ms']} ms, p95 {stats['latency_p95_ms']} ms"
+    print(line)
+
+
+def save_profile(profiler: StageProfiler, base_output: str):
+    """Enregistre le profil des étapes à côté des sorties et affiche son résumé."""
+    profiler.stop()
+    files = profiler.save(base_output)
+    print(f"\nProfil des étapes (détails dans {files[0]}):")
+    print(format_profile(profiler.summary()))
+
+
+def print_hedger_stats(hedger: HedgedCaller):
+    """Affiche le nombre d'appels OCR doublés et gagnés par le doublon."""
+    stats = hedger.stats()
+    print(f"Relance des appels lents: {stats['hedged']} doublon(s) sur {stats['calls']} appel(s), "
+          f"{stats['hedge_wins']} plus rapide(s) que l'appel initial, "
+          f"{stats['hedges_skipped']} abandonné(s) faute de place dans la limite des appels simultanés")
+
+
 def main():
     parser = argparse.ArgumentParser(description="Effectuer l'OCR sur des documents avec l'API Mistral")
     
@@ -728,16 +2204,115 @@ def main():
     input_group.add_argument("--url", type=str, help="URL d'un document à traiter")
     input_group.add_argument("--pdf", type=str, help="Chemin vers un fichier PDF local à traiter")
     input_group.add_argument("--image", type=str, help="Chemin vers un fichier image local à traiter")
+    input_group.add_argument("--batch", type=str, nargs="+",
+                             help="Fichiers et/ou dossiers à traiter par lot, avec reprise après interruption")
+    input_group.add_argument("--watch", type=str,
+                             help="Surveiller un dossier et traiter automatiquement chaque nouveau PDF ou image")
+    input_group.add_argument("--search", type=str, help="Rechercher un texte dans l'index des documents déjà traités")
     
     # Options additionnelles
     parser.add_argument("--output", type=str, default="ocr_result.json", help="Nom du fichier de sortie (par défaut: ocr_result.json)")
     parser.add_argument("--no-images", action="store_true", help="Ne pas inclure les images en base64 dans le résultat")
-    parser.add_argument("--question", type=str, help="Poser une question sur le document (document understanding)")
-    parser.add_argument("--format", choices=["json", "md", "html", "pdf", "all"], default="all", 
-                        help="Format de sortie: json, md (markdown), html, pdf ou all (tous les formats)")
+    parser.add_argument("--question", type=str, action="append",
+                        help="Poser une question sur le document (option répétable)")
+    parser.add_argument("--top-k", type=int, default=5,
+                        help="Nombre d'extraits du résultat OCR envoyés au modèle par question (par défaut: 5)")
+    parser.add_argument("--full-document-question", action="store_true",
+                        help="Envoyer le document entier au modèle pour chaque question (URL uniquement)")
+    parser.add_argument("--format", choices=["json", "md", "html", "html-pages", "pdf", "all"], default="all", 
+                        help="Format de sortie: json, md (markdown), html, html-pages (visionneuse paginée "
+                             "pour les gros documents), pdf ou all (tous les formats)")
+    parser.add_argument("--markdown-backend", choices=list(MARKDOWN_BACKENDS), default=DEFAULT_MARKDOWN_BACKEND,
+                        help="Moteur de conversion Markdown → HTML: markdown2, markdown-it (CommonMark, plus rapide) "
+                             f"ou mistune (par défaut: {DEFAULT_MARKDOWN_BACKEND})")
+    parser.add_argument("--optimize", action="store_true",
+                        help="Réduire localement les images et PDF avant envoi (résolution, compression, métadonnées)")
+    parser.add_argument("--target-dpi", type=int, default=200,
+                        help="--optimize: résolution visée pour les images (par défaut: 200)")
+    parser.add_argument("--jpeg-quality", type=int, default=85,
+                        help="--optimize: qualité de recompression JPEG (par défaut: 85)")
+    parser.add_argument("--skip-blank-pages", action="store_true",
+                        help="Ne pas envoyer à l'OCR les pages blanches ni les pages en double "
+                             "(PDF: nécessite pypdfium2); les index des pages sont conservés")
+    parser.add_argument("--ink-threshold", type=float, default=0.003,
+                        help="--skip-blank-pages: part minimale d'encre d'une page non blanche (par défaut: 0.003)")
+    parser.add_argument("--duplicate-distance", type=int, default=4,
+                        help="--skip-blank-pages: écart maximal (bits sur 64) entre empreintes de pages en double, "
+                             "-1 pour ne garder que les pages blanches (par défaut: 4)")
+    parser.add_argument("--page-cache", type=str, metavar="DB",
+                        help="Cache SQLite des résultats par page: pour un PDF révisé, seules les pages nouvelles "
+                             "ou modifiées sont envoyées à l'OCR (nécessite pypdfium2). Les images sont renumérotées "
+                             "comme pour un traitement complet; usage_info ne compte que les pages envoyées")
+    parser.add_argument("--url-cache", type=str, metavar="DB",
+                        help="Cache SQLite des documents distants (--url): l'URL est revalidée par un GET conditionnel "
+                             "(ETag, Last-Modified) et un document inchangé n'est pas soumis à nouveau à l'OCR")
+    parser.add_argument("--store", choices=["jsonl", "parquet"],
+                        help="Écrire aussi un stockage compact du résultat (<sortie>.ocrstore): jsonl compressé ou parquet")
+    parser.add_argument("--index-db", type=str,
+                        help="Chemin de l'index de recherche plein texte (par défaut: MISTRAL_OCR_INDEX_DB, "
+                             f"sinon {DEFAULT_INDEX_PATH})")
+    parser.add_argument("--no-index", action="store_true", help="Ne pas ajouter le document à l'index de recherche")
+    parser.add_argument("--output-dir", type=str,
+                        help="Dossier de sortie pour --batch (par défaut: ocr_results) et --watch "
+                             f"(par défaut: un dossier {WATCH_OUTPUT_DIR_NAME} à côté de chaque fichier)")
+    parser.add_argument("--journal", type=str,
+                        help="Journal de reprise pour --batch et --watch (par défaut: <output-dir>/ocr_journal.db)")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="Nombre de documents traités en parallèle avec --batch et --watch (par défaut: 4)")
+    parser.add_argument("--adaptive-concurrency", action="store_true",
+                        help="--batch/--watch: ajuster le nombre d'appels simultanés à l'API selon la latence "
+                             "et les erreurs 429/5xx, en partant de --workers")
+    parser.add_argument("--max-concurrency", type=int, default=16,
+                        help="--adaptive-concurrency: nombre maximal d'appels simultanés (par défaut: 16)")
+    parser.add_argument("--hedge", action="store_true",
+                        help="Relancer en double un appel OCR plus lent que --hedge-percentile des appels récents "
+                             "et garder la première réponse")
+    parser.add_argument("--hedge-percentile", type=float, default=95,
+                        help="--hedge: percentile des latences récentes déclenchant un doublon (par défaut: 95)")
+    parser.add_argument("--hedge-budget", type=float, default=0.05,
+                        help="--hedge: part maximale d'appels doublés (par défaut: 0.05, soit 5 %%)")
+    parser.add_argument("--pack-images", type=int, default=0, metavar="N",
+                        help="--batch: regrouper les images par N dans une seule requête OCR multipage "
+                             f"(ex: {DEFAULT_PACK_SIZE}; par défaut: une requête par image)")
+    parser.add_argument("--settle-seconds", type=float, default=5.0,
+                        help="--watch: délai sans modification avant de traiter un fichier (par défaut: 5)")
+    parser.add_argument("--poll-interval", type=float, default=2.0,
+                        help="--watch: intervalle de vérification du dossier en secondes (par défaut: 2)")
+    parser.add_argument("--polling", action="store_true",
+                        help="--watch: parcourir périodiquement le dossier même si watchdog (inotify) est installé")
+    parser.add_argument("--report-interval", type=float, default=60.0,
+                        help="--watch: intervalle d'affichage du débit et de la latence en secondes (par défaut: 60)")
+    parser.add_argument("--limit", type=int, default=20, help="Nombre maximal de résultats pour --search (par défaut: 20)")
+    parser.add_argument("--trace", type=str, metavar="FICHIER",
+                        help="Enregistrer les spans de chaque traitement (envoi, appel OCR, cache, rendu des pages...) "
+                             "dans un fichier JSONL, et préfixer les messages par l'identifiant de trace")
+    parser.add_argument("--trace-console", action="store_true",
+                        help="Afficher chaque span terminé sur la sortie d'erreur")
+    parser.add_argument("--profile", action="store_true",
+                        help="Mesurer le temps (cProfile) et la mémoire (tracemalloc) de chaque étape et enregistrer "
+                             "le profil à côté des sorties (<sortie>_profile.json et <sortie>_profile/)")
     
     args = parser.parse_args()
     
+    # Charger les variables d'environnement depuis le fichier .env
+    load_environment()
+    # Les valeurs par défaut lues dans l'environnement ne sont résolues qu'après le chargement du .env
+    args.index_db = args.index_db or default_index_path()
+    configure_tracing(args.trace, console=args.trace_console)
+    
+    # La recherche n'interroge que l'index local et ne nécessite pas de clé API
+    if args.search:
+        index = OCRSearchIndex(args.index_db)
+        start = time.perf_counter()
+        hits = index.search(args.search, limit=args.limit, highlight=("**", "**"))
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        print(f"{len(hits)} résultat(s) pour \"{args.search}\" ({elapsed_ms:.1f} ms)\n")
+        for hit in hits:
+            print(f"- {hit['source'] or hit['doc_id']} (page {hit['page_index']})")
+            print(f"  {hit['snippet']}\n")
+        index.close()
+        return
+    
     # Récupérer la clé API de l'argument ou de la variable d'environnement
     api_key = args.api_key or os.environ.get("MISTRAL_API_KEY")
     if not api_key:
@@ -745,81 +2320,117 @@ def main():
         sys.exit(1)
     
     # Créer l'instance MistralOCR
-    ocr = MistralOCR(api_key)
-    
-    # Traiter le document selon le type d'entrée
-    if args.url:
-        print(f"Traitement de l'URL: {args.url}")
-        result = ocr.process_document_url(args.url, not args.no_images)
-    elif args.pdf:
-        print(f"Traitement du fichier PDF: {args.pdf}")
-        result = ocr.process_pdf_file(args.pdf, not args.no_images)
-    elif args.image:
-        print(f"Traitement de l'image: {args.image}")
-        result = ocr.process_image_file(args.image, not args.no_images)
-    
-    # Si une erreur s'est produite
-    if "error" in result:
-        print(f"Erreur lors du traitement: {result['error']}")
+    optimizer = None
+    if args.optimize:
+        optimizer = PayloadOptimizer(target_dpi=args.target_dpi, jpeg_quality=args.jpeg_quality)
+    try:
+        page_filter = None
+        if args.skip_blank_pages:
+            page_filter = PageFilter(ink_threshold=args.ink_threshold, duplicate_distance=args.duplicate_distance)
+        page_store = PageResultStore(args.page_cache) if args.page_cache else None
+        # En ligne de commande, l'URL est choisie par l'opérateur: les hôtes du réseau local sont acceptés
+        url_store = URLResultStore(args.url_cache, allow_private_hosts=True) if args.url_cache else None
+        limiter = None
+        if args.adaptive_concurrency:
+            limiter = AdaptiveLimiter(initial_limit=args.workers, max_limit=args.max_concurrency)
+            # Assez de documents en cours pour que la limite puisse monter jusqu'au maximum
+            args.workers = max(args.workers, args.max_concurrency)
+        hedger = None
+        if args.hedge:
+            hedger = HedgedCaller(percentile=args.hedge_percentile / 100, budget=args.hedge_budget)
+        profiler = StageProfiler() if args.profile else None
+        ocr = MistralOCR(api_key, optimizer=optimizer, page_filter=page_filter, page_store=page_store,
+                         limiter=limiter, hedger=hedger, markdown_backend=args.markdown_backend, profiler=profiler,
+                         url_store=url_store)
+    except ImportError as e:
+        print(str(e))
         sys.exit(1)
     
-    # Sauvegarder le résultat selon le format demandé
-    base_output = args.output
-    if base_output.endswith(".json") or base_output.endswith(".md") or base_output.endswith(".html") or base_output.endswith(".pdf"):
-        base_output = os.path.splitext(base_output)[0]
+    # Traitement par lot reprenable
+    if args.batch:
+        output_dir = args.output_dir or "ocr_results"
+        os.makedirs(output_dir, exist_ok=True)
+        journal = OCRJournal(args.journal or os.path.join(output_dir, "ocr_journal.db"))
+        index = None if args.no_index else OCRSearchIndex(args.index_db)
+        counts = run_batch(ocr, args.batch, output_dir, journal, not args.no_images,
+                           args.format, args.store, index, args.workers, args.pack_images)
+        print(f"\nTraitement terminé: {counts['written']} écrit(s), {counts['skipped']} ignoré(s), {counts['failed']} en échec")
+        if optimizer is not None:
+            totals = optimizer.summary()
+            print(f"Optimisation: {totals['files']} fichier(s), {totals['bytes_saved'] / (1024 * 1024):.1f} Mo économisés, "
+                  f"~{totals['upload_seconds_saved']:.0f} s d'envoi en moins")
+        if limiter is not None:
+            print_limiter_stats(limiter)
+        if hedger is not None:
+            print_hedger_stats(hedger)
+        if profiler is not None:
+            save_profile(profiler, os.path.join(output_dir, "ocr"))
+        journal.close()
+        if index is not None:
+            index.close()
+        sys.exit(1 if counts["failed"] else 0)
     
-    if args.format == "json" or args.format == "all":
-        ocr.save_ocr_result(result, base_output + ".json")
+    # Surveillance d'un dossier de dépôt
+    if args.watch:
+        run_watch(ocr, args)
+        if profiler is not None:
+            save_profile(profiler, os.path.join(args.output_dir or ".", "ocr"))
+        return
     
-    if args.format == "md" or args.format == "all":
-        # Le fichier markdown est généré dans save_ocr_result
-        if args.format != "all":
-            md_file = base_output + ".md"
-            with open(md_file, "w", encoding="utf-8") as f:
-                for page in result.get("pages", []):
-                    f.write(f"### Page {page.get('index')}\n\n")
-                    f.write(page.get("markdown", "") + "\n\n")
-            print(f"Contenu en markdown sauvegardé dans {md_file}")
+    # Traiter le document selon le type d'entrée (une trace par document)
+    with span("mistral_ocr.document", source=args.url or args.pdf or args.image):
+        if args.url:
+            print(f"Traitement de l'URL: {args.url}")
+            result = ocr.process_document_url(args.url, not args.no_images)
+        elif args.pdf:
+            print(f"Traitement du fichier PDF: {args.pdf}")
+            result = ocr.process_pdf_file(args.pdf, not args.no_images)
+        elif args.image:
+            print(f"Traitement de l'image: {args.image}")
+            result = ocr.process_image_file(args.image, not args.no_images)
     
-    if args.format == "html" or args.format == "all":
-        html_file = base_output + ".html"
-        if args.format != "all":
-            ocr.generate_html_output(result, html_file)
-        else:
-            # Si on génère tous les formats, on a besoin du fichier HTML pour le PDF
-            ocr.generate_html_output(result, html_file)
+        # Si une erreur s'est produite
+        if "error" in result:
+            print(f"Erreur lors du traitement: {result['error']}")
+            sys.exit(1)
     
-    if (args.format == "pdf" or args.format == "all") and PDF_AVAILABLE:
-        pdf_file = base_output + ".pdf"
-        html_file = base_output + ".html"
-        
-        # S'assurer que le fichier HTML existe
-        if not os.path.exists(html_file) and args.format == "pdf":
-            ocr.generate_html_output(result, html_file)
-        
-        # Convertir HTML en PDF
-        try:
-            # Utiliser le bon format pour WeasyPrint v60.2
-            HTML(filename=html_file).write_pdf(pdf_file)
-            print(f"Document PDF sauvegardé dans {pdf_file}")
-        except Exception as e:
-            print(f"Erreur lors de la génération du PDF: {str(e)}")
-    elif args.format == "pdf" and not PDF_AVAILABLE:
-        print("L'exportation PDF n'est pas disponible car WeasyPrint n'est pas installé.")
-        print("Pour l'installer: pip install weasyprint")
+        # Alimenter l'index de recherche plein texte
+        if not args.no_index:
+            source = args.url or os.path.abspath(args.pdf or args.image)
+            try:
+                index = OCRSearchIndex(args.index_db)
+                page_count = index.index_document(source, result, source=source)
+                index.close()
+                print(f"{page_count} page(s) ajoutée(s) à l'index de recherche {args.index_db}")
+            except Exception as e:
+                print(f"Erreur lors de l'indexation du document: {str(e)}")
+    
+        # Sauvegarder le résultat selon le format demandé
+        base_output = args.output
+        if base_output.endswith(".json") or base_output.endswith(".md") or base_output.endswith(".html") or base_output.endswith(".pdf"):
+            base_output = os.path.splitext(base_output)[0]
+    
+        write_outputs(ocr, result, base_output, args.format, args.store)
+        if profiler is not None:
+            save_profile(profiler, base_output)
     
-    # Si une question est posée
+    # Si une ou plusieurs questions sont posées
     if args.question:
-        print(f"\nQuestion: {args.question}")
-        document_url = args.url
-        if args.pdf or args.image:
-            # Pour les questions sur des fichiers locaux, il faudrait d'abord les télécharger sur un serveur
-            print("La fonctionnalité de question n'est disponible que pour les URL de documents.")
-            sys.exit(1)
-        
-        answer = ocr.ask_question_about_document(document_url, args.question)
-        print(f"\nRéponse: {answer}")
-
+        if args.full_document_question:
+            if not args.url:
+                print("L'option --full-document-question n'est disponible que pour les URL de documents.")
+                sys.exit(1)
+            for question in args.question:
+                print(f"\nQuestion: {question}")
+                answer = ocr.ask_question_about_document(args.url, question)
+                print(f"\nRéponse: {answer}")
+        else:
+            # L'index des extraits est construit une seule fois pour toutes les questions
+            chunk_index = ChunkIndex(result)
+            for question in args.question:
+                print(f"\nQuestion: {question}")
+                answer = ocr.ask_question_about_result(chunk_index, question, top_k=args.top_k)
+                print(f"\nRéponse: {answer}")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
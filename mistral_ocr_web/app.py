@@ -2,12 +2,17 @@ import os
 import json
 import time
 import base64
-import requests
 import random
+import shutil
+import hmac
+import signal
+import socket
+import hashlib
+import tempfile
+import functools
 from pathlib import Path
-from flask import Flask, render_template, request, jsonify, send_file, url_for, redirect, session, flash
+from flask import Flask, Request, Response, render_template, request, jsonify, send_file, send_from_directory, url_for, redirect, session, flash
 from werkzeug.utils import secure_filename
-from dotenv import load_dotenv
 import threading
 import uuid
 
@@ -15,52 +20,250 @@ import uuid
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 try:
-    from mistral_ocr import MistralOCR, PDF_AVAILABLE
+    from mistral_ocr import MistralOCR, PDF_AVAILABLE, HTML_STYLE, load_environment
+    from ocr_preprocess import PayloadOptimizer
+    from ocr_search import OCRSearchIndex
+    from ocr_store import PageResultStore, URLResultStore
+    from ocr_scheduler import JobScheduler, estimate_job_cost, parse_priority_classes
+    from ocr_concurrency import AdaptiveLimiter, HedgedCaller
+    from ocr_webhooks import WebhookSender, is_valid_webhook_url
+    from ocr_pdf import PDFRenderPool
+    from ocr_profile import StageProfiler
+    from ocr_trace import span, current_span, configure_tracing
+    from ocr_state import SharedState
 except ImportError as e:
     print(f"Erreur d'importation de mistral_ocr.py: {str(e)}")
     print("Assurez-vous que le fichier mistral_ocr.py est présent à la racine du projet.")
     sys.exit(1)
 
-# Charger les variables d'environnement
-load_dotenv()
+# La configuration, l'état partagé et la clé des sessions ci-dessous sont lus dans l'environnement
+# à l'import: le fichier .env doit donc être chargé avant
+load_environment()
 
-# Désactiver WeasyPrint par défaut
-WEASYPRINT_AVAILABLE = False
+# Utiliser la variable de mistral_ocr.py (WeasyPrint désactivé par défaut)
+WEASYPRINT_AVAILABLE = PDF_AVAILABLE
 
-# Utiliser la variable de mistral_ocr.py
-if PDF_AVAILABLE:
-    WEASYPRINT_AVAILABLE = True
-    print("PDF_AVAILABLE est True dans mistral_ocr.py, donc la génération PDF sera activée.")
-else:
-    print("\n=== INFO: Génération PDF désactivée dans l'application web ===")
-    print("La génération PDF est désactivée car PDF_AVAILABLE est False dans mistral_ocr.py")
-    print("Pour l'activer:")
-    print("1. Installez les dépendances système: brew install cairo pango gdk-pixbuf libffi")
-    print("2. Installez WeasyPrint: pip install weasyprint==52.5")
-    print("3. Modifiez mistral_ocr.py pour activer PDF_AVAILABLE")
-    print("================================\n")
+def print_pdf_status():
+    """Affiche l'état de la génération PDF au démarrage du serveur"""
+    if WEASYPRINT_AVAILABLE:
+        print("PDF_AVAILABLE est True dans mistral_ocr.py, donc la génération PDF sera activée.")
+    else:
+        print("\n=== INFO: Génération PDF désactivée dans l'application web ===")
+        print("La génération PDF est désactivée car PDF_AVAILABLE est False dans mistral_ocr.py")
+        print("Pour l'activer:")
+        print("1. Installez les dépendances système: brew install cairo pango gdk-pixbuf libffi")
+        print("2. Installez WeasyPrint: pip install weasyprint==52.5")
+        print("3. Modifiez mistral_ocr.py pour activer PDF_AVAILABLE")
+        print("================================\n")
 
 app = Flask(__name__)
-app.secret_key = os.urandom(24)
 app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # Augmenté à 100 MB max
 # Configuration pour permettre des requêtes plus grandes
 app.config['MAX_CONTENT_PATH'] = 100 * 1024 * 1024  # 100 MB
 # Taille maximale acceptée par l'API Mistral (52.4 MB)
 app.config['MISTRAL_API_MAX_SIZE'] = 52.4 * 1024 * 1024  # 52.4 MB
+# Les fichiers envoyés jusqu'à cette taille restent en mémoire, sans copie dans UPLOAD_FOLDER
+app.config['MEMORY_UPLOAD_MAX'] = int(float(os.environ.get('MISTRAL_OCR_MEMORY_UPLOAD_MB', 32)) * 1024 * 1024)
+# Optimisation locale des images et PDF avant envoi (activable aussi par requête avec le champ "optimize")
+app.config['OPTIMIZE_UPLOADS'] = os.environ.get('MISTRAL_OCR_OPTIMIZE_UPLOADS', '').lower() in ('1', 'true', 'yes')
+app.config['OPTIMIZE_TARGET_DPI'] = int(os.environ.get('MISTRAL_OCR_TARGET_DPI', 200))
+# Cache des résultats par page: seules les pages nouvelles ou modifiées d'un PDF sont envoyées à l'OCR
+app.config['PAGE_CACHE'] = os.environ.get('MISTRAL_OCR_PAGE_CACHE', '').lower() in ('1', 'true', 'yes')
+# Cache des documents distants: une URL inchangée (GET conditionnel, même contenu) n'est pas soumise à nouveau à l'OCR
+app.config['URL_CACHE'] = os.environ.get('MISTRAL_OCR_URL_CACHE', '').lower() in ('1', 'true', 'yes')
+# File des traitements: nombre de traitements simultanés, ordonnancement (sjf ou fifo) et vieillissement
+app.config['OCR_WORKERS'] = int(os.environ.get('MISTRAL_OCR_WORKERS', 4))
+app.config['SCHEDULER_POLICY'] = os.environ.get('MISTRAL_OCR_SCHEDULER', 'sjf')
+app.config['SCHEDULER_AGING_RATE'] = float(os.environ.get('MISTRAL_OCR_AGING_RATE', 0.5))
+# Classes de priorité par clé API: "préfixe_de_clé:high,préfixe_de_clé:low"
+app.config['PRIORITY_CLASSES'] = parse_priority_classes(os.environ.get('MISTRAL_OCR_PRIORITY_CLASSES', ''))
+# Limite adaptative des appels simultanés à l'API (partagée par toutes les tâches), plafonnée par OCR_WORKERS
+app.config['ADAPTIVE_CONCURRENCY'] = os.environ.get('MISTRAL_OCR_ADAPTIVE_CONCURRENCY', '').lower() in ('1', 'true', 'yes')
+# Relance en double des appels OCR lents: percentile de déclenchement et part maximale d'appels doublés
+app.config['HEDGE_REQUESTS'] = os.environ.get('MISTRAL_OCR_HEDGE', '').lower() in ('1', 'true', 'yes')
+app.config['HEDGE_PERCENTILE'] = float(os.environ.get('MISTRAL_OCR_HEDGE_PERCENTILE', 95))
+app.config['HEDGE_BUDGET'] = float(os.environ.get('MISTRAL_OCR_HEDGE_BUDGET', 0.05))
+# Soumission par lot (/batch): nombre maximal de documents et secret de signature des notifications
+app.config['BATCH_MAX_ITEMS'] = int(os.environ.get('MISTRAL_OCR_BATCH_MAX_ITEMS', 1000))
+app.config['WEBHOOK_SECRET'] = os.environ.get('MISTRAL_OCR_WEBHOOK_SECRET', '')
+# Destinataires des notifications joignables bien que non publics (réseau interne): "hooks.interne,10.0.0.5"
+app.config['WEBHOOK_ALLOWED_HOSTS'] = [host.strip().lower() for host in
+                                       os.environ.get('MISTRAL_OCR_WEBHOOK_ALLOWED_HOSTS', '').split(',') if host.strip()]
+# Clé d'administration (en-tête X-Admin-Key): /search porte alors sur les documents de tous les utilisateurs
+app.config['ADMIN_KEY'] = os.environ.get('MISTRAL_OCR_ADMIN_KEY', '')
+# Rendu PDF dans des processus dédiés: rendus simultanés, durée maximale (s), mémoire par processus (Mo)
+# et nombre de rendus avant le remplacement d'un processus
+app.config['PDF_WORKERS'] = int(os.environ.get('MISTRAL_OCR_PDF_WORKERS', 2))
+app.config['PDF_TIMEOUT'] = float(os.environ.get('MISTRAL_OCR_PDF_TIMEOUT', 300))
+app.config['PDF_MEMORY_MB'] = int(os.environ.get('MISTRAL_OCR_PDF_MEMORY_MB', 2048))
+app.config['PDF_MAX_JOBS_PER_WORKER'] = int(os.environ.get('MISTRAL_OCR_PDF_MAX_JOBS', 20))
+# Profilage par tâche (champ "profile" des soumissions): cProfile et tracemalloc par étape, résumé dans /status
+app.config['ALLOW_PROFILING'] = os.environ.get('MISTRAL_OCR_ALLOW_PROFILING', '1').lower() in ('1', 'true', 'yes')
+# Traces des traitements: fichier JSONL des spans et/ou affichage sur la sortie d'erreur
+app.config['TRACE_FILE'] = os.environ.get('MISTRAL_OCR_TRACE_FILE', '')
+app.config['TRACE_CONSOLE'] = os.environ.get('MISTRAL_OCR_TRACE_CONSOLE', '').lower() in ('1', 'true', 'yes')
+# Moteur de conversion Markdown → HTML des sorties html, html-pages et pdf (markdown2, markdown-it ou mistune)
+app.config['MARKDOWN_BACKEND'] = os.environ.get('MISTRAL_OCR_MARKDOWN_BACKEND', 'markdown2')
+# Déploiement multiprocessus: base SQLite de l'état partagé par les processus (tâches, file des traitements,
+# lots, flux des pages), attente maximale des traitements en cours à l'arrêt (SIGTERM, en secondes)
+# et durée de conservation de l'état partagé (heures)
+app.config['SHARED_STATE'] = os.environ.get('MISTRAL_OCR_SHARED_STATE', '')
+app.config['DRAIN_TIMEOUT'] = float(os.environ.get('MISTRAL_OCR_DRAIN_TIMEOUT', 600))
+app.config['STATE_RETENTION_HOURS'] = float(os.environ.get('MISTRAL_OCR_STATE_RETENTION_HOURS', 168))
+# Port du serveur, et fichier où écrire le PID du processus une fois le port ouvert (restart.sh)
+app.config['PORT'] = int(os.environ.get('MISTRAL_OCR_PORT', 5001))
+app.config['PID_FILE'] = os.environ.get('MISTRAL_OCR_PID_FILE', '')
+
+class OCRRequest(Request):
+    """Requête dont les fichiers envoyés restent en mémoire jusqu'à MEMORY_UPLOAD_MAX (au-delà, fichier temporaire)"""
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=app.config['MEMORY_UPLOAD_MAX'], mode='rb+')
+
+app.request_class = OCRRequest
+
+# Feuille de style des visionneuses paginées, commune à tous les documents
+PAGED_VIEWER_CSS_URL = '/assets/ocr.css'
 
-# Assurez-vous que le dossier d'upload existe
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+# Extensions acceptées (les formats TIFF et HEIC sont convertis avant envoi)
+IMAGE_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif', 'webp', 'tif', 'tiff', 'heic', 'heif'}
+ALLOWED_EXTENSIONS = IMAGE_EXTENSIONS | {'pdf'}
+
+# État partagé entre les processus si SHARED_STATE est configuré (voir ocr_state), sinon en mémoire
+shared_state = SharedState(app.config['SHARED_STATE']) if app.config['SHARED_STATE'] else None
+
+# Clé de signature des sessions (qui contiennent la clé API): FLASK_SECRET_KEY, sinon commune à tous
+# les processus de l'état partagé, pour qu'une session reste valide d'un processus et d'un redémarrage à l'autre
+if os.environ.get('FLASK_SECRET_KEY'):
+    app.secret_key = os.environ['FLASK_SECRET_KEY']
+elif shared_state is not None:
+    app.secret_key = shared_state.secret('session_key')
+else:
+    app.secret_key = os.urandom(24)
+
+def state_dict(namespace):
+    """Dictionnaire d'état: en mémoire, ou dans la base partagée par les processus"""
+    return {} if shared_state is None else shared_state.mapping(namespace)
+
+def state_lock():
+    """Verrou de l'état: propre au processus, ou commun à tous les processus"""
+    return threading.Lock() if shared_state is None else shared_state.lock()
 
 # Dictionnaire pour stocker l'état des tâches OCR
-ocr_tasks = {}
+ocr_tasks = state_dict('tasks')
+
+# Soumissions identiques simultanées: un seul traitement par clé (contenu + options),
+# les autres tâches y sont rattachées et partagent son état et ses résultats
+inflight_jobs = state_dict('inflight_jobs')
+task_aliases = state_dict('task_aliases')
+job_followers = state_dict('job_followers')
+inflight_lock = state_lock()
+
+# Pages post-traitées de chaque tâche, diffusées par /stream au fur et à mesure
+task_streams = {} if shared_state is None else shared_state.streams()
+
+# Tâches dont le profilage a été demandé, et profileurs des traitements en cours dans ce processus
+profiled_tasks = state_dict('profiled_tasks')
+task_profilers = {}
+
+# Lots soumis par /batch, et lot de chaque tâche
+ocr_batches = state_dict('batches')
+task_batches = state_dict('task_batches')
+batches_lock = state_lock()
+
+# Arrêt demandé (SIGTERM): le processus termine ses traitements avant de s'arrêter
+stopping = threading.Event()
+drained = threading.Event()
+
+@functools.lru_cache(maxsize=None)
+def ensure_runtime_ready():
+    """Crée le dossier d'upload et configure les traces, une seule fois et au premier usage"""
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    configure_tracing(app.config['TRACE_FILE'] or None, console=app.config['TRACE_CONSOLE'])
+
+@functools.lru_cache(maxsize=None)
+def get_search_index():
+    """Ouvre l'index plein texte de tous les résultats OCR au premier usage"""
+    ensure_runtime_ready()
+    return OCRSearchIndex(os.path.join(app.config['UPLOAD_FOLDER'], 'ocr_index.db'))
+
+@functools.lru_cache(maxsize=None)
+def get_page_store():
+    """Ouvre le cache des résultats par page au premier usage (None s'il est désactivé)"""
+    if not app.config['PAGE_CACHE']:
+        return None
+    ensure_runtime_ready()
+    return PageResultStore(os.path.join(app.config['UPLOAD_FOLDER'], 'page_cache.db'))
+
+@functools.lru_cache(maxsize=None)
+def get_url_store():
+    """Ouvre le cache des documents distants au premier usage (None s'il est désactivé)"""
+    if not app.config['URL_CACHE']:
+        return None
+    ensure_runtime_ready()
+    return URLResultStore(os.path.join(app.config['UPLOAD_FOLDER'], 'url_cache.db'))
+
+@functools.lru_cache(maxsize=None)
+def get_scheduler():
+    """Crée la file des traitements OCR au premier usage (commune à tous les processus si l'état est partagé)"""
+    if shared_state is not None:
+        return shared_state.job_queue(
+            {'run_single_flight': run_single_flight},
+            workers=app.config['OCR_WORKERS'],
+            aging_rate=app.config['SCHEDULER_AGING_RATE'],
+            policy=app.config['SCHEDULER_POLICY'],
+            abandon=abandon_job
+        )
+    return JobScheduler(
+        workers=app.config['OCR_WORKERS'],
+        aging_rate=app.config['SCHEDULER_AGING_RATE'],
+        policy=app.config['SCHEDULER_POLICY']
+    )
+
+@functools.lru_cache(maxsize=None)
+def get_limiter():
+    """Crée la limite adaptative des appels à l'API au premier usage (None si elle est désactivée)"""
+    if not app.config['ADAPTIVE_CONCURRENCY']:
+        return None
+    return AdaptiveLimiter(initial_limit=min(4, app.config['OCR_WORKERS']), max_limit=app.config['OCR_WORKERS'])
+
+@functools.lru_cache(maxsize=None)
+def get_hedger():
+    """Crée la relance des appels OCR lents au premier usage (None si elle est désactivée)"""
+    if not app.config['HEDGE_REQUESTS']:
+        return None
+    return HedgedCaller(percentile=app.config['HEDGE_PERCENTILE'] / 100, budget=app.config['HEDGE_BUDGET'])
+
+@functools.lru_cache(maxsize=None)
+def get_pdf_pool():
+    """Crée le pool de processus de rendu PDF au premier usage"""
+    return PDFRenderPool(
+        workers=app.config['PDF_WORKERS'],
+        timeout=app.config['PDF_TIMEOUT'],
+        memory_limit_mb=app.config['PDF_MEMORY_MB'],
+        max_jobs_per_worker=app.config['PDF_MAX_JOBS_PER_WORKER']
+    )
+
+@functools.lru_cache(maxsize=None)
+def get_webhook_sender():
+    """Crée l'envoi des notifications de fin de traitement au premier usage"""
+    return WebhookSender(app.config['WEBHOOK_SECRET'], allowed_hosts=app.config['WEBHOOK_ALLOWED_HOSTS'])
+
+def priority_for_key(api_key):
+    """Classe de priorité associée à une clé API (normal par défaut)"""
+    for prefix, priority in app.config['PRIORITY_CLASSES']:
+        if api_key.startswith(prefix):
+            return priority
+    return 'normal'
 
 def allowed_file(filename):
     """Vérifie si le fichier a une extension autorisée"""
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in {'pdf', 'jpg', 'jpeg', 'png', 'gif'}
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 def get_api_key():
     """Récupère la clé API Mistral, en priorité depuis la session utilisateur"""
+    ensure_runtime_ready()
+    
     # Vérifier d'abord si la clé est dans la session
     if 'mistral_api_key' in session and session['mistral_api_key']:
         return session['mistral_api_key']
@@ -68,54 +271,382 @@ def get_api_key():
     # Sinon, utiliser la clé du fichier .env
     return os.environ.get("MISTRAL_API_KEY")
 
-def process_ocr(task_id, api_key, file_path=None, url=None, include_images=True, output_formats=None):
-    """Fonction pour traiter l'OCR en arrière-plan"""
+class PageStream:
+    """Enregistrements par page d'une tâche, lisibles pendant leur production"""
+    def __init__(self):
+        self.records = []
+        self.closed = False
+        self._condition = threading.Condition()
+        # Lecteurs asynchrones en attente (serveur ASGI): (boucle d'événements, événement)
+        self._waiters = []
+    
+    def append(self, record):
+        """Ajoute une page et réveille les lecteurs"""
+        with self._condition:
+            self.records.append(record)
+            self._condition.notify_all()
+            self._wake_async()
+    
+    def close(self):
+        """Indique qu'aucune page ne sera plus ajoutée"""
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+            self._wake_async()
+    
+    def _wake_async(self):
+        """Réveille les lecteurs asynchrones (appelé sous le verrou)"""
+        for loop, event in self._waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                pass  # boucle déjà fermée
+        self._waiters = []
+    
+    def follow(self):
+        """Itère sur les pages déjà produites puis sur les suivantes, jusqu'à la fermeture"""
+        position = 0
+        while True:
+            with self._condition:
+                while position >= len(self.records) and not self.closed:
+                    self._condition.wait()
+                if position >= len(self.records):
+                    return
+                record = self.records[position]
+            position += 1
+            yield record
+    
+    async def follow_async(self):
+        """Comme follow, mais attend les pages suivantes sans bloquer la boucle d'événements"""
+        import asyncio
+        position = 0
+        while True:
+            event = None
+            with self._condition:
+                available = self.records[position:]
+                closed = self.closed
+                if not available and not closed:
+                    event = asyncio.Event()
+                    self._waiters.append((asyncio.get_running_loop(), event))
+            for record in available:
+                yield record
+            position += len(available)
+            if event is not None:
+                await event.wait()
+            elif not available:
+                return
+
+def api_key_owner(api_key):
+    """Identifiant du propriétaire des documents traités avec une clé API (empreinte de la clé)"""
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+
+def job_key(api_key, content_id, include_images, output_formats, optimize, profile=False):
+    """Clé identifiant une soumission: clé API, contenu (ou URL) et options de traitement"""
+    options = [
+        api_key_owner(api_key),
+        content_id, bool(include_images), sorted(output_formats), bool(optimize)
+    ]
+    # Une soumission profilée n'est pas partagée avec une soumission qui ne l'est pas
+    if profile:
+        options.append('profile')
+    payload = json.dumps(options)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def claim_job(key, task_id):
+    """
+    Réserve le traitement d'une clé pour une tâche.
+    Retourne None si la tâche doit effectuer le traitement, ou l'identifiant de la tâche
+    qui traite déjà une soumission identique (la tâche lui est alors rattachée).
+    """
+    with inflight_lock:
+        leader = inflight_jobs.get(key)
+        if leader is not None:
+            task_aliases[task_id] = leader
+            job_followers.setdefault(leader, []).append(task_id)
+            return leader
+        inflight_jobs[key] = task_id
+        task_streams[task_id] = PageStream()
+        ocr_tasks[task_id] = {'status': 'processing', 'queued': True, 'progress': 0, 'result_paths': {}, 'error': None}
+        return None
+
+def release_job(key):
+    """
+    Libère la clé une fois le traitement terminé: une nouvelle soumission relancera l'OCR.
+    Retourne les tâches qui avaient été rattachées au traitement.
+    """
+    with inflight_lock:
+        leader = inflight_jobs.pop(key, None)
+        return job_followers.pop(leader, [])
+
+def run_single_flight(key, task_id, *args):
+    """Exécute process_ocr, libère la clé de la soumission et signale la fin des tâches concernées"""
     try:
-        # Initialiser l'état de la tâche
-        ocr_tasks[task_id] = {
-            'status': 'processing',
-            'progress': 0,
-            'result_paths': {},
-            'error': None
-        }
-        
-        # Si aucun format n'est spécifié, utiliser tous les formats disponibles
-        if output_formats is None:
-            output_formats = ['json', 'md', 'html']
-            # N'ajouter PDF que si WeasyPrint est disponible
-            if WEASYPRINT_AVAILABLE:
-                output_formats.append('pdf')
-        elif 'pdf' in output_formats and not WEASYPRINT_AVAILABLE:
-            # Si PDF est demandé mais pas disponible, on le retire et on l'indique
-            output_formats.remove('pdf')
-            print(f"Avertissement: PDF a été demandé mais WeasyPrint n'est pas disponible. Format PDF ignoré.")
+        # Une trace par traitement, dont l'identifiant est donné par /status (trace_id)
+        with span("ocr.task", task_id=task_id):
+            process_ocr(task_id, *args)
+    finally:
+        task_streams[task_id].close()
+        notify_finished([task_id] + release_job(key))
+
+def abandon_job(key, task_id, *args):
+    """Termine en échec une tâche dont chaque tentative de traitement a été interrompue (processus arrêtés)"""
+    ocr_tasks[task_id].update({'status': 'error', 'queued': False,
+                               'error': "Le traitement a été interrompu à plusieurs reprises. Veuillez soumettre à nouveau le document."})
+    task_streams[task_id].close()
+    notify_finished([task_id] + release_job(key))
+
+def start_job(key, task_id, api_key, file_path=None, url=None, include_images=True, output_formats=None, optimize=False,
+              file_content=None, filename=None):
+    """Place dans la file des traitements une tâche qui a réservé sa clé, selon son coût estimé"""
+    cost = estimate_job_cost(file_content if file_content is not None else file_path, output_formats,
+                             file_name=filename)
+    ocr_tasks[task_id]['estimated_cost'] = round(cost, 1)
+    get_scheduler().submit(
+        run_single_flight, key, task_id, api_key, file_path, url, include_images, output_formats, optimize,
+        file_content, filename,
+        cost=cost, priority=priority_for_key(api_key)
+    )
+
+def get_task(task_id):
+    """Retourne l'état d'une tâche, en suivant son rattachement éventuel (None si inconnue)"""
+    return ocr_tasks.get(task_aliases.get(task_id, task_id))
+
+def prepare_task(task_id, output_formats=None, file_path=None, file_content=None, optimize=False):
+    """
+    Initialise l'état d'une tâche, complète les formats de sortie et vérifie la taille du fichier.
+    Retourne les formats à générer, ou None si la tâche a échoué.
+    """
+    # Initialiser l'état de la tâche, en gardant ce que claim_job et start_job y ont noté (estimated_cost)
+    state = {
+        'status': 'processing',
+        'queued': False,
+        'progress': 0,
+        'result_paths': {},
+        'error': None
+    }
+    if task_id in ocr_tasks:
+        ocr_tasks[task_id].update(state)
+    else:
+        ocr_tasks[task_id] = state
+    trace_id = current_span().trace_id
+    if trace_id is not None:
+        ocr_tasks[task_id]['trace_id'] = trace_id
+    
+    # Si aucun format n'est spécifié, utiliser tous les formats disponibles
+    if output_formats is None:
+        output_formats = ['json', 'md', 'html']
+        # N'ajouter PDF que si WeasyPrint est disponible
+        if WEASYPRINT_AVAILABLE:
+            output_formats.append('pdf')
+    elif 'pdf' in output_formats and not WEASYPRINT_AVAILABLE:
+        # Si PDF est demandé mais pas disponible, on le retire et on l'indique
+        output_formats.remove('pdf')
+        print(f"Avertissement: PDF a été demandé mais WeasyPrint n'est pas disponible. Format PDF ignoré.")
+    
+    # Vérifier la taille du fichier si un fichier est fourni
+    # (avec l'optimisation, la limite de l'API s'applique au fichier optimisé)
+    file_size = None
+    if file_content is not None:
+        file_size = len(file_content)
+    elif file_path and os.path.exists(file_path):
+        file_size = os.path.getsize(file_path)
+    if file_size is not None and not optimize:
+        if file_size > app.config['MISTRAL_API_MAX_SIZE']:
+            ocr_tasks[task_id]['status'] = 'error'
+            ocr_tasks[task_id]['error'] = f"Le fichier est trop volumineux pour l'API Mistral. La taille maximale autorisée est de 52.4 Mo, mais votre fichier fait {file_size / (1024 * 1024):.1f} Mo. Veuillez réduire la taille du fichier ou le diviser en parties plus petites."
+            return None
+    return output_formats
+
+def check_api_key(task_id, api_key):
+    """Vérifie que la clé API est fournie (sinon la tâche échoue) et l'affiche masquée dans les logs"""
+    if not api_key:
+        ocr_tasks[task_id]['status'] = 'error'
+        ocr_tasks[task_id]['error'] = "Clé API Mistral non configurée. Veuillez configurer votre clé API dans les paramètres."
+        return False
+    
+    # Log pour le débogage (masqué pour la sécurité)
+    masked_key = api_key[:4] + '*' * (len(api_key) - 8) + api_key[-4:] if len(api_key) > 8 else api_key
+    print(f"Utilisation de la clé API: {masked_key}")
+    return True
+
+def task_optimizer(optimize):
+    """Optimisation locale des fichiers avant envoi (None si elle n'est pas demandée)"""
+    if not optimize:
+        return None
+    return PayloadOptimizer(
+        target_dpi=app.config['OPTIMIZE_TARGET_DPI'],
+        max_bytes=int(app.config['MISTRAL_API_MAX_SIZE'])
+    )
+
+def task_profiler(task_id):
+    """Profileur des étapes du traitement (None si le profilage n'a pas été demandé pour la tâche)"""
+    if profiled_tasks.pop(task_id, None) is None:
+        return None
+    task_profilers[task_id] = StageProfiler()
+    return task_profilers[task_id]
+
+def end_task_profiling(task_id):
+    """Arrête la mesure de la mémoire d'une tâche terminée, même en cas d'échec"""
+    profiled_tasks.pop(task_id, None)
+    profiler = task_profilers.pop(task_id, None)
+    if profiler is not None:
+        profiler.stop()
+
+def save_task_profile(task_id, ocr, base_output):
+    """Enregistre le profil d'une tâche à côté de ses sorties et en place le résumé dans son état (/status)"""
+    if ocr.profiler is None:
+        return
+    try:
+        ocr.profiler.stop()
+        files = ocr.profiler.save(base_output)
+        ocr_tasks[task_id]['result_paths']['profile'] = files[0]
+        ocr_tasks[task_id]['profile'] = ocr.profiler.summary(top=3)
+    except Exception as e:
+        print(f"Erreur lors de l'enregistrement du profil: {str(e)}")
+
+def is_image_name(filename):
+    """Indique si un nom de fichier désigne une image (sinon le document est traité comme un PDF)"""
+    return filename.rsplit('.', 1)[-1].lower() in IMAGE_EXTENSIONS
+
+def write_task_outputs(task_id, ocr, result, output_formats, source=None, optimizer=None, owner=None):
+    """
+    Termine une tâche à partir du résultat de l'OCR: diffusion des pages, indexation
+    (au nom du propriétaire de la clé API, voir api_key_owner) et génération des formats de sortie demandés.
+    """
+    # Vérifier si une erreur s'est produite
+    if "error" in result:
+        ocr_tasks[task_id]['status'] = 'error'
+        ocr_tasks[task_id]['error'] = result["error"]
+        return
+    
+    # Diffuser les pages post-traitées (/stream) avant d'écrire les fichiers complets
+    page_stream = task_streams.get(task_id)
+    if page_stream is not None:
+        try:
+            with span("task.stream"):
+                for record in ocr.iter_page_records(result):
+                    page_stream.append(record)
+        except Exception as e:
+            print(f"Erreur lors de la diffusion des pages: {str(e)}")
+        page_stream.close()
+    
+    # Alimenter l'index de recherche (une erreur d'indexation ne fait pas échouer la tâche)
+    try:
+        with span("task.index"):
+            get_search_index().index_document(task_id, result, source=source, owner=owner)
+    except Exception as e:
+        print(f"Erreur lors de l'indexation du document: {str(e)}")
+    
+    # Préparer le chemin de base pour les fichiers de sortie
+    base_output = os.path.join(app.config['UPLOAD_FOLDER'], f"{task_id}")
+    with ocr.profile_stage("write"), span("task.write", formats=",".join(output_formats)):
+        write_output_files(task_id, ocr, result, output_formats, base_output, page_stream)
+    save_task_profile(task_id, ocr, base_output)
+    
+    # Rapporter le gain de l'optimisation
+    if optimizer is not None:
+        ocr_tasks[task_id]['optimization'] = optimizer.summary()
+    
+    # Mettre à jour l'état de la tâche
+    ocr_tasks[task_id]['status'] = 'completed'
+
+def write_output_files(task_id, ocr, result, output_formats, base_output, page_stream=None):
+    """Génère les formats de sortie demandés et les enregistre dans l'état de la tâche"""
+    # Générer les différents formats de sortie
+    if 'json' in output_formats:
+        json_file = base_output + ".json"
+        with open(json_file, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        ocr_tasks[task_id]['result_paths']['json'] = json_file
+    
+    if 'md' in output_formats:
+        md_file = base_output + ".md"
+        # Le markdown amélioré des pages déjà diffusées est réutilisé
+        streamed = page_stream.records if page_stream is not None else []
+        with open(md_file, "w", encoding="utf-8") as f:
+            for position, page in enumerate(result.get("pages", [])):
+                f.write(f"### Page {page.get('index')}\n\n")
+                # Améliorer le formatage des tableaux et des expressions mathématiques
+                if position < len(streamed):
+                    page_markdown = streamed[position]["markdown"]
+                else:
+                    page_markdown = ocr._enhance_tables_and_math(page.get("markdown", ""))
+                f.write(page_markdown + "\n\n")
+        ocr_tasks[task_id]['result_paths']['md'] = md_file
+    
+    if 'html' in output_formats:
+        html_file = base_output + ".html"
+        ocr.generate_html_output(result, html_file)
+        ocr_tasks[task_id]['result_paths']['html'] = html_file
+    
+    if 'html-pages' in output_formats:
+        # Visionneuse paginée (/view/<task_id>/html-pages), avec la feuille de style partagée /assets/ocr.css
+        ocr_tasks[task_id]['result_paths']['html-pages'] = ocr.generate_paged_html_output(
+            result, base_output + "_pages", css_href=PAGED_VIEWER_CSS_URL)
+    
+    # Générer le PDF si demandé et si WeasyPrint est disponible
+    if 'pdf' in output_formats and WEASYPRINT_AVAILABLE:
+        pdf_file = base_output + ".pdf"
+        html_file = base_output + ".html"
         
-        # Vérifier la taille du fichier si un fichier est fourni
-        if file_path and os.path.exists(file_path):
-            file_size = os.path.getsize(file_path)
-            if file_size > app.config['MISTRAL_API_MAX_SIZE']:
-                ocr_tasks[task_id]['status'] = 'error'
-                ocr_tasks[task_id]['error'] = f"Le fichier est trop volumineux pour l'API Mistral. La taille maximale autorisée est de 52.4 Mo, mais votre fichier fait {file_size / (1024 * 1024):.1f} Mo. Veuillez réduire la taille du fichier ou le diviser en parties plus petites."
-                return
+        # S'assurer que le fichier HTML existe
+        if not os.path.exists(html_file) and 'html' not in output_formats:
+            ocr.generate_html_output(result, html_file)
         
-        # Mettre à jour la progression
-        for i in range(1, 11):
-            time.sleep(0.5)  # Simuler le traitement
-            ocr_tasks[task_id]['progress'] = i * 10
+        # Convertir HTML en PDF dans le pool de processus: la tâche se termine sans attendre le rendu,
+        # dont l'avancement est indiqué par pdf_status
+        ocr_tasks[task_id]['pdf_status'] = 'rendering'
+        current_span().add_event("pdf.submitted")
+        get_pdf_pool().submit(html_file, pdf_file).add_done_callback(
+            functools.partial(pdf_rendered, task_id, pdf_file))
+    elif 'pdf' in output_formats and not WEASYPRINT_AVAILABLE:
+        print(f"Impossible de générer le PDF car WeasyPrint n'est pas disponible")
+
+def pdf_rendered(task_id, pdf_file, future):
+    """Enregistre le résultat du rendu PDF d'une tâche (appelé à la fin du rendu)"""
+    try:
+        future.result()
+        ocr_tasks[task_id]['result_paths']['pdf'] = pdf_file
+        ocr_tasks[task_id]['pdf_status'] = 'completed'
+        print(f"PDF généré avec succès: {pdf_file}")
+    except Exception as e:
+        print(f"Erreur lors de la génération du PDF: {str(e)}")
+        ocr_tasks[task_id]['result_paths']['pdf'] = None
+        ocr_tasks[task_id].update({'pdf_status': 'error', 'pdf_error': str(e)})
+
+def fail_task(task_id, api_error):
+    """Marque une tâche en échec, avec un message adapté aux erreurs courantes de l'API"""
+    error_message = str(api_error)
+    print(f"Erreur détaillée de l'API: {error_message}")
+    
+    # Personnaliser le message d'erreur selon le type d'erreur
+    if "401" in error_message or "Unauthorized" in error_message:
+        error_message = "Erreur d'authentification avec l'API Mistral. Votre clé API semble être invalide ou ne dispose pas des autorisations nécessaires pour accéder au service OCR. Veuillez vérifier votre clé API ou contacter le support Mistral."
+    elif "520" in error_message and "Cloudflare" in error_message:
+        error_message = "Les serveurs de Mistral semblent temporairement indisponibles (Erreur Cloudflare 520). Veuillez réessayer plus tard. Si le problème persiste, contactez le support Mistral."
+    
+    ocr_tasks[task_id]['status'] = 'error'
+    ocr_tasks[task_id]['error'] = error_message
+
+def process_ocr(task_id, api_key, file_path=None, url=None, include_images=True, output_formats=None, optimize=False,
+                file_content=None, filename=None):
+    """Fonction pour traiter l'OCR en arrière-plan (fichier sur disque, fichier en mémoire ou URL)"""
+    try:
+        output_formats = prepare_task(task_id, output_formats, file_path, file_content, optimize)
+        if output_formats is None:
+            return
         
         # Vérifier si la clé API est fournie
-        if not api_key:
-            ocr_tasks[task_id]['status'] = 'error'
-            ocr_tasks[task_id]['error'] = "Clé API Mistral non configurée. Veuillez configurer votre clé API dans les paramètres."
+        if not check_api_key(task_id, api_key):
             return
-        
-        # Log pour le débogage (masqué pour la sécurité)
-        masked_key = api_key[:4] + '*' * (len(api_key) - 8) + api_key[-4:] if len(api_key) > 8 else api_key
-        print(f"Utilisation de la clé API: {masked_key}")
+        ocr_tasks[task_id]['progress'] = 10
         
         # Créer l'instance MistralOCR avec la clé API
         try:
-            ocr = MistralOCR(api_key)
+            optimizer = task_optimizer(optimize)
+            ocr = MistralOCR(api_key, optimizer=optimizer, page_store=get_page_store(), limiter=get_limiter(),
+                             hedger=get_hedger(), markdown_backend=app.config['MARKDOWN_BACKEND'],
+                             profiler=task_profiler(task_id), url_store=get_url_store())
             
             # Fonction pour effectuer une tentative avec mécanisme de nouvelle tentative
             def try_with_retry(operation_func, max_retries=3, initial_delay=2):
@@ -124,7 +655,8 @@ def process_ocr(task_id, api_key, file_path=None, url=None, include_images=True,
                 
                 while retries < max_retries:
                     try:
-                        return operation_func()
+                        with span("ocr.attempt", attempt=retries + 1):
+                            return operation_func()
                     except Exception as e:
                         last_error = e
                         error_str = str(e)
@@ -150,91 +682,37 @@ def process_ocr(task_id, api_key, file_path=None, url=None, include_images=True,
             # Traiter selon le type d'entrée avec mécanisme de nouvelle tentative
             if url:
                 result = try_with_retry(lambda: ocr.process_document_url(url, include_images))
-            elif file_path:
-                if file_path.lower().endswith(('.jpg', '.jpeg', '.png', '.gif')):
-                    result = try_with_retry(lambda: ocr.process_image_file(file_path, include_images))
+            elif file_content is not None or file_path:
+                # Un fichier en mémoire est transmis tel quel, sans passer par le disque
+                document = file_content if file_content is not None else file_path
+                filename = filename or os.path.basename(file_path).split('_', 1)[-1]
+                if is_image_name(filename):
+                    result = try_with_retry(lambda: ocr.process_image_file(document, include_images, file_name=filename))
                 else:
-                    result = try_with_retry(lambda: ocr.process_pdf_file(file_path, include_images))
+                    result = try_with_retry(lambda: ocr.process_pdf_file(document, include_images, file_name=filename))
             else:
                 raise ValueError("Aucun fichier ou URL fourni")
             
-            # Vérifier si une erreur s'est produite
-            if "error" in result:
-                ocr_tasks[task_id]['status'] = 'error'
-                ocr_tasks[task_id]['error'] = result["error"]
-                return
-            
-            # Préparer le chemin de base pour les fichiers de sortie
-            base_output = os.path.join(app.config['UPLOAD_FOLDER'], f"{task_id}")
-            
-            # Générer les différents formats de sortie
-            if 'json' in output_formats:
-                json_file = base_output + ".json"
-                with open(json_file, "w", encoding="utf-8") as f:
-                    json.dump(result, f, ensure_ascii=False, indent=2)
-                ocr_tasks[task_id]['result_paths']['json'] = json_file
-            
-            if 'md' in output_formats:
-                md_file = base_output + ".md"
-                with open(md_file, "w", encoding="utf-8") as f:
-                    for page in result.get("pages", []):
-                        f.write(f"### Page {page.get('index')}\n\n")
-                        # Améliorer le formatage des tableaux et des expressions mathématiques
-                        page_markdown = ocr._enhance_tables_and_math(page.get("markdown", ""))
-                        f.write(page_markdown + "\n\n")
-                ocr_tasks[task_id]['result_paths']['md'] = md_file
-            
-            if 'html' in output_formats:
-                html_file = base_output + ".html"
-                ocr.generate_html_output(result, html_file)
-                ocr_tasks[task_id]['result_paths']['html'] = html_file
-            
-            # Générer le PDF si demandé et si WeasyPrint est disponible
-            if 'pdf' in output_formats and WEASYPRINT_AVAILABLE:
-                pdf_file = base_output + ".pdf"
-                html_file = base_output + ".html"
-                
-                # S'assurer que le fichier HTML existe
-                if not os.path.exists(html_file) and 'html' not in output_formats:
-                    ocr.generate_html_output(result, html_file)
-                
-                # Convertir HTML en PDF
-                try:
-                    # Importer WeasyPrint ici pour éviter les problèmes d'importation
-                    from weasyprint import HTML
-                    HTML(filename=html_file).write_pdf(pdf_file)
-                    ocr_tasks[task_id]['result_paths']['pdf'] = pdf_file
-                    print(f"PDF généré avec succès: {pdf_file}")
-                except Exception as e:
-                    print(f"Erreur lors de la génération du PDF: {str(e)}")
-                    ocr_tasks[task_id]['result_paths']['pdf'] = None
-            elif 'pdf' in output_formats and not WEASYPRINT_AVAILABLE:
-                print(f"Impossible de générer le PDF car WeasyPrint n'est pas disponible")
-            
-            # Mettre à jour l'état de la tâche
-            ocr_tasks[task_id]['status'] = 'completed'
+            ocr_tasks[task_id]['progress'] = 90
+            write_task_outputs(task_id, ocr, result, output_formats, source=url or filename, optimizer=optimizer,
+                               owner=api_key_owner(api_key))
+            ocr_tasks[task_id]['progress'] = 100
             
         except Exception as api_error:
-            error_message = str(api_error)
-            print(f"Erreur détaillée de l'API: {error_message}")
-            
-            # Personnaliser le message d'erreur selon le type d'erreur
-            if "401" in error_message or "Unauthorized" in error_message:
-                error_message = "Erreur d'authentification avec l'API Mistral. Votre clé API semble être invalide ou ne dispose pas des autorisations nécessaires pour accéder au service OCR. Veuillez vérifier votre clé API ou contacter le support Mistral."
-            elif "520" in error_message and "Cloudflare" in error_message:
-                error_message = "Les serveurs de Mistral semblent temporairement indisponibles (Erreur Cloudflare 520). Veuillez réessayer plus tard. Si le problème persiste, contactez le support Mistral."
-            
-            ocr_tasks[task_id]['status'] = 'error'
-            ocr_tasks[task_id]['error'] = error_message
+            fail_task(task_id, api_error)
             return
         
     except Exception as e:
         print(f"Erreur générale: {str(e)}")
         ocr_tasks[task_id]['status'] = 'error'
         ocr_tasks[task_id]['error'] = str(e)
+    finally:
+        end_task_profiling(task_id)
 
 def test_api_key(api_key):
     """Teste la validité de la clé API Mistral avec plusieurs méthodes"""
+    import requests
+    
     try:
         print(f"Longueur de la clé API: {len(api_key)} caractères")
         print(f"Préfixe de la clé: {api_key[:6]}...")
@@ -378,6 +856,121 @@ def clear_api_key():
     flash("Clé API supprimée de la session", "success")
     return redirect(url_for('api_config'))
 
+def requested_options(payload=None, form=None):
+    """Formats de sortie et optimisation demandés (formulaire ou corps JSON; form remplace celui de la requête Flask)"""
+    payload = payload or {}
+    form = request.form if form is None else form
+    output_formats = list(payload.get('output_formats') or form.getlist('output_formats'))
+    if not output_formats:
+        output_formats = ['json', 'md', 'html']
+        if WEASYPRINT_AVAILABLE:
+            output_formats.append('pdf')
+    
+    # Optimisation locale avant envoi: configuration globale ou champ "optimize" du formulaire
+    optimize = app.config['OPTIMIZE_UPLOADS'] or str(payload.get('optimize', form.get('optimize', ''))).lower() in ('1', 'true', 'on', 'yes')
+    return output_formats, optimize
+
+def requested_profile(payload=None, form=None):
+    """Profilage demandé par le champ "profile" (formulaire ou corps JSON), si ALLOW_PROFILING l'autorise"""
+    payload = payload or {}
+    form = request.form if form is None else form
+    return app.config['ALLOW_PROFILING'] and str(payload.get('profile', form.get('profile', ''))).lower() in ('1', 'true', 'on', 'yes')
+
+def submit_url(api_key, url, output_formats, batch_id=None, start=start_job, profile=False):
+    """
+    Soumet une URL au traitement OCR (start lance le traitement, par défaut dans la file des traitements).
+    Retourne la réponse JSON et le code HTTP.
+    """
+    task_id = str(uuid.uuid4())
+    if batch_id is not None:
+        task_batches[task_id] = batch_id
+    
+    # Une soumission identique en cours est partagée au lieu de relancer l'OCR
+    key = job_key(api_key, 'url:' + url, True, output_formats, False, profile)
+    leader = claim_job(key, task_id)
+    if leader is not None:
+        return {'task_id': task_id, 'coalesced_with': leader}, 200
+    
+    # Démarrer le traitement OCR en arrière-plan
+    if profile:
+        profiled_tasks[task_id] = True
+    start(key, task_id, api_key, None, url, True, output_formats)
+    return {'task_id': task_id}, 200
+
+def submit_upload(api_key, file, output_formats, optimize, batch_id=None, start=start_job, profile=False):
+    """
+    Soumet un fichier envoyé au traitement OCR (start lance le traitement, par défaut dans la file des traitements).
+    Retourne la réponse JSON et le code HTTP.
+    """
+    if file.filename == '':
+        return {'error': 'Aucun fichier sélectionné'}, 400
+    
+    # Vérifier la taille du fichier (sans le lire)
+    try:
+        stream = file.stream
+        stream.seek(0, os.SEEK_END)
+        file_size = stream.tell()
+        stream.seek(0)  # Réinitialiser le curseur du fichier
+        
+        if file_size > app.config['MAX_CONTENT_LENGTH']:
+            return {'error': f'Le fichier est trop volumineux. La taille maximale autorisée est de {app.config["MAX_CONTENT_LENGTH"] // (1024 * 1024)} Mo.'}, 413
+        
+        # Vérifier également la limite de l'API Mistral (sauf si le fichier sera optimisé avant envoi)
+        if file_size > app.config['MISTRAL_API_MAX_SIZE'] and not optimize:
+            return {'error': f'Le fichier est trop volumineux pour l\'API Mistral. La taille maximale autorisée est de 52.4 Mo, mais votre fichier fait {file_size / (1024 * 1024):.1f} Mo. Veuillez réduire la taille du fichier ou le diviser en parties plus petites.'}, 413
+    except Exception as e:
+        return {'error': f'Erreur lors de la vérification du fichier: {str(e)}'}, 400
+    
+    if not allowed_file(file.filename):
+        return {'error': 'Type de fichier non autorisé'}, 400
+    
+    # Les fichiers courants sont lus une seule fois et transmis en mémoire; seuls les très
+    # gros fichiers sont enregistrés sur disque (tous si l'état est partagé: le traitement
+    # peut être pris par un autre processus)
+    content = None
+    digest = hashlib.sha256()
+    if file_size <= app.config['MEMORY_UPLOAD_MAX'] and shared_state is None:
+        content = stream.read()
+        digest.update(content)
+    else:
+        for chunk in iter(lambda: stream.read(1024 * 1024), b''):
+            digest.update(chunk)
+        stream.seek(0)
+    content_hash = digest.hexdigest()
+    
+    task_id = str(uuid.uuid4())
+    if batch_id is not None:
+        task_batches[task_id] = batch_id
+    
+    # Une soumission identique en cours (même fichier, mêmes options) est partagée:
+    # le fichier n'est ni enregistré ni envoyé une seconde fois
+    extension = file.filename.rsplit('.', 1)[1].lower()
+    key = job_key(api_key, f'file:{content_hash}.{extension}', True, output_formats, optimize, profile)
+    leader = claim_job(key, task_id)
+    if leader is not None:
+        return {'task_id': task_id, 'coalesced_with': leader}, 200
+    
+    filename = secure_filename(file.filename)
+    file_path = None
+    if content is None:
+        ensure_runtime_ready()
+        file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{task_id}_{filename}")
+        try:
+            with open(file_path, 'wb') as f:
+                shutil.copyfileobj(stream, f)
+        except Exception as e:
+            # Les tâches déjà rattachées à celle-ci échouent avec elle
+            ocr_tasks[task_id].update({'status': 'error', 'queued': False,
+                                       'error': f"Erreur lors de l'enregistrement du fichier: {str(e)}"})
+            notify_finished([task_id] + release_job(key))
+            return {'task_id': task_id, 'error': ocr_tasks[task_id]['error']}, 500
+    
+    # Démarrer le traitement OCR en arrière-plan
+    if profile:
+        profiled_tasks[task_id] = True
+    start(key, task_id, api_key, file_path, None, True, output_formats, optimize, content, filename)
+    return {'task_id': task_id}, 200
+
 @app.route('/process', methods=['POST'])
 def process():
     """Endpoint pour démarrer le traitement OCR"""
@@ -386,115 +979,398 @@ def process():
     if not api_key:
         return jsonify({'error': 'Clé API Mistral non configurée. Veuillez configurer votre clé API dans les paramètres.'}), 400
     
-    # Récupérer les formats de sortie demandés
-    output_formats = request.form.getlist('output_formats')
-    if not output_formats:
-        output_formats = ['json', 'md', 'html']
-        if WEASYPRINT_AVAILABLE:
-            output_formats.append('pdf')
-    
-    task_id = str(uuid.uuid4())
+    output_formats, optimize = requested_options()
+    profile = requested_profile()
     
     # Vérifier si une URL a été fournie
     url = request.form.get('url')
     if url and url.strip():
-        # Démarrer le traitement OCR en arrière-plan
-        thread = threading.Thread(target=process_ocr, args=(task_id, api_key, None, url.strip(), True, output_formats))
-        thread.daemon = True
-        thread.start()
-        return jsonify({'task_id': task_id})
+        response, code = submit_url(api_key, url.strip(), output_formats, profile=profile)
+        return jsonify(response), code
     
     # Vérifier si un fichier a été téléchargé
     if 'file' not in request.files:
         return jsonify({'error': 'Aucun fichier fourni'}), 400
     
-    file = request.files['file']
-    if file.filename == '':
-        return jsonify({'error': 'Aucun fichier sélectionné'}), 400
+    response, code = submit_upload(api_key, request.files['file'], output_formats, optimize, profile=profile)
+    return jsonify(response), code
+
+@app.route('/batch', methods=['POST'])
+def batch():
+    """
+    Endpoint de soumission d'un lot de fichiers et d'URL en une seule requête.
+    Accepte un formulaire multipart (champs "files" et "urls", répétables) ou un corps JSON
+    {"urls": [...]}, avec un champ "webhook_url" facultatif pour être notifié de chaque fin de traitement.
+    """
+    api_key = get_api_key()
+    if not api_key:
+        return jsonify({'error': 'Clé API Mistral non configurée. Veuillez configurer votre clé API dans les paramètres.'}), 400
     
-    # Vérifier la taille du fichier
-    try:
-        file_size = len(file.read())
-        file.seek(0)  # Réinitialiser le curseur du fichier
-        
-        if file_size > app.config['MAX_CONTENT_LENGTH']:
-            return jsonify({'error': f'Le fichier est trop volumineux. La taille maximale autorisée est de {app.config["MAX_CONTENT_LENGTH"] // (1024 * 1024)} Mo.'}), 413
-        
-        # Vérifier également la limite de l'API Mistral
-        if file_size > app.config['MISTRAL_API_MAX_SIZE']:
-            return jsonify({'error': f'Le fichier est trop volumineux pour l\'API Mistral. La taille maximale autorisée est de 52.4 Mo, mais votre fichier fait {file_size / (1024 * 1024):.1f} Mo. Veuillez réduire la taille du fichier ou le diviser en parties plus petites.'}), 413
-    except Exception as e:
-        return jsonify({'error': f'Erreur lors de la vérification du fichier: {str(e)}'}), 400
+    payload = request.get_json(silent=True) or {}
+    output_formats, optimize = requested_options(payload)
+    profile = requested_profile(payload)
     
-    if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{task_id}_{filename}")
-        file.save(file_path)
-        
-        # Démarrer le traitement OCR en arrière-plan
-        thread = threading.Thread(target=process_ocr, args=(task_id, api_key, file_path, None, True, output_formats))
-        thread.daemon = True
-        thread.start()
-        
-        return jsonify({'task_id': task_id})
+    urls = payload.get('urls') or [
+        line.strip() for value in request.form.getlist('urls') for line in value.splitlines()
+    ]
+    urls = [url.strip() for url in urls if url and url.strip()]
+    files = [file for file in request.files.getlist('files') if file.filename]
+    if not urls and not files:
+        return jsonify({'error': 'Aucun fichier ni URL fourni (champs "files" et "urls")'}), 400
+    if len(urls) + len(files) > app.config['BATCH_MAX_ITEMS']:
+        return jsonify({'error': f'Un lot est limité à {app.config["BATCH_MAX_ITEMS"]} documents'}), 400
+    
+    webhook_url = (payload.get('webhook_url') or request.form.get('webhook_url') or '').strip() or None
+    if webhook_url:
+        if not is_valid_webhook_url(webhook_url, app.config['WEBHOOK_ALLOWED_HOSTS']):
+            return jsonify({'error': "webhook_url doit être une URL http ou https vers une adresse publique "
+                                     "(ou un hôte de MISTRAL_OCR_WEBHOOK_ALLOWED_HOSTS)"}), 400
+        if not app.config['WEBHOOK_SECRET']:
+            return jsonify({'error': 'Les notifications sont désactivées: définissez MISTRAL_OCR_WEBHOOK_SECRET sur le serveur'}), 400
+    
+    batch_id = str(uuid.uuid4())
+    ocr_batches[batch_id] = {
+        'created_at': time.time(),
+        'webhook_url': webhook_url,
+        'tasks': [],
+        'rejected': [],
+        'finished': 0,
+        # Tant que le lot est en cours de soumission, sa fin n'est pas notifiée
+        'submitting': True,
+        'notified': False,
+    }
+    
+    items = [('url', url) for url in urls] + [('file', file) for file in files]
+    for kind, item in items:
+        if kind == 'url':
+            source = item
+            response, code = submit_url(api_key, item, output_formats, batch_id, profile=profile)
+        else:
+            source = item.filename
+            response, code = submit_upload(api_key, item, output_formats, optimize, batch_id, profile=profile)
+        with batches_lock:
+            if 'task_id' in response:
+                ocr_batches[batch_id]['tasks'].append({'task_id': response['task_id'], 'source': source})
+            else:
+                ocr_batches[batch_id]['rejected'].append({'source': source, 'error': response['error']})
+    
+    with batches_lock:
+        ocr_batches[batch_id]['submitting'] = False
+    notify_batch_if_done(batch_id)
+    
+    summary = batch_summary(batch_id)
+    return jsonify({'batch_id': batch_id, 'total': summary['total'], 'tasks': summary['tasks'],
+                    'rejected': summary['rejected']})
+
+@app.route('/batch/<batch_id>')
+def batch_status(batch_id):
+    """Endpoint de l'avancement global d'un lot"""
+    if batch_id not in ocr_batches:
+        return jsonify({'error': 'Lot non trouvé'}), 404
+    return jsonify(batch_summary(batch_id))
+
+def batch_summary(batch_id):
+    """Avancement global d'un lot: état de chaque tâche, compteurs et progression moyenne"""
+    batch = ocr_batches[batch_id]
+    with batches_lock:
+        entries = list(batch['tasks'])
+        rejected = list(batch['rejected'])
+    
+    tasks = []
+    counts = {'processing': 0, 'completed': 0, 'error': 0}
+    progress = 0
+    for entry in entries:
+        task = get_task(entry['task_id']) or {'status': 'processing', 'progress': 0}
+        counts[task['status']] = counts.get(task['status'], 0) + 1
+        progress += 100 if task['status'] in ('completed', 'error') else task.get('progress', 0)
+        tasks.append(dict(entry, status=task['status'], error=task.get('error')))
     
-    return jsonify({'error': 'Type de fichier non autorisé'}), 400
+    return {
+        'batch_id': batch_id,
+        'status': 'completed' if not batch['submitting'] and counts['processing'] == 0 else 'processing',
+        'total': len(entries),
+        'counts': counts,
+        'progress': round(progress / len(entries)) if entries else 100,
+        'tasks': tasks,
+        'rejected': rejected,
+    }
+
+def notify_finished(task_ids):
+    """Signale la fin de tâches aux lots auxquels elles appartiennent (notification par webhook)"""
+    for task_id in task_ids:
+        batch_id = task_batches.get(task_id)
+        if batch_id is None:
+            continue
+        with batches_lock:
+            batch = ocr_batches[batch_id]
+            batch['finished'] += 1
+        if batch['webhook_url']:
+            task = get_task(task_id) or {}
+            get_webhook_sender().send(batch['webhook_url'], {
+                'event': 'document.completed' if task.get('status') == 'completed' else 'document.failed',
+                'batch_id': batch_id,
+                'task_id': task_id,
+                'status': task.get('status'),
+                'error': task.get('error'),
+                'downloads': {fmt: f"/download/{task_id}/{fmt}"
+                              for fmt, path in task.get('result_paths', {}).items() if path},
+            })
+        notify_batch_if_done(batch_id)
+
+def notify_batch_if_done(batch_id):
+    """Envoie la notification de fin d'un lot, une seule fois, quand toutes ses tâches sont terminées"""
+    with batches_lock:
+        batch = ocr_batches[batch_id]
+        done = not batch['submitting'] and not batch['notified'] and batch['finished'] >= len(batch['tasks'])
+        if done:
+            batch['notified'] = True
+    if done and batch['webhook_url']:
+        summary = batch_summary(batch_id)
+        get_webhook_sender().send(batch['webhook_url'], {
+            'event': 'batch.completed',
+            'batch_id': batch_id,
+            'total': summary['total'],
+            'counts': summary['counts'],
+            'rejected': summary['rejected'],
+        })
+
+@app.route('/health')
+def health():
+    """Endpoint de disponibilité du processus (503 pendant son arrêt: un répartiteur de charge l'écarte)"""
+    if stopping.is_set():
+        return jsonify({'status': 'draining', 'pid': os.getpid()}), 503
+    return jsonify({'status': 'ok', 'pid': os.getpid()})
 
 @app.route('/status/<task_id>')
 def status(task_id):
     """Endpoint pour vérifier l'état d'une tâche OCR"""
-    if task_id not in ocr_tasks:
+    task = get_task(task_id)
+    if task is None:
+        return jsonify({'error': 'Tâche non trouvée'}), 404
+    
+    if task_id in task_aliases:
+        return jsonify(dict(task, coalesced_with=task_aliases[task_id]))
+    return jsonify(task)
+
+@app.route('/stream/<task_id>')
+def stream(task_id):
+    """
+    Endpoint de diffusion NDJSON des pages d'une tâche, au fur et à mesure de leur post-traitement.
+    Chaque ligne est un objet JSON (index, markdown, html, images); une ligne {"error": ...} termine
+    le flux si le traitement échoue.
+    """
+    page_stream = task_streams.get(task_aliases.get(task_id, task_id))
+    if page_stream is None:
         return jsonify({'error': 'Tâche non trouvée'}), 404
     
-    return jsonify(ocr_tasks[task_id])
+    def generate():
+        for record in page_stream.follow():
+            yield json.dumps(record, ensure_ascii=False) + "\n"
+        task = get_task(task_id)
+        if task is not None and task['status'] == 'error':
+            yield json.dumps({'error': task['error']}, ensure_ascii=False) + "\n"
+    
+    return Response(generate(), mimetype='application/x-ndjson', headers={'X-Accel-Buffering': 'no'})
 
 @app.route('/download/<task_id>/<format>')
 def download(task_id, format):
     """Endpoint pour télécharger le résultat OCR dans le format spécifié"""
-    if task_id not in ocr_tasks or ocr_tasks[task_id]['status'] != 'completed':
+    task = get_task(task_id)
+    if task is None or task['status'] != 'completed':
         return jsonify({'error': 'Résultat non disponible'}), 404
     
-    if format not in ocr_tasks[task_id]['result_paths']:
+    if format not in task['result_paths'] or format == 'html-pages':
         return jsonify({'error': f'Format {format} non disponible'}), 404
     
-    result_path = ocr_tasks[task_id]['result_paths'][format]
+    result_path = task['result_paths'][format]
     if result_path is None or not os.path.exists(result_path):
         return jsonify({'error': 'Fichier non disponible ou non trouvé'}), 404
     
     # Déterminer le nom du fichier à télécharger
-    download_name = f"ocr_result.{format}"
+    download_name = "ocr_profile.json" if format == 'profile' else f"ocr_result.{format}"
     
     return send_file(result_path, as_attachment=True, download_name=download_name)
 
 @app.route('/view/<task_id>/<format>')
 def view(task_id, format):
     """Endpoint pour visualiser le résultat OCR dans le format spécifié"""
-    if task_id not in ocr_tasks or ocr_tasks[task_id]['status'] != 'completed':
+    task = get_task(task_id)
+    if task is None or task['status'] != 'completed':
         return jsonify({'error': 'Résultat non disponible'}), 404
     
-    if format not in ocr_tasks[task_id]['result_paths'] or format not in ['html', 'pdf']:
+    if format not in task['result_paths'] or format not in ['html', 'html-pages', 'pdf']:
         return jsonify({'error': f'Format {format} non disponible pour la visualisation'}), 404
     
-    result_path = ocr_tasks[task_id]['result_paths'][format]
+    result_path = task['result_paths'][format]
     if result_path is None or not os.path.exists(result_path):
         return jsonify({'error': 'Fichier non disponible ou non trouvé'}), 404
     
     # Pour HTML et PDF, on peut les afficher directement dans le navigateur
     return send_file(result_path)
 
+@app.route('/view/<task_id>/pages/<path:filename>')
+def view_page(task_id, filename):
+    """Endpoint des fragments de page et des images de la visionneuse paginée"""
+    task = get_task(task_id)
+    index_file = task['result_paths'].get('html-pages') if task is not None else None
+    if index_file is None:
+        return jsonify({'error': 'Résultat non disponible'}), 404
+    return send_from_directory(os.path.join(os.path.dirname(index_file), 'pages'), filename)
+
+@app.route(PAGED_VIEWER_CSS_URL)
+def paged_viewer_css():
+    """Feuille de style partagée par les visionneuses paginées, mise en cache par le navigateur"""
+    response = Response(HTML_STYLE, mimetype='text/css')
+    response.cache_control.public = True
+    response.cache_control.max_age = 86400
+    response.add_etag()
+    return response.make_conditional(request)
+
+def search_owner():
+    """
+    Documents accessibles à l'appelant de /search: ceux traités avec la clé API de sa session,
+    ou tous avec la clé d'administration. Retourne (propriétaire ou None pour tous, autorisé).
+    """
+    admin_key = request.headers.get('X-Admin-Key', '')
+    if app.config['ADMIN_KEY'] and hmac.compare_digest(admin_key.encode('utf-8'), app.config['ADMIN_KEY'].encode('utf-8')):
+        return None, True
+    # La clé du fichier .env est commune à tous les visiteurs: elle ne désigne pas un utilisateur
+    api_key = session.get('mistral_api_key')
+    if not api_key:
+        return None, False
+    return api_key_owner(api_key), True
+
+@app.route('/search')
+def search():
+    """Endpoint de recherche plein texte dans les résultats OCR de l'utilisateur"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Paramètre de recherche "q" manquant'}), 400
+    
+    owner, allowed = search_owner()
+    if not allowed:
+        return jsonify({'error': "La recherche porte sur les documents traités avec votre clé API: "
+                                 "enregistrez-la d'abord dans la configuration"}), 403
+    
+    try:
+        limit = min(int(request.args.get('limit', 20)), 100)
+        offset = max(int(request.args.get('offset', 0)), 0)
+    except ValueError:
+        return jsonify({'error': 'Les paramètres "limit" et "offset" doivent être des entiers'}), 400
+    
+    start = time.perf_counter()
+    hits = get_search_index().search(query, limit=limit, offset=offset, owner=owner)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    
+    for hit in hits:
+        hit['task_id'] = hit.pop('doc_id')
+    
+    return jsonify({'query': query, 'results': hits, 'elapsed_ms': round(elapsed_ms, 2)})
+
+@app.route('/metrics')
+def metrics():
+    """Endpoint des mesures de la file des traitements et de la limite d'appels à l'API"""
+    limiter = get_limiter()
+    return jsonify({
+        'scheduler': get_scheduler().stats(),
+        'api_concurrency': limiter.stats() if limiter is not None else None,
+        'hedging': get_hedger().stats() if get_hedger() is not None else None,
+        'webhooks': get_webhook_sender().stats() if app.config['WEBHOOK_SECRET'] else None,
+        'pdf_rendering': get_pdf_pool().stats() if WEASYPRINT_AVAILABLE else None,
+    })
+
 @app.errorhandler(413)
 def request_entity_too_large(error):
     """Gestionnaire d'erreur pour les fichiers trop volumineux"""
     return jsonify({'error': f'Le fichier est trop volumineux. La taille maximale autorisée est de {app.config["MAX_CONTENT_LENGTH"] // (1024 * 1024)} Mo.'}), 413
 
+def listening_socket(host, port):
+    """
+    Socket d'écoute que plusieurs processus peuvent ouvrir sur le même port (SO_REUSEPORT):
+    le noyau leur répartit les connexions, et un processus remplaçant démarre avant l'arrêt de l'ancien.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if hasattr(socket, 'SO_REUSEPORT'):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    return sock
+
+def stop_accepting(server):
+    """Ferme le socket d'écoute de waitress: les nouvelles connexions vont aux autres processus"""
+    server.del_channel()
+    server.socket.close()
+
+def drain_and_stop(server=None):
+    """Termine les traitements en cours, les rendus PDF et les notifications, puis arrête le serveur"""
+    if server is not None:
+        # Fermeture exécutée dans la boucle du serveur, entre deux attentes sur les sockets
+        server.trigger.pull_trigger(functools.partial(stop_accepting, server))
+    timeout = app.config['DRAIN_TIMEOUT']
+    deadline = time.monotonic() + timeout
+    print(f"Arrêt demandé: fin des traitements en cours (au plus {timeout:.0f} s)...")
+    if not get_scheduler().drain(timeout):
+        if shared_state is not None:
+            print("Traitements inachevés remis dans la file commune: un autre processus les reprendra.")
+        else:
+            print("ATTENTION: des traitements étaient encore en cours et sont interrompus.")
+    if WEASYPRINT_AVAILABLE:
+        get_pdf_pool().wait_idle(max(0.0, deadline - time.monotonic()))
+    if app.config['WEBHOOK_SECRET']:
+        get_webhook_sender().wait_idle(max(0.0, deadline - time.monotonic()))
+    print("Arrêt du serveur.")
+    # Le gestionnaire de SIGTERM interrompt alors la boucle du serveur dans le thread principal
+    drained.set()
+    os.kill(os.getpid(), signal.SIGTERM)
+
+def handle_sigterm(server=None):
+    """
+    Arrêt propre sur SIGTERM: le processus n'accepte plus de connexions (elles vont aux autres
+    processus), termine ses traitements puis s'arrête.
+    """
+    def handler(signum, frame):
+        if drained.is_set():
+            raise SystemExit(0)
+        if stopping.is_set():
+            return
+        stopping.set()
+        threading.Thread(target=drain_and_stop, args=(server,), daemon=True).start()
+    signal.signal(signal.SIGTERM, handler)
+
+def write_pid_file():
+    """Écrit le PID du processus dans PID_FILE (restart.sh attend ce fichier pour arrêter l'ancien processus)"""
+    if app.config['PID_FILE']:
+        with open(app.config['PID_FILE'], 'w') as f:
+            f.write(str(os.getpid()))
+
 if __name__ == '__main__':
+    ensure_runtime_ready()
+    print_pdf_status()
+    
+    if shared_state is not None:
+        shared_state.prune(app.config['STATE_RETENTION_HOURS'] * 3600)
+        # Prendre part dès maintenant aux traitements de la file commune
+        get_scheduler().start()
+        print(f"État partagé: {app.config['SHARED_STATE']} (processus {shared_state.owner})")
+    
     # Utiliser waitress pour le serveur de production, plus stable que le serveur de développement Flask
     try:
-        from waitress import serve
+        from waitress import create_server
+        import logging
         print("Démarrage du serveur avec Waitress...")
-        serve(app, host='0.0.0.0', port=5001)
+        logging.basicConfig()
+        if shared_state is not None:
+            server = create_server(app, sockets=[listening_socket('0.0.0.0', app.config['PORT'])])
+        else:
+            server = create_server(app, host='0.0.0.0', port=app.config['PORT'])
+        server.print_listen("Serving on http://{}:{}")
+        handle_sigterm(server)
+        write_pid_file()
+        server.run()
     except ImportError:
         print("Waitress n'est pas installé, utilisation du serveur de développement Flask.")
         print("AVERTISSEMENT: L'application est accessible à toutes les interfaces réseau.")
         print("Pour des raisons de sécurité, utilisez cette configuration uniquement pour le développement.")
-        app.run(host='0.0.0.0', port=5001, debug=False) 
\ No newline at end of file
+        handle_sigterm()
+        write_pid_file()
+        app.run(host='0.0.0.0', port=app.config['PORT'], debug=False)
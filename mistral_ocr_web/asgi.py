@@ -0,0 +1,264 @@
+"""
+Point d'entrée ASGI de l'application web (Quart), avec les mêmes routes que app.py pour le traitement:
+/process, /status, /stream, /download, /view et /api-config.
+Les appels à l'API Mistral passent par les méthodes asynchrones du client: une seule boucle
+d'événements sert des milliers de connexions simultanées (envois, suivis, téléchargements)
+sans bloquer un thread par connexion. L'état des tâches reste celui d'app.py (en mémoire, ou
+partagé entre processus avec MISTRAL_OCR_SHARED_STATE).
+
+Démarrage: python asgi.py, ou hypercorn asgi:app --bind 0.0.0.0:5002
+"""
+
+import os
+import sys
+import json
+import asyncio
+import functools
+from quart import (Quart, Response, render_template, request, jsonify, send_file, send_from_directory, url_for,
+                   redirect, session, flash)
+
+# Les traitements et l'état des tâches sont partagés avec l'application Flask
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import app as web
+from app import MistralOCR, HTML_STYLE, PAGED_VIEWER_CSS_URL, WEASYPRINT_AVAILABLE, ocr_tasks, task_aliases, task_streams
+
+app = Quart(__name__)
+# Même clé de sessions que l'application Flask (FLASK_SECRET_KEY ou état partagé)
+app.secret_key = web.app.secret_key
+app.config['MAX_CONTENT_LENGTH'] = web.app.config['MAX_CONTENT_LENGTH']
+
+# Traitements lancés sur la boucle d'événements (gardés ici jusqu'à leur fin)
+background_jobs = set()
+
+@functools.lru_cache(maxsize=None)
+def get_job_slots():
+    """Limite le nombre de traitements simultanés à OCR_WORKERS (créée sur la boucle d'événements au premier usage)"""
+    return asyncio.Semaphore(web.app.config['OCR_WORKERS'])
+
+def get_api_key():
+    """Récupère la clé API Mistral, en priorité depuis la session utilisateur"""
+    return session.get('mistral_api_key') or os.environ.get("MISTRAL_API_KEY")
+
+def job_starter(loop):
+    """Fonction de lancement des traitements sur la boucle d'événements, appelable depuis un thread"""
+    def start(key, task_id, *args):
+        future = asyncio.run_coroutine_threadsafe(run_async_job(key, task_id, *args), loop)
+        background_jobs.add(future)
+        future.add_done_callback(background_jobs.discard)
+    return start
+
+async def run_async_job(key, task_id, *args):
+    """Équivalent asynchrone de run_single_flight, dans la limite des traitements simultanés"""
+    try:
+        async with get_job_slots():
+            with web.span("ocr.task", task_id=task_id):
+                await process_ocr_async(task_id, *args)
+    finally:
+        task_streams[task_id].close()
+        web.notify_finished([task_id] + web.release_job(key))
+
+async def process_ocr_async(task_id, api_key, file_path=None, url=None, include_images=True, output_formats=None,
+                            optimize=False, file_content=None, filename=None):
+    """
+    Équivalent asynchrone de process_ocr: l'OCR attend l'API sans occuper de thread, la génération
+    des fichiers de sortie s'exécute dans un thread.
+    """
+    try:
+        output_formats = web.prepare_task(task_id, output_formats, file_path, file_content, optimize)
+        if output_formats is None or not web.check_api_key(task_id, api_key):
+            return
+
+        optimizer = web.task_optimizer(optimize)
+        ocr = MistralOCR(api_key, optimizer=optimizer, page_store=web.get_page_store(), validate_key=False,
+                         markdown_backend=web.app.config['MARKDOWN_BACKEND'], profiler=web.task_profiler(task_id),
+                         url_store=web.get_url_store())
+        ocr_tasks[task_id]['progress'] = 10
+
+        if url:
+            result = await ocr.process_document_url_async(url, include_images)
+        elif file_content is not None or file_path:
+            document = file_content if file_content is not None else file_path
+            filename = filename or os.path.basename(file_path).split('_', 1)[-1]
+            if web.is_image_name(filename):
+                result = await ocr.process_image_file_async(document, include_images, file_name=filename)
+            else:
+                result = await ocr.process_pdf_file_async(document, include_images, file_name=filename)
+        else:
+            raise ValueError("Aucun fichier ou URL fourni")
+
+        ocr_tasks[task_id]['progress'] = 90
+        await asyncio.to_thread(web.write_task_outputs, task_id, ocr, result, output_formats,
+                                url or filename, optimizer, web.api_key_owner(api_key))
+        ocr_tasks[task_id]['progress'] = 100
+    except Exception as api_error:
+        web.fail_task(task_id, api_error)
+    finally:
+        web.end_task_profiling(task_id)
+
+@app.before_serving
+async def startup():
+    """Charge le fichier .env et crée le dossier d'upload avant la première requête"""
+    web.ensure_runtime_ready()
+    web.print_pdf_status()
+
+@app.route('/')
+async def index():
+    """Page d'accueil"""
+    return await render_template('index.html', has_api_key=bool(get_api_key()), pdf_available=WEASYPRINT_AVAILABLE)
+
+@app.route('/api-config', methods=['GET', 'POST'])
+async def api_config():
+    """Page de configuration de la clé API"""
+    if request.method == 'POST':
+        form = await request.form
+        api_key = form.get('api_key', '').strip()
+
+        if not api_key:
+            await flash("Veuillez entrer une clé API valide", "error")
+            return redirect(url_for('api_config'))
+
+        # Le test de la clé fait des requêtes bloquantes: il s'exécute dans un thread
+        is_valid, message = await asyncio.to_thread(web.test_api_key, api_key)
+        if not is_valid:
+            error_html = message.replace('\n', '<br>')
+            await flash(f"La clé API n'est pas valide: {error_html}", "error")
+            return redirect(url_for('api_config'))
+
+        session['mistral_api_key'] = api_key
+        await flash("Clé API enregistrée avec succès", "success")
+        return redirect(url_for('index'))
+
+    # Afficher seulement les 4 premiers et 4 derniers caractères de la clé de la session
+    current_api_key = session.get('mistral_api_key', '')
+    masked_api_key = current_api_key
+    if len(current_api_key) > 8:
+        masked_api_key = current_api_key[:4] + '*' * (len(current_api_key) - 8) + current_api_key[-4:]
+
+    return await render_template('api_config.html', masked_api_key=masked_api_key)
+
+@app.route('/clear-api-key', methods=['POST'])
+async def clear_api_key():
+    """Effacer la clé API de la session"""
+    session.pop('mistral_api_key', None)
+    await flash("Clé API supprimée de la session", "success")
+    return redirect(url_for('api_config'))
+
+@app.route('/process', methods=['POST'])
+async def process():
+    """Endpoint pour démarrer le traitement OCR"""
+    api_key = get_api_key()
+    if not api_key:
+        return jsonify({'error': 'Clé API Mistral non configurée. Veuillez configurer votre clé API dans les paramètres.'}), 400
+
+    form = await request.form
+    output_formats, optimize = web.requested_options(form=form)
+    profile = web.requested_profile(form=form)
+    start = job_starter(asyncio.get_running_loop())
+
+    url = form.get('url')
+    if url and url.strip():
+        response, code = web.submit_url(api_key, url.strip(), output_formats, start=start, profile=profile)
+        return jsonify(response), code
+
+    files = await request.files
+    if 'file' not in files:
+        return jsonify({'error': 'Aucun fichier fourni'}), 400
+
+    # Lecture, empreinte et éventuel enregistrement du fichier dans un thread
+    response, code = await asyncio.to_thread(web.submit_upload, api_key, files['file'], output_formats, optimize,
+                                             start=start, profile=profile)
+    return jsonify(response), code
+
+@app.route('/status/<task_id>')
+async def status(task_id):
+    """Endpoint pour vérifier l'état d'une tâche OCR"""
+    task = web.get_task(task_id)
+    if task is None:
+        return jsonify({'error': 'Tâche non trouvée'}), 404
+
+    if task_id in task_aliases:
+        return jsonify(dict(task, coalesced_with=task_aliases[task_id]))
+    return jsonify(task)
+
+@app.route('/stream/<task_id>')
+async def stream(task_id):
+    """Endpoint de diffusion NDJSON des pages d'une tâche (voir app.py)"""
+    page_stream = task_streams.get(task_aliases.get(task_id, task_id))
+    if page_stream is None:
+        return jsonify({'error': 'Tâche non trouvée'}), 404
+
+    async def generate():
+        async for record in page_stream.follow_async():
+            yield (json.dumps(record, ensure_ascii=False) + "\n").encode('utf-8')
+        task = web.get_task(task_id)
+        if task is not None and task['status'] == 'error':
+            yield (json.dumps({'error': task['error']}, ensure_ascii=False) + "\n").encode('utf-8')
+
+    return generate(), 200, {'Content-Type': 'application/x-ndjson', 'X-Accel-Buffering': 'no'}
+
+def result_path_for(task_id, format, formats=None):
+    """Chemin du résultat d'une tâche terminée, ou (réponse d'erreur, code) s'il n'est pas disponible"""
+    task = web.get_task(task_id)
+    if task is None or task['status'] != 'completed':
+        return None, ({'error': 'Résultat non disponible'}, 404)
+
+    if format not in task['result_paths'] or (formats is not None and format not in formats):
+        suffix = ' pour la visualisation' if formats is not None else ''
+        return None, ({'error': f'Format {format} non disponible{suffix}'}, 404)
+
+    result_path = task['result_paths'][format]
+    if result_path is None or not os.path.exists(result_path):
+        return None, ({'error': 'Fichier non disponible ou non trouvé'}, 404)
+    return result_path, None
+
+@app.route('/download/<task_id>/<format>')
+async def download(task_id, format):
+    """Endpoint pour télécharger le résultat OCR dans le format spécifié"""
+    result_path, error = result_path_for(task_id, format)
+    if error is None and format == 'html-pages':
+        error = ({'error': f'Format {format} non disponible'}, 404)
+    if error is not None:
+        return jsonify(error[0]), error[1]
+    response = await send_file(result_path)
+    download_name = 'ocr_profile.json' if format == 'profile' else f'ocr_result.{format}'
+    response.headers['Content-Disposition'] = f'attachment; filename={download_name}'
+    return response
+
+@app.route('/view/<task_id>/<format>')
+async def view(task_id, format):
+    """Endpoint pour visualiser le résultat OCR dans le format spécifié"""
+    result_path, error = result_path_for(task_id, format, formats=['html', 'html-pages', 'pdf'])
+    if error is not None:
+        return jsonify(error[0]), error[1]
+    return await send_file(result_path)
+
+@app.route('/view/<task_id>/pages/<path:filename>')
+async def view_page(task_id, filename):
+    """Endpoint des fragments de page et des images de la visionneuse paginée"""
+    task = web.get_task(task_id)
+    index_file = task['result_paths'].get('html-pages') if task is not None else None
+    if index_file is None:
+        return jsonify({'error': 'Résultat non disponible'}), 404
+    return await send_from_directory(os.path.join(os.path.dirname(index_file), 'pages'), filename)
+
+@app.route(PAGED_VIEWER_CSS_URL)
+async def paged_viewer_css():
+    """Feuille de style partagée par les visionneuses paginées, mise en cache par le navigateur"""
+    response = Response(HTML_STYLE, mimetype='text/css')
+    response.cache_control.public = True
+    response.cache_control.max_age = 86400
+    return response
+
+@app.errorhandler(413)
+async def request_entity_too_large(error):
+    """Gestionnaire d'erreur pour les fichiers trop volumineux"""
+    return jsonify({'error': f'Le fichier est trop volumineux. La taille maximale autorisée est de {app.config["MAX_CONTENT_LENGTH"] // (1024 * 1024)} Mo.'}), 413
+
+if __name__ == '__main__':
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    config = Config()
+    config.bind = [f"0.0.0.0:{os.environ.get('MISTRAL_OCR_ASGI_PORT', 5002)}"]
+    print("Démarrage du serveur ASGI avec Hypercorn...")
+    asyncio.run(serve(app, config))
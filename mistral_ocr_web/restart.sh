@@ -5,5 +5,9 @@ pip install -r requirements.txt
 
 # Redémarrer le serveur
 echo "Redémarrage du serveur..."
-pkill -f "python app.py" || true
+# SIGTERM: le serveur termine ses traitements en cours avant de s'arrêter
+pkill -TERM -f "python app.py" || true
+while pgrep -f "python app.py" > /dev/null; do
+    sleep 1
+done
 python app.py
\ No newline at end of file
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Contrôle des appels à l'API Mistral.
+AdaptiveLimiter ajuste le nombre d'appels simultanés (AIMD): la limite augmente d'une unité
+par « tour » d'appels réussis tant que la latence reste saine, et elle est divisée sur une
+erreur 429 (limitation de débit), sur une erreur 5xx, ou quand le p95 de la latence s'écarte
+trop de la latence de référence.
+HedgedCaller relance en double un appel anormalement lent et garde la première réponse,
+dans la limite d'un budget d'appels supplémentaires. Avec une limite adaptative, le doublon
+n'est lancé que si une place est libre: il ne doit pas attendre derrière l'appel lent.
+"""
+
+import re
+import time
+import threading
+import contextlib
+import contextvars
+import concurrent.futures
+from collections import deque
+from typing import Callable, Dict, Any, Optional
+
+from ocr_trace import current_span
+
+_STATUS_PATTERN = re.compile(r"\b(429|5\d\d)\b")
+
+
+def error_status(error: Exception) -> Optional[int]:
+    """
+    Retrouve le code HTTP d'une erreur de l'API.
+
+    Args:
+        error: Exception levée par le client Mistral
+
+    Returns:
+        Code HTTP 429 ou 5xx, ou None pour les autres erreurs
+    """
+    for candidate in (error, getattr(error, "response", None)):
+        status = getattr(candidate, "status_code", None)
+        if isinstance(status, int):
+            return status if status == 429 or status >= 500 else None
+    match = _STATUS_PATTERN.search(str(error))
+    return int(match.group(1)) if match else None
+
+
+class AdaptiveLimiter:
+    """Limite le nombre d'appels simultanés et l'ajuste selon la latence et les erreurs observées."""
+
+    def __init__(self, initial_limit: int = 4, min_limit: int = 1, max_limit: int = 16,
+                 latency_tolerance: float = 2.0, window: int = 20, backoff: float = 0.5):
+        """
+        Prépare le contrôleur.
+
+        Args:
+            initial_limit: Nombre d'appels simultanés au départ
+            min_limit: Limite minimale
+            max_limit: Limite maximale
+            latency_tolerance: Rapport maximal entre le p95 récent et la latence médiane de référence
+            window: Nombre d'appels récents pris en compte pour les percentiles
+            backoff: Facteur appliqué à la limite lors d'une réduction
+        """
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.latency_tolerance = latency_tolerance
+        self.backoff = backoff
+
+        self._condition = threading.Condition()
+        self._limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self._in_flight = 0
+        self._latencies = deque(maxlen=max(5, window))
+        # Plus faible latence médiane observée: référence d'une API non saturée
+        self._baseline: Optional[float] = None
+        self._last_decrease = 0.0
+        self._counts = {"calls": 0, "errors": 0, "throttled": 0, "server_errors": 0,
+                        "increases": 0, "decreases": 0}
+
+    @property
+    def limit(self) -> int:
+        """Nombre d'appels simultanés actuellement autorisés."""
+        return int(self._limit)
+
+    def try_acquire(self) -> bool:
+        """
+        Réserve une place sans attendre.
+
+        Returns:
+            True si une place a été réservée (à utiliser avec slot(reserved=True))
+        """
+        with self._condition:
+            if self._in_flight >= int(self._limit):
+                return False
+            self._in_flight += 1
+            return True
+
+    @contextlib.contextmanager
+    def slot(self, reserved: bool = False):
+        """
+        Attend une place libre, puis mesure l'appel exécuté dans le bloc.
+
+        Args:
+            reserved: La place a déjà été réservée avec try_acquire
+        """
+        if not reserved:
+            with self._condition:
+                while self._in_flight >= int(self._limit):
+                    self._condition.wait()
+                self._in_flight += 1
+        start = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            self._on_error(e)
+            raise
+        else:
+            self._on_success(time.monotonic() - start)
+        finally:
+            with self._condition:
+                self._in_flight -= 1
+                self._condition.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Retourne la limite actuelle et les mesures récentes.
+
+        Returns:
+            Limite, appels en cours, latences p50/p95 récentes et compteurs
+        """
+        with self._condition:
+            stats = dict(self._counts)
+            stats.update({"limit": int(self._limit), "in_flight": self._in_flight})
+            latencies = sorted(self._latencies)
+            baseline = self._baseline
+        if latencies:
+            stats["latency_p50_ms"] = round(latencies[len(latencies) // 2] * 1000)
+            stats["latency_p95_ms"] = round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000)
+        if baseline is not None:
+            stats["baseline_ms"] = round(baseline * 1000)
+        return stats
+
+    def _on_success(self, latency: float):
+        """Enregistre un appel réussi et ajuste la limite."""
+        with self._condition:
+            self._counts["calls"] += 1
+            self._latencies.append(latency)
+            if len(self._latencies) >= 5:
+                ordered = sorted(self._latencies)
+                p50 = ordered[len(ordered) // 2]
+                p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+                self._baseline = p50 if self._baseline is None else min(self._baseline, p50)
+                if p95 > self.latency_tolerance * self._baseline:
+                    self._decrease()
+                    return
+            # Augmentation additive (+1 par tour complet d'appels), seulement si la limite est atteinte
+            if self._in_flight >= int(self._limit) and self._limit < self.max_limit:
+                previous = int(self._limit)
+                self._limit = min(self.max_limit, self._limit + 1.0 / self._limit)
+                if int(self._limit) > previous:
+                    self._counts["increases"] += 1
+                    self._condition.notify_all()
+
+    def _on_error(self, error: Exception):
+        """Enregistre un appel en échec et réduit la limite si l'API est saturée."""
+        status = error_status(error)
+        with self._condition:
+            self._counts["calls"] += 1
+            self._counts["errors"] += 1
+            if status is None:
+                return
+            self._counts["throttled" if status == 429 else "server_errors"] += 1
+            self._decrease()
+
+    def _decrease(self):
+        """Réduction multiplicative, au plus une fois par latence médiane (appelé sous le verrou)."""
+        now = time.monotonic()
+        cooldown = self._baseline if self._baseline is not None else 1.0
+        if now - self._last_decrease < cooldown:
+            return
+        self._last_decrease = now
+        self._limit = max(float(self.min_limit), self._limit * self.backoff)
+        self._counts["decreases"] += 1
+        # Les latences mesurées avant la réduction ne reflètent plus la charge actuelle
+        self._latencies.clear()
+
+
+class HedgedCaller:
+    """Exécute des appels idempotents en relançant un doublon quand la réponse tarde."""
+
+    def __init__(self, percentile: float = 0.95, budget: float = 0.05, min_samples: int = 20,
+                 min_delay: float = 0.5, window: int = 200):
+        """
+        Prépare la relance des appels lents.
+
+        Args:
+            percentile: Percentile des latences récentes au-delà duquel un doublon est lancé
+            budget: Part maximale d'appels doublés (ex: 0.05 pour au plus 5 % d'appels en plus)
+            min_samples: Nombre d'appels mesurés avant d'autoriser les doublons
+            min_delay: Délai minimal en secondes avant un doublon
+            window: Nombre d'appels récents pris en compte pour le percentile
+        """
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=max(min_samples, window))
+        self._counts = {"calls": 0, "hedged": 0, "hedge_wins": 0, "hedges_skipped": 0}
+
+    def call(self, func: Callable, *args, **kwargs):
+        """
+        Appelle func, et lance un doublon si la réponse dépasse le percentile des latences récentes.
+
+        Args:
+            func: Appel à exécuter (doit pouvoir être répété sans effet de bord)
+            *args, **kwargs: Arguments de l'appel
+
+        Returns:
+            Résultat du premier appel réussi (l'erreur de l'appel initial si les deux échouent)
+        """
+        return self.call_limited(None, func, *args, **kwargs)
+
+    def call_limited(self, limiter: Optional[AdaptiveLimiter], func: Callable, *args, **kwargs):
+        """
+        Comme call, chaque tentative occupant une place de la limite adaptative. L'appel initial
+        attend sa place; le doublon n'est lancé que si une place est libre tout de suite, sinon
+        il est abandonné et son budget rendu.
+
+        Args:
+            limiter: Limite des appels simultanés (None: sans limite)
+            func: Appel à exécuter (doit pouvoir être répété sans effet de bord)
+            *args, **kwargs: Arguments de l'appel
+
+        Returns:
+            Résultat du premier appel réussi (l'erreur de l'appel initial si les deux échouent)
+        """
+        start = time.monotonic()
+        delay = self._hedge_delay()
+        with self._lock:
+            self._counts["calls"] += 1
+        if delay is None:
+            result = _limited(limiter, func, args, kwargs)
+            self._record(time.monotonic() - start)
+            return result
+
+        primary = _start_attempt(_limited, (limiter, func, args, kwargs), {})
+        try:
+            result = primary.result(timeout=delay)
+            self._record(time.monotonic() - start)
+            return result
+        except concurrent.futures.TimeoutError:
+            pass
+
+        if not self._take_budget():
+            result = primary.result()
+            self._record(time.monotonic() - start)
+            return result
+        # Limite atteinte (souvent la cause de la lenteur): le doublon attendrait derrière l'appel lent
+        if limiter is not None and not limiter.try_acquire():
+            self._return_budget()
+            current_span().add_event("hedge_skipped", delay_ms=round(delay * 1000))
+            result = primary.result()
+            self._record(time.monotonic() - start)
+            return result
+
+        # La requête la plus lente est abandonnée: son résultat sera simplement ignoré
+        current_span().add_event("hedge", delay_ms=round(delay * 1000))
+        hedge = _start_attempt(_limited, (limiter, func, args, kwargs), {"reserved": True})
+        pending = {primary, hedge}
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    self._record(time.monotonic() - start)
+                    if future is hedge:
+                        current_span().add_event("hedge_won")
+                        with self._lock:
+                            self._counts["hedge_wins"] += 1
+                    return future.result()
+        return primary.result()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Retourne le nombre d'appels doublés et le délai de relance actuel.
+
+        Returns:
+            Compteurs et délai de relance en ms (None tant que les mesures sont insuffisantes)
+        """
+        delay = self._hedge_delay()
+        with self._lock:
+            stats = dict(self._counts)
+        stats["hedge_delay_ms"] = round(delay * 1000) if delay is not None else None
+        return stats
+
+    def _hedge_delay(self) -> Optional[float]:
+        """Délai avant un doublon, ou None tant que les latences mesurées sont trop peu nombreuses."""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        return max(self.min_delay, ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile))])
+
+    def _take_budget(self) -> bool:
+        """Réserve un doublon si le budget le permet."""
+        with self._lock:
+            if self._counts["hedged"] + 1 > self.budget * self._counts["calls"]:
+                return False
+            self._counts["hedged"] += 1
+            return True
+
+    def _return_budget(self):
+        """Rend un doublon réservé mais non lancé."""
+        with self._lock:
+            self._counts["hedged"] -= 1
+            self._counts["hedges_skipped"] += 1
+
+    def _record(self, latency: float):
+        """Enregistre la latence d'un appel réussi."""
+        with self._lock:
+            self._latencies.append(latency)
+
+
+def _limited(limiter: Optional[AdaptiveLimiter], func: Callable, args: tuple, kwargs: dict,
+             reserved: bool = False):
+    """Exécute func dans une place de la limite adaptative (déjà réservée si reserved), ou directement sans limite."""
+    if limiter is None:
+        return func(*args, **kwargs)
+    with limiter.slot(reserved=reserved):
+        return func(*args, **kwargs)
+
+
+def _start_attempt(func: Callable, args: tuple, kwargs: dict) -> concurrent.futures.Future:
+    """
+    Lance un appel dans un thread démon (un appel abandonné ne bloque pas l'arrêt du programme).
+
+    Returns:
+        Future du résultat de l'appel
+    """
+    future = concurrent.futures.Future()
+
+    def run():
+        try:
+            future.set_result(func(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+
+    # Le thread hérite du contexte de l'appelant (span en cours)
+    threading.Thread(target=contextvars.copy_context().run, args=(run,), daemon=True).start()
+    return future
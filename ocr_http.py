@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Requêtes HTTP sortantes vers des URL fournies par les utilisateurs (cache des URL, webhooks).
+Une telle URL ne doit pas permettre d'atteindre le serveur lui-même, le réseau interne ou le
+service de métadonnées du nuage (169.254.169.254): l'adresse effectivement connectée est
+vérifiée à chaque connexion, redirections comprises. La vérification porte sur le socket et
+non sur la résolution DNS, ce qui couvre aussi un nom qui change d'adresse entre les deux.
+Seuls http et https sont acceptés, sans proxy (l'adresse vérifiée serait celle du proxy).
+"""
+
+import socket
+import ipaddress
+import http.client
+import urllib.request
+from urllib.parse import urlparse
+
+
+class BlockedAddressError(OSError):
+    """Connexion refusée vers une adresse non publique (boucle locale, réseau privé, lien local...)."""
+
+
+def is_public_address(address: str) -> bool:
+    """
+    Indique si une adresse IP est routable sur Internet.
+
+    Args:
+        address: Adresse IPv4 ou IPv6 (éventuellement avec un identifiant de zone "%eth0")
+
+    Returns:
+        False pour la boucle locale, les réseaux privés, le lien local, les adresses réservées...
+    """
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if ip.version == 6 and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+def _public_connection(address, *args, **kwargs) -> socket.socket:
+    """socket.create_connection, refusé si l'adresse connectée n'est pas publique."""
+    sock = socket.create_connection(address, *args, **kwargs)
+    peer = sock.getpeername()[0]
+    if not is_public_address(peer):
+        sock.close()
+        raise BlockedAddressError(f"Adresse non publique refusée: {address[0]} ({peer})")
+    return sock
+
+
+class _PublicHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _public_connection
+
+
+class _PublicHTTPSConnection(http.client.HTTPSConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Vérifiée avant la négociation TLS
+        self._create_connection = _public_connection
+
+
+class _PublicHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(_PublicHTTPConnection, req)
+
+
+class _PublicHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(_PublicHTTPSConnection, req, context=self._context)
+
+
+def open_url(request: urllib.request.Request, timeout: float, allow_private: bool = False):
+    """
+    Équivalent de urllib.request.urlopen pour une URL fournie par un utilisateur.
+
+    Args:
+        request: Requête à envoyer (http ou https)
+        timeout: Délai maximal de connexion et de chaque lecture, en secondes
+        allow_private: Accepter aussi les adresses non publiques (URL choisie par l'opérateur)
+
+    Returns:
+        Réponse HTTP (lève urllib.error.URLError si l'adresse est refusée)
+    """
+    if urlparse(request.full_url).scheme not in ("http", "https"):
+        raise ValueError(f"Seules les URL http et https sont acceptées: {request.full_url}")
+    if allow_private:
+        handlers = [urllib.request.HTTPHandler(), urllib.request.HTTPSHandler()]
+    else:
+        handlers = [_PublicHTTPHandler(), _PublicHTTPSHandler()]
+    opener = urllib.request.OpenerDirector()
+    # Les redirections repassent par les mêmes gestionnaires; ftp et file n'en ont pas
+    for handler in handlers + [urllib.request.HTTPRedirectHandler(), urllib.request.HTTPDefaultErrorHandler(),
+                               urllib.request.HTTPErrorProcessor(), urllib.request.UnknownHandler()]:
+        opener.add_handler(handler)
+    return opener.open(request, timeout=timeout)
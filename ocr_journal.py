@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Journal de reprise des traitements OCR par lot.
+Chaque document est identifié par son chemin et l'empreinte de son contenu; le journal SQLite
+enregistre son état (envoyé, OCR terminé, sorties écrites) pour qu'un traitement interrompu
+reprenne là où il s'était arrêté. Les documents sont réservés par bail, ce qui permet à
+plusieurs processus de partager le même journal; le bail des documents en cours est prolongé
+en arrière-plan, pour qu'un envoi ou un appel OCR plus long que le bail ne soit pas repris
+par un autre processus.
+"""
+
+import os
+import json
+import gzip
+import time
+import uuid
+import socket
+import sqlite3
+import hashlib
+import threading
+from typing import Optional, Dict, Any
+
+# États successifs d'un document dans le journal
+STATE_PENDING = "pending"
+STATE_UPLOADED = "uploaded"
+STATE_OCR_DONE = "ocr_done"
+STATE_WRITTEN = "written"
+STATE_FAILED = "failed"
+
+# Durée par défaut d'une réservation: au-delà, un autre processus peut reprendre le document
+DEFAULT_LEASE_SECONDS = 15 * 60
+
+_JOURNAL_FIELDS = ("state", "file_id", "result_path", "outputs", "error")
+
+
+class LeaseLostError(RuntimeError):
+    """La réservation d'un document a expiré et un autre processus l'a reprise."""
+
+
+def file_hash(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """
+    Calcule l'empreinte SHA-256 du contenu d'un fichier.
+
+    Args:
+        file_path: Chemin du fichier
+        chunk_size: Taille des blocs lus
+
+    Returns:
+        Empreinte hexadécimale
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class OCRJournal:
+    """Journal SQLite de l'état de chaque document d'un traitement par lot."""
+
+    def __init__(self, db_path: str, lease_seconds: int = DEFAULT_LEASE_SECONDS):
+        """
+        Ouvre (ou crée) le journal.
+
+        Args:
+            db_path: Chemin du fichier SQLite du journal
+            lease_seconds: Durée de réservation d'un document par un processus
+        """
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        # Les résultats OCR intermédiaires sont conservés à côté du journal
+        self.checkpoint_dir = os.path.splitext(db_path)[0] + "_checkpoints"
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+
+        # Identifiant unique de ce processus pour les réservations
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self._lock = threading.Lock()
+        # Documents réservés par ce processus et non terminés, dont le bail est prolongé
+        self._held = set()
+        self._renewer = None
+        self._closed = threading.Event()
+        # isolation_level=None: les transactions sont gérées explicitement (BEGIN IMMEDIATE)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=60, isolation_level=None)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    input_path TEXT NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    file_id TEXT,
+                    result_path TEXT,
+                    outputs TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    owner TEXT,
+                    lease_until REAL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (input_path, content_hash)
+                )
+            """)
+
+    def close(self):
+        """Ferme la connexion au journal."""
+        self._closed.set()
+        with self._lock:
+            self._conn.close()
+
+    def claim(self, input_path: str, content_hash: str) -> Optional[Dict[str, Any]]:
+        """
+        Réserve un document pour ce processus.
+
+        Args:
+            input_path: Chemin du document
+            content_hash: Empreinte du contenu du document
+
+        Returns:
+            État actuel du document, ou None s'il est déjà terminé ou réservé par un autre processus
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT * FROM documents WHERE input_path = ? AND content_hash = ?",
+                    (input_path, content_hash)
+                ).fetchone()
+                entry = self._row_to_dict(row) if row else None
+
+                if entry and entry["state"] == STATE_WRITTEN:
+                    self._conn.execute("COMMIT")
+                    return None
+                if entry and entry["owner"] not in (None, self.owner) and (entry["lease_until"] or 0) > now:
+                    self._conn.execute("COMMIT")
+                    return None
+
+                if entry is None:
+                    self._conn.execute("""
+                        INSERT INTO documents (input_path, content_hash, state, attempts, owner, lease_until, updated_at)
+                        VALUES (?, ?, ?, 1, ?, ?, ?)
+                    """, (input_path, content_hash, STATE_PENDING, self.owner, now + self.lease_seconds, now))
+                else:
+                    self._conn.execute("""
+                        UPDATE documents SET attempts = attempts + 1, owner = ?, lease_until = ?, updated_at = ?
+                        WHERE input_path = ? AND content_hash = ?
+                    """, (self.owner, now + self.lease_seconds, now, input_path, content_hash))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._held.add((input_path, content_hash))
+            if self._renewer is None:
+                self._renewer = threading.Thread(target=self._renew_leases, daemon=True)
+                self._renewer.start()
+
+        return self.get(input_path, content_hash)
+
+    def update(self, input_path: str, content_hash: str, **fields):
+        """
+        Met à jour l'état d'un document et prolonge sa réservation.
+
+        Args:
+            input_path: Chemin du document
+            content_hash: Empreinte du contenu du document
+            **fields: Champs à modifier (state, file_id, result_path, outputs, error)
+
+        Raises:
+            LeaseLostError: Si le document est désormais réservé par un autre processus
+        """
+        unknown = set(fields) - set(_JOURNAL_FIELDS)
+        if unknown:
+            raise ValueError(f"Champs de journal inconnus: {', '.join(sorted(unknown))}")
+        if "outputs" in fields and fields["outputs"] is not None:
+            fields["outputs"] = json.dumps(fields["outputs"], ensure_ascii=False)
+
+        now = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        values = list(fields.values())
+        # Un document terminé ou en échec n'est plus réservé
+        released = fields.get("state") in (STATE_WRITTEN, STATE_FAILED)
+        with self._lock:
+            # Seul le détenteur de la réservation peut modifier l'état: un processus dont le bail a
+            # expiré et dont le document a été repris n'écrase pas l'état du nouveau détenteur
+            cursor = self._conn.execute(
+                f"UPDATE documents SET {assignments}, owner = ?, lease_until = ?, updated_at = ? "
+                "WHERE input_path = ? AND content_hash = ? AND owner = ?",
+                values + [
+                    None if released else self.owner,
+                    None if released else now + self.lease_seconds,
+                    now, input_path, content_hash, self.owner
+                ]
+            )
+            if released or cursor.rowcount == 0:
+                self._held.discard((input_path, content_hash))
+        if cursor.rowcount == 0:
+            raise LeaseLostError(f"Réservation perdue pour {input_path}: document repris par un autre processus")
+
+    def _renew_leases(self):
+        """Prolonge les baux des documents en cours dans ce processus, jusqu'à la fermeture du journal."""
+        while not self._closed.wait(self.lease_seconds / 3):
+            with self._lock:
+                if self._closed.is_set():
+                    return
+                for key in list(self._held):
+                    try:
+                        cursor = self._conn.execute(
+                            "UPDATE documents SET lease_until = ? WHERE input_path = ? AND content_hash = ? "
+                            "AND owner = ?", (time.time() + self.lease_seconds, key[0], key[1], self.owner)
+                        )
+                    except sqlite3.Error as e:
+                        print(f"Erreur lors du renouvellement d'un bail: {str(e)}")
+                        continue
+                    if cursor.rowcount == 0:
+                        # Repris par un autre processus: update() le signalera
+                        self._held.discard(key)
+
+    def get(self, input_path: str, content_hash: str) -> Optional[Dict[str, Any]]:
+        """
+        Retourne l'état enregistré d'un document.
+
+        Args:
+            input_path: Chemin du document
+            content_hash: Empreinte du contenu du document
+
+        Returns:
+            État du document, ou None s'il est inconnu
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM documents WHERE input_path = ? AND content_hash = ?",
+                (input_path, content_hash)
+            ).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def save_checkpoint(self, content_hash: str, result: Dict[str, Any]) -> str:
+        """
+        Conserve le résultat OCR brut pour pouvoir réécrire les sorties sans rappeler l'API.
+
+        Args:
+            content_hash: Empreinte du contenu du document
+            result: Résultat de l'OCR
+
+        Returns:
+            Chemin du fichier de reprise
+        """
+        path = os.path.join(self.checkpoint_dir, f"{content_hash}.json.gz")
+        tmp_path = f"{path}.{self.owner.replace(':', '_')}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        return path
+
+    def load_checkpoint(self, result_path: str) -> Dict[str, Any]:
+        """
+        Recharge un résultat OCR conservé par save_checkpoint.
+
+        Args:
+            result_path: Chemin du fichier de reprise
+
+        Returns:
+            Résultat de l'OCR
+        """
+        with gzip.open(result_path, "rt", encoding="utf-8") as f:
+            return json.load(f)
+
+    def summary(self) -> Dict[str, int]:
+        """
+        Compte les documents par état.
+
+        Returns:
+            Dictionnaire état -> nombre de documents
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM documents GROUP BY state").fetchall()
+        return dict(rows)
+
+    def _row_to_dict(self, row: tuple) -> Dict[str, Any]:
+        """Convertit une ligne de la table en dictionnaire."""
+        columns = ("input_path", "content_hash", "state", "file_id", "result_path", "outputs",
+                   "error", "attempts", "owner", "lease_until", "updated_at")
+        entry = dict(zip(columns, row))
+        entry["outputs"] = json.loads(entry["outputs"]) if entry["outputs"] else []
+        return entry
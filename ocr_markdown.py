@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Conversion Markdown → HTML des pages OCR, avec plusieurs moteurs interchangeables:
+- markdown2 (par défaut, le rendu historique);
+- markdown-it (markdown-it-py, conforme CommonMark et nettement plus rapide);
+- mistune (v2 ou v3, le plus rapide).
+Les moteurs sont importés au premier rendu. Les expressions mathématiques sont mises de côté
+avant la conversion puis restituées telles quelles: aucun moteur n'y interprète * ou _,
+et MathJax reçoit la même formule quel que soit le moteur.
+Le script benchmarks/bench_markdown.py compare le rendu et le débit des moteurs.
+"""
+
+import re
+import html
+import functools
+from typing import Callable, List
+
+# Moteurs disponibles, dans l'ordre de préférence
+MARKDOWN_BACKENDS = ("markdown2", "markdown-it", "mistune")
+DEFAULT_MARKDOWN_BACKEND = "markdown2"
+
+# Extensions de markdown2 utilisées pour les sorties HTML
+MARKDOWN2_EXTRAS = ["tables", "fenced-code-blocks", "footnotes", "header-ids", "strike", "task_list"]
+
+# Formules: $$...$$ (éventuellement sur plusieurs lignes), \[...\], \(...\) et $...$ sur une ligne
+_MATH_PATTERN = re.compile(
+    r"\$\$.+?\$\$|\\\[.+?\\\]|\\\(.+?\\\)|(?<![\\$])\$[^$\n]+?\$(?!\$)",
+    re.DOTALL
+)
+# Marqueur des formules mises de côté (caractères à usage privé, laissés intacts par les moteurs)
+_MATH_TOKEN = "\ue000{}\ue001"
+_MATH_TOKEN_PATTERN = re.compile(r"\ue000(\d+)\ue001")
+
+
+def _markdown2_renderer() -> Callable[[str], str]:
+    """Moteur markdown2 avec les extensions historiques."""
+    try:
+        import markdown2
+    except ImportError:
+        raise ImportError("La librairie markdown2 n'est pas installée. "
+                          "Installez toutes les dépendances avec: pip install -r requirements.txt")
+    return functools.partial(markdown2.markdown, extras=MARKDOWN2_EXTRAS)
+
+
+def _markdown_it_renderer() -> Callable[[str], str]:
+    """Moteur markdown-it-py (CommonMark, tableaux et texte barré; notes et cases à cocher si mdit-py-plugins)."""
+    try:
+        from markdown_it import MarkdownIt
+    except ImportError:
+        raise ImportError("La librairie markdown-it-py n'est pas installée. "
+                          "Installez-la avec: pip install markdown-it-py mdit-py-plugins")
+    parser = MarkdownIt("commonmark", {"html": True}).enable(["table", "strikethrough"])
+    try:
+        from mdit_py_plugins.footnote import footnote_plugin
+        from mdit_py_plugins.tasklists import tasklists_plugin
+        parser.use(footnote_plugin).use(tasklists_plugin)
+    except ImportError:
+        pass  # notes de bas de page et cases à cocher rendues comme du texte
+    return parser.render
+
+
+def _mistune_renderer() -> Callable[[str], str]:
+    """Moteur mistune (HTML brut conservé, comme avec markdown2)."""
+    try:
+        import mistune
+    except ImportError:
+        raise ImportError("La librairie mistune n'est pas installée. Installez-la avec: pip install mistune")
+    return mistune.create_markdown(escape=False, plugins=["table", "footnotes", "strikethrough", "task_lists"])
+
+
+_RENDERER_FACTORIES = {
+    "markdown2": _markdown2_renderer,
+    "markdown-it": _markdown_it_renderer,
+    "mistune": _mistune_renderer,
+}
+
+
+@functools.lru_cache(maxsize=None)
+def get_renderer(backend: str = DEFAULT_MARKDOWN_BACKEND) -> Callable[[str], str]:
+    """
+    Retourne la fonction de conversion d'un moteur (créée une fois par processus).
+
+    Args:
+        backend: Nom du moteur (voir MARKDOWN_BACKENDS)
+
+    Returns:
+        Fonction Markdown → HTML, sans traitement des formules
+    """
+    if backend not in _RENDERER_FACTORIES:
+        raise ValueError(f"Moteur Markdown inconnu: {backend} (disponibles: {', '.join(MARKDOWN_BACKENDS)})")
+    return _RENDERER_FACTORIES[backend]()
+
+
+def available_backends() -> List[str]:
+    """Moteurs dont la librairie est installée."""
+    available = []
+    for backend in MARKDOWN_BACKENDS:
+        try:
+            get_renderer(backend)
+        except ImportError:
+            continue
+        available.append(backend)
+    return available
+
+
+def render_markdown(markdown_content: str, backend: str = DEFAULT_MARKDOWN_BACKEND) -> str:
+    """
+    Convertit du Markdown en HTML avec le moteur choisi, en laissant les formules intactes.
+
+    Args:
+        markdown_content: Contenu Markdown
+        backend: Nom du moteur (voir MARKDOWN_BACKENDS)
+
+    Returns:
+        Fragment HTML
+    """
+    renderer = get_renderer(backend)
+    formulas = []
+
+    def protect(match):
+        formulas.append(match.group(0))
+        return _MATH_TOKEN.format(len(formulas) - 1)
+
+    rendered = renderer(_MATH_PATTERN.sub(protect, markdown_content))
+    if not formulas:
+        return rendered
+    return _MATH_TOKEN_PATTERN.sub(lambda match: html.escape(formulas[int(match.group(1))], quote=False), rendered)
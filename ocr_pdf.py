@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Rendu HTML → PDF (WeasyPrint) dans des processus dédiés.
+Le rendu est coûteux en CPU et en mémoire et garde le GIL: il s'exécute hors du processus
+principal, qui continue à traiter les OCR. Chaque rendu a une durée maximale (le processus
+est tué au-delà) et chaque processus une limite de mémoire; les processus sont remplacés
+après un nombre fixe de rendus, ou après une erreur. Un document qui fait échouer le rendu
+n'affecte donc que sa propre tâche.
+"""
+
+import queue
+import threading
+import multiprocessing
+import concurrent.futures
+from typing import Dict, Optional
+
+try:
+    import resource
+except ImportError:  # Windows: pas de limite de mémoire
+    resource = None
+
+
+def _worker_main(conn, memory_limit_mb: int):
+    """
+    Boucle d'un processus de rendu: reçoit (html, pdf) et répond (succès, erreur).
+
+    Args:
+        conn: Extrémité du canal vers le processus principal
+        memory_limit_mb: Limite de l'espace d'adressage en Mo (0 pour aucune limite)
+    """
+    if memory_limit_mb and resource is not None:
+        limit = memory_limit_mb * 1024 * 1024
+        try:
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ValueError, OSError):
+            pass  # limite non prise en charge (macOS notamment)
+
+    # WeasyPrint n'est importé qu'une fois par processus
+    try:
+        from weasyprint import HTML
+        import_error = None
+    except Exception as e:
+        HTML = None
+        import_error = f"WeasyPrint n'est pas disponible: {str(e)}"
+
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            return
+        if job is None:
+            return
+        html_file, pdf_file = job
+        if HTML is None:
+            conn.send((False, import_error))
+            continue
+        try:
+            HTML(filename=html_file).write_pdf(pdf_file)
+            conn.send((True, None))
+        except MemoryError:
+            conn.send((False, f"Mémoire insuffisante pour le rendu PDF (limite: {memory_limit_mb} Mo)"))
+        except Exception as e:
+            conn.send((False, str(e)))
+
+
+class PDFRenderPool:
+    """Rend des fichiers HTML en PDF dans un ensemble de processus isolés."""
+
+    def __init__(self, workers: int = 2, timeout: float = 300.0, memory_limit_mb: int = 2048,
+                 max_jobs_per_worker: int = 20):
+        """
+        Prépare le pool (les processus démarrent au premier rendu).
+
+        Args:
+            workers: Nombre de rendus simultanés (un processus chacun)
+            timeout: Durée maximale d'un rendu en secondes
+            memory_limit_mb: Limite de mémoire de chaque processus en Mo (0 pour aucune limite)
+            max_jobs_per_worker: Nombre de rendus avant le remplacement d'un processus
+        """
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.max_jobs_per_worker = max(1, max_jobs_per_worker)
+
+        # "spawn": un processus démarré par fork depuis un serveur multithread peut se bloquer
+        self._context = multiprocessing.get_context("spawn")
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._counts = {"rendered": 0, "failed": 0, "timeouts": 0, "crashed": 0, "recycled": 0}
+        # Rendus soumis et pas encore terminés
+        self._unfinished = 0
+        self._idle = threading.Condition(self._lock)
+
+    def submit(self, html_file: str, pdf_file: str) -> concurrent.futures.Future:
+        """
+        Programme le rendu d'un fichier HTML.
+
+        Args:
+            html_file: Fichier HTML à rendre
+            pdf_file: Fichier PDF à écrire
+
+        Returns:
+            Future du chemin du PDF (exception TimeoutError ou RuntimeError en cas d'échec)
+        """
+        future = concurrent.futures.Future()
+        with self._lock:
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._dispatch, daemon=True)
+                self._threads.append(thread)
+                thread.start()
+            self._unfinished += 1
+        future.add_done_callback(self._finished)
+        self._queue.put((html_file, pdf_file, future))
+        return future
+
+    def wait_idle(self, timeout: float) -> bool:
+        """
+        Attend la fin de tous les rendus soumis.
+
+        Args:
+            timeout: Attente maximale en secondes
+
+        Returns:
+            True si aucun rendu n'est plus en attente ni en cours
+        """
+        with self._idle:
+            return self._idle.wait_for(lambda: self._unfinished == 0, timeout)
+
+    def _finished(self, future: concurrent.futures.Future):
+        """Décompte un rendu terminé (appelé par son Future)."""
+        with self._idle:
+            self._unfinished -= 1
+            self._idle.notify_all()
+
+    def render(self, html_file: str, pdf_file: str) -> str:
+        """
+        Rend un fichier HTML et attend le résultat.
+
+        Args:
+            html_file: Fichier HTML à rendre
+            pdf_file: Fichier PDF à écrire
+
+        Returns:
+            Chemin du PDF (lève une exception en cas d'échec ou de dépassement de durée)
+        """
+        return self.submit(html_file, pdf_file).result()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Retourne les compteurs de rendu.
+
+        Returns:
+            Rendus réussis, en échec, interrompus, processus arrêtés ou remplacés, et rendus en attente
+        """
+        with self._lock:
+            stats = dict(self._counts)
+        stats["queued"] = self._queue.qsize()
+        return stats
+
+    def _count(self, key: str):
+        """Incrémente un compteur."""
+        with self._lock:
+            self._counts[key] += 1
+
+    def _spawn(self):
+        """Démarre un processus de rendu et retourne (processus, canal)."""
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(target=_worker_main, args=(child_conn, self.memory_limit_mb), daemon=True)
+        process.start()
+        child_conn.close()
+        return process, parent_conn
+
+    @staticmethod
+    def _stop(process, conn, graceful: bool):
+        """Arrête un processus de rendu (en lui demandant de finir, ou immédiatement)."""
+        if graceful:
+            try:
+                conn.send(None)
+                process.join(5)
+            except (OSError, ValueError):
+                pass
+        if process.is_alive():
+            process.kill()
+            process.join()
+        conn.close()
+
+    def _dispatch(self):
+        """Boucle d'un emplacement du pool: un processus, remplacé au besoin."""
+        process = conn = None
+        jobs_done = 0
+        while True:
+            html_file, pdf_file, future = self._queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            if process is None:
+                process, conn = self._spawn()
+                jobs_done = 0
+
+            try:
+                conn.send((html_file, pdf_file))
+                if not conn.poll(self.timeout):
+                    self._stop(process, conn, graceful=False)
+                    process = None
+                    self._count("timeouts")
+                    future.set_exception(TimeoutError(f"Rendu PDF interrompu après {self.timeout:.0f} s"))
+                    continue
+                success, error = conn.recv()
+            except (EOFError, OSError):
+                # Processus arrêté pendant le rendu (mémoire épuisée, signal...)
+                self._stop(process, conn, graceful=False)
+                self._count("crashed")
+                future.set_exception(RuntimeError(f"Le processus de rendu PDF s'est arrêté (code {process.exitcode})"))
+                process = None
+                continue
+
+            jobs_done += 1
+            if success:
+                self._count("rendered")
+                future.set_result(pdf_file)
+            else:
+                self._count("failed")
+                future.set_exception(RuntimeError(error))
+
+            # Remplacer le processus après un échec ou un nombre fixe de rendus (mémoire fragmentée)
+            if not success or jobs_done >= self.max_jobs_per_worker:
+                self._stop(process, conn, graceful=True)
+                process = None
+                self._count("recycled")
+
+
+def render_pdf(html_file: str, pdf_file: str, pool: Optional[PDFRenderPool] = None) -> str:
+    """
+    Rend un fichier HTML en PDF dans un processus isolé.
+
+    Args:
+        html_file: Fichier HTML à rendre
+        pdf_file: Fichier PDF à écrire
+        pool: Pool à utiliser (par défaut: pool partagé du processus)
+
+    Returns:
+        Chemin du PDF (lève une exception en cas d'échec)
+    """
+    return (pool or default_pool()).render(html_file, pdf_file)
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def default_pool() -> PDFRenderPool:
+    """Pool partagé, créé au premier rendu avec les réglages par défaut."""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = PDFRenderPool()
+        return _default_pool
@@ -0,0 +1,541 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Optimisation locale des fichiers avant leur envoi à l'API OCR Mistral.
+Les images sont redimensionnées à une résolution suffisante pour l'OCR, recompressées et
+débarrassées de leurs métadonnées (Pillow). Les formats que l'API n'accepte pas directement
+(TIFF, WebP, HEIC) sont convertis; les TIFF multipages deviennent des PDF. Les images
+incluses dans les PDF sont réduites de la même façon si pypdf est installé.
+Les pages blanches et les pages en double peuvent aussi être détectées avant l'envoi
+(rendu des pages PDF avec pypdfium2).
+"""
+
+import io
+import os
+import copy
+import hashlib
+import time
+import threading
+import importlib.util
+from typing import Optional, Dict, Any, List, Tuple, Union, BinaryIO
+
+# Taille maximale acceptée par l'API Mistral (52.4 MB)
+MISTRAL_API_MAX_SIZE = int(52.4 * 1024 * 1024)
+
+# pypdf est optionnel: sans lui, les PDF sont envoyés tels quels
+PYPDF_AVAILABLE = importlib.util.find_spec("pypdf") is not None
+# pypdfium2 est optionnel et permet d'analyser les pages des PDF (pages blanches, doublons)
+PDFIUM_AVAILABLE = importlib.util.find_spec("pypdfium2") is not None
+# pillow-heif est optionnel et permet de lire les photos HEIC/HEIF
+HEIF_AVAILABLE = importlib.util.find_spec("pillow_heif") is not None
+
+# Formats d'image acceptés tels quels par l'API
+_API_IMAGE_FORMATS = {"JPEG": "image/jpeg", "PNG": "image/png", "GIF": "image/gif", "WEBP": "image/webp"}
+
+# Qualité JPEG minimale tentée pour passer sous la taille maximale
+_MIN_JPEG_QUALITY = 40
+
+Source = Union[str, bytes, bytearray, memoryview, BinaryIO]
+
+
+def _import_pillow():
+    """Importe Pillow au premier usage (et le support HEIC s'il est installé)."""
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        raise ImportError("L'optimisation des fichiers nécessite Pillow. Installez-le avec: pip install Pillow")
+    if HEIF_AVAILABLE:
+        from pillow_heif import register_heif_opener
+        register_heif_opener()
+    return Image, ImageOps
+
+
+def read_source(source: Source) -> bytes:
+    """
+    Lit le contenu d'un fichier donné par son chemin, ses octets ou un objet fichier.
+
+    Args:
+        source: Chemin, octets, memoryview ou objet fichier ouvert en binaire
+
+    Returns:
+        Contenu du fichier
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source)
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return f.read()
+    return source.read()
+
+
+class PayloadOptimizer:
+    """Réduit la taille des images et des PDF avant leur envoi à l'API."""
+
+    def __init__(self, target_dpi: int = 200, max_side: int = 4000, jpeg_quality: int = 85,
+                 max_bytes: int = MISTRAL_API_MAX_SIZE, uplink_mbps: float = 20.0):
+        """
+        Configure l'optimisation.
+
+        Args:
+            target_dpi: Résolution visée (les images plus résolues sont réduites)
+            max_side: Plus grand côté maximal en pixels, pour les images sans résolution connue
+            jpeg_quality: Qualité de recompression JPEG (1-95)
+            max_bytes: Taille maximale à respecter (limite de l'API Mistral par défaut)
+            uplink_mbps: Débit montant supposé, pour estimer le temps d'envoi économisé
+        """
+        self.target_dpi = target_dpi
+        self.max_side = max_side
+        self.jpeg_quality = jpeg_quality
+        self.max_bytes = max_bytes
+        self.uplink_mbps = uplink_mbps
+        self.totals = {"files": 0, "bytes_in": 0, "bytes_out": 0, "seconds": 0.0}
+        self._lock = threading.Lock()
+
+    def optimize_image(self, source: Source) -> Tuple[bytes, str, Dict[str, Any]]:
+        """
+        Optimise une image (JPEG, PNG, GIF, TIFF, WebP, HEIC...).
+
+        Args:
+            source: Chemin, octets ou objet fichier de l'image
+
+        Returns:
+            (contenu optimisé, type MIME, rapport) — le type est application/pdf pour un TIFF multipage
+        """
+        start = time.perf_counter()
+        data = read_source(source)
+        Image, ImageOps = _import_pillow()
+
+        img = Image.open(io.BytesIO(data))
+        source_format = img.format
+        frame_count = getattr(img, "n_frames", 1)
+
+        if frame_count > 1 and source_format != "GIF":
+            # TIFF multipage: chaque page est optimisée puis assemblée en PDF
+            frames = []
+            for i in range(frame_count):
+                img.seek(i)
+                frames.append(self._prepare_frame(img.copy(), Image, ImageOps))
+            output = self._save_pdf(frames)
+            mime_type = "application/pdf"
+        else:
+            frame = self._prepare_frame(img, Image, ImageOps)
+            output, mime_type = self._encode_frame(frame, self.jpeg_quality)
+            # Réduire la qualité puis la taille jusqu'à passer sous la limite de l'API
+            quality = self.jpeg_quality
+            while len(output) > self.max_bytes:
+                if mime_type == "image/jpeg" and quality > _MIN_JPEG_QUALITY:
+                    quality -= 10
+                else:
+                    frame = frame.resize((max(1, int(frame.width * 0.8)), max(1, int(frame.height * 0.8))),
+                                         Image.LANCZOS)
+                output, mime_type = self._encode_frame(frame, quality)
+
+            # Un fichier déjà compact, accepté par l'API et sans redimensionnement est conservé
+            resized = frame.size != img.size
+            if (not resized and source_format in _API_IMAGE_FORMATS
+                    and len(data) <= len(output) and len(data) <= self.max_bytes):
+                output, mime_type = data, _API_IMAGE_FORMATS[source_format]
+
+        return output, mime_type, self._report(data, output, start, source_format)
+
+    def optimize_pdf(self, source: Source) -> Tuple[bytes, Dict[str, Any]]:
+        """
+        Optimise un PDF: réduit ses images trop résolues, compresse les contenus et retire les métadonnées.
+        Sans pypdf, ou si le résultat n'est pas plus petit, le PDF d'origine est conservé.
+
+        Args:
+            source: Chemin, octets ou objet fichier du PDF
+
+        Returns:
+            (contenu optimisé, rapport)
+        """
+        start = time.perf_counter()
+        data = read_source(source)
+        output = data
+
+        if PYPDF_AVAILABLE:
+            try:
+                output = self._optimize_pdf_with_pypdf(data)
+            except Exception as e:
+                print(f"Optimisation du PDF impossible, envoi du fichier d'origine: {str(e)}")
+                output = data
+        if len(output) >= len(data):
+            output = data
+
+        return output, self._report(data, output, start, "PDF")
+
+    def prepare_image(self, source: Source):
+        """
+        Charge une image et la prépare pour l'OCR (orientation, résolution, métadonnées), sans l'encoder.
+
+        Args:
+            source: Chemin, octets ou objet fichier de l'image
+
+        Returns:
+            Image Pillow prête à être assemblée (première page pour un fichier multipage)
+        """
+        Image, ImageOps = _import_pillow()
+        img = Image.open(io.BytesIO(read_source(source)))
+        img.load()
+        return self._prepare_frame(img, Image, ImageOps)
+
+    def pack_images(self, images) -> bytes:
+        """
+        Assemble des images préparées en un seul PDF, une image par page.
+
+        Args:
+            images: Images retournées par prepare_image
+
+        Returns:
+            Contenu du PDF
+        """
+        return self._save_pdf(list(images))
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Retourne le cumul des optimisations effectuées.
+
+        Returns:
+            Nombre de fichiers, octets avant/après, temps passé et temps d'envoi économisé estimé
+        """
+        with self._lock:
+            totals = dict(self.totals)
+        saved = totals["bytes_in"] - totals["bytes_out"]
+        return dict(totals, bytes_saved=saved, upload_seconds_saved=round(self._upload_seconds(saved), 2))
+
+    def _prepare_frame(self, img, Image, ImageOps):
+        """Redresse une image selon son EXIF, la ramène à la résolution visée et supprime ses métadonnées."""
+        dpi = img.info.get("dpi", (0, 0))[0] or 0
+        img = ImageOps.exif_transpose(img)
+
+        scale = 1.0
+        if dpi and dpi > self.target_dpi:
+            scale = self.target_dpi / float(dpi)
+        longest = max(img.size)
+        if longest * scale > self.max_side:
+            scale = self.max_side / float(longest)
+        if scale < 1.0:
+            size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+            img = img.resize(size, Image.LANCZOS)
+
+        # Les images noir et blanc restent en 1 bit (PNG), le reste passe en RGB ou niveaux de gris
+        if img.mode in ("RGBA", "LA", "P"):
+            img = img.convert("RGBA")
+            background = Image.new("RGB", img.size, (255, 255, 255))
+            background.paste(img, mask=img.getchannel("A"))
+            img = background
+        elif img.mode not in ("1", "L", "RGB"):
+            img = img.convert("RGB")
+
+        # Une copie sans info ne conserve ni EXIF, ni XMP, ni profil ICC
+        clean = img.copy()
+        clean.info = {}
+        return clean
+
+    def _encode_frame(self, img, quality: int) -> Tuple[bytes, str]:
+        """Encode une image en PNG (noir et blanc) ou en JPEG (le reste)."""
+        buffer = io.BytesIO()
+        if img.mode == "1":
+            img.save(buffer, format="PNG", optimize=True, dpi=(self.target_dpi, self.target_dpi))
+            return buffer.getvalue(), "image/png"
+        img.save(buffer, format="JPEG", quality=quality, optimize=True, progressive=True,
+                 dpi=(self.target_dpi, self.target_dpi))
+        return buffer.getvalue(), "image/jpeg"
+
+    def _save_pdf(self, frames) -> bytes:
+        """Assemble des images en un PDF multipage."""
+        buffer = io.BytesIO()
+        frames = [frame if frame.mode in ("1", "L", "RGB") else frame.convert("RGB") for frame in frames]
+        frames[0].save(buffer, format="PDF", save_all=True, append_images=frames[1:],
+                       resolution=float(self.target_dpi))
+        return buffer.getvalue()
+
+    def _optimize_pdf_with_pypdf(self, data: bytes) -> bytes:
+        """Réduit les images et compresse les flux d'un PDF avec pypdf."""
+        from pypdf import PdfWriter
+        Image, _ = _import_pillow()
+
+        writer = PdfWriter(clone_from=io.BytesIO(data))
+        for page in writer.pages:
+            page_width_inches = float(page.mediabox.width) / 72 or 1.0
+            for image_file in page.images:
+                img = image_file.image
+                # Résolution effective si l'image couvre la largeur de la page (cas des scans)
+                dpi = img.width / page_width_inches
+                if dpi > self.target_dpi * 1.1:
+                    scale = self.target_dpi / dpi
+                    img = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))),
+                                     Image.LANCZOS)
+                    if img.mode not in ("1", "L", "RGB"):
+                        img = img.convert("RGB")
+                    image_file.replace(img, quality=self.jpeg_quality)
+            page.compress_content_streams()
+
+        if hasattr(writer, "compress_identical_objects"):
+            writer.compress_identical_objects()
+        # Retirer les métadonnées du document
+        writer.metadata = None
+
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        return buffer.getvalue()
+
+    def _upload_seconds(self, size: int) -> float:
+        """Estime la durée d'envoi d'un volume donné au débit montant configuré."""
+        return size * 8 / (self.uplink_mbps * 1_000_000) if self.uplink_mbps else 0.0
+
+    def _report(self, original: bytes, optimized: bytes, start: float, source_format: Optional[str]) -> Dict[str, Any]:
+        """Construit le rapport d'une optimisation et met à jour les cumuls."""
+        elapsed = time.perf_counter() - start
+        saved = len(original) - len(optimized)
+        with self._lock:
+            self.totals["files"] += 1
+            self.totals["bytes_in"] += len(original)
+            self.totals["bytes_out"] += len(optimized)
+            self.totals["seconds"] += elapsed
+        return {
+            "source_format": source_format,
+            "bytes_in": len(original),
+            "bytes_out": len(optimized),
+            "bytes_saved": saved,
+            "ratio": round(len(optimized) / len(original), 3) if original else 1.0,
+            "optimize_seconds": round(elapsed, 3),
+            # Temps d'envoi économisé, diminué du temps passé à optimiser
+            "latency_gained_seconds": round(self._upload_seconds(saved) - elapsed, 3),
+        }
+
+
+class PageFilter:
+    """Détecte les pages blanches et les pages quasi identiques pour ne pas les envoyer à l'OCR."""
+
+    def __init__(self, ink_threshold: float = 0.003, duplicate_distance: int = 4,
+                 render_dpi: int = 40, margin: float = 0.05):
+        """
+        Configure la détection.
+
+        Args:
+            ink_threshold: Part minimale de pixels sombres pour qu'une page ne soit pas considérée blanche
+            duplicate_distance: Distance de Hamming maximale entre empreintes perceptuelles de deux doublons
+                                (sur 64 bits; -1 pour désactiver la détection des doublons)
+            render_dpi: Résolution du rendu des pages PDF pour l'analyse
+            margin: Part des bords ignorée (ombres et bords noirs des scanners)
+        """
+        self.ink_threshold = ink_threshold
+        self.duplicate_distance = duplicate_distance
+        self.render_dpi = render_dpi
+        self.margin = margin
+
+    def analyze_images(self, images) -> Dict[str, Any]:
+        """
+        Analyse une suite de pages (images Pillow).
+
+        Args:
+            images: Images des pages, dans l'ordre
+
+        Returns:
+            Analyse: nombre de pages, pages conservées, pages blanches, doublons (page -> page d'origine)
+        """
+        kept, blank, duplicate_of = [], [], {}
+        kept_hashes = []
+        for i, img in enumerate(images):
+            gray = self._crop_margins(img.convert("L"))
+            if self._ink_coverage(gray) < self.ink_threshold:
+                blank.append(i)
+                continue
+            if self.duplicate_distance >= 0:
+                page_hash = _difference_hash(gray)
+                original = next(
+                    (j for j, h in kept_hashes if bin(page_hash ^ h).count("1") <= self.duplicate_distance),
+                    None
+                )
+                if original is not None:
+                    duplicate_of[i] = original
+                    continue
+                kept_hashes.append((i, page_hash))
+            kept.append(i)
+        # images peut être un générateur (analyze_pdf): chaque page est dans exactement une des trois listes
+        page_count = len(kept) + len(blank) + len(duplicate_of)
+        return {"page_count": page_count, "kept": kept, "blank": blank, "duplicate_of": duplicate_of}
+
+    def analyze_pdf(self, source: Source) -> Dict[str, Any]:
+        """
+        Analyse les pages d'un PDF (nécessite pypdfium2).
+
+        Args:
+            source: Chemin, octets ou objet fichier du PDF
+
+        Returns:
+            Analyse au format de analyze_images
+        """
+        import pypdfium2 as pdfium
+        pdf = pdfium.PdfDocument(read_source(source))
+        try:
+            images = (
+                pdf[i].render(scale=self.render_dpi / 72, grayscale=True).to_pil()
+                for i in range(len(pdf))
+            )
+            return self.analyze_images(images)
+        finally:
+            pdf.close()
+
+    def _crop_margins(self, gray):
+        """Retire les bords de l'image."""
+        dx, dy = int(gray.width * self.margin), int(gray.height * self.margin)
+        if gray.width - 2 * dx < 8 or gray.height - 2 * dy < 8:
+            return gray
+        return gray.crop((dx, dy, gray.width - dx, gray.height - dy))
+
+    def _ink_coverage(self, gray) -> float:
+        """Part des pixels sombres (encre) dans une image en niveaux de gris."""
+        histogram = gray.histogram()
+        total = sum(histogram) or 1
+        return sum(histogram[:128]) / total
+
+
+def _difference_hash(gray) -> int:
+    """Empreinte perceptuelle dHash sur 64 bits d'une image en niveaux de gris."""
+    Image, _ = _import_pillow()
+    small = gray.resize((9, 8), Image.BILINEAR)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+
+def subset_pdf(source: Source, pages: List[int]) -> bytes:
+    """
+    Construit un PDF ne contenant que certaines pages (nécessite pypdfium2).
+
+    Args:
+        source: Chemin, octets ou objet fichier du PDF
+        pages: Index des pages à conserver, dans l'ordre
+
+    Returns:
+        Contenu du nouveau PDF
+    """
+    import pypdfium2 as pdfium
+    pdf = pdfium.PdfDocument(read_source(source))
+    subset = pdfium.PdfDocument.new()
+    try:
+        subset.import_pages(pdf, pages=list(pages))
+        buffer = io.BytesIO()
+        subset.save(buffer)
+        return buffer.getvalue()
+    finally:
+        subset.close()
+        pdf.close()
+
+
+def pdf_page_hashes(source: Source, render_dpi: int = 72) -> List[str]:
+    """
+    Calcule une empreinte du contenu de chaque page d'un PDF (nécessite pypdfium2).
+    L'empreinte combine les dimensions, le texte de la page et son rendu en niveaux de gris,
+    de sorte qu'une page inchangée garde la même empreinte d'une révision à l'autre.
+
+    Args:
+        source: Chemin, octets ou objet fichier du PDF
+        render_dpi: Résolution du rendu utilisé pour l'empreinte
+
+    Returns:
+        Empreintes SHA-256 hexadécimales, une par page
+    """
+    import pypdfium2 as pdfium
+    pdf = pdfium.PdfDocument(read_source(source))
+    hashes = []
+    try:
+        for i in range(len(pdf)):
+            page = pdf[i]
+            digest = hashlib.sha256()
+            width, height = page.get_size()
+            digest.update(f"{width:.2f}x{height:.2f}".encode("ascii"))
+            textpage = page.get_textpage()
+            digest.update(textpage.get_text_range().encode("utf-8"))
+            textpage.close()
+            bitmap = page.render(scale=render_dpi / 72, grayscale=True)
+            digest.update(bitmap.to_pil().tobytes())
+            page.close()
+            hashes.append(digest.hexdigest())
+    finally:
+        pdf.close()
+    return hashes
+
+
+def blank_page(index: int) -> Dict[str, Any]:
+    """
+    Page de remplacement pour une page blanche non envoyée à l'OCR.
+
+    Args:
+        index: Index de la page dans le document d'origine
+
+    Returns:
+        Page au format de la réponse de l'API
+    """
+    return {"index": index, "markdown": "", "images": [], "dimensions": None, "skipped": "blank"}
+
+
+def expand_pages(result: Dict[str, Any], analysis: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Reconstruit la liste complète des pages à partir du résultat des seules pages envoyées.
+    Les pages blanches sont remplacées par une page vide, les doublons par une copie de la
+    page d'origine marquée "duplicate_of"; les index correspondent au document d'origine.
+
+    Args:
+        result: Résultat de l'OCR sur les pages conservées (dans l'ordre de analysis["kept"])
+        analysis: Analyse retournée par PageFilter
+
+    Returns:
+        Résultat avec une page par page du document d'origine
+    """
+    pages = result.get("pages", [])
+    kept = analysis["kept"]
+    if len(pages) != len(kept):
+        raise ValueError(f"{len(pages)} page(s) reçue(s) pour {len(kept)} page(s) envoyée(s)")
+
+    by_original = {}
+    for original, page in zip(kept, pages):
+        page = dict(page)
+        page["index"] = original
+        by_original[original] = page
+
+    blank = set(analysis["blank"])
+    rebuilt = []
+    for i in range(analysis["page_count"]):
+        if i in by_original:
+            rebuilt.append(by_original[i])
+        elif i in blank:
+            rebuilt.append(blank_page(i))
+        else:
+            original = analysis["duplicate_of"][i]
+            page = copy.deepcopy(by_original[original])
+            page["index"] = i
+            page["duplicate_of"] = original
+            rebuilt.append(page)
+
+    expanded = dict(result)
+    expanded["pages"] = rebuilt
+    expanded["page_filter"] = {
+        "pages_sent": len(kept),
+        "blank_pages": sorted(blank),
+        "duplicate_pages": {str(k): v for k, v in sorted(analysis["duplicate_of"].items())},
+    }
+    return expanded
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """
+    Formate un rapport d'optimisation pour l'affichage.
+
+    Args:
+        report: Rapport retourné par optimize_image ou optimize_pdf
+
+    Returns:
+        Ligne lisible
+    """
+    mb = 1024 * 1024
+    percent = 100 * (1 - report["ratio"])
+    return (f"Optimisation: {report['bytes_in'] / mb:.2f} Mo -> {report['bytes_out'] / mb:.2f} Mo "
+            f"({-percent:+.0f}%) en {report['optimize_seconds']:.2f} s, "
+            f"gain estimé {report['latency_gained_seconds']:+.2f} s")
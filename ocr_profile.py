@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Profilage par étape du traitement d'un document (envoi, appel OCR, model_dump, amélioration
+du Markdown, rendu HTML, extraction des images, écriture des sorties).
+Chaque étape est mesurée avec cProfile (fonctions les plus coûteuses) et tracemalloc (pic de
+mémoire et principales allocations). Le profilage est désactivé par défaut: sans profileur,
+les étapes ne coûtent qu'un appel de fonction.
+Depuis Python 3.12, un seul profileur cProfile peut être actif par processus: un seul thread à
+la fois profile ses étapes avec cProfile, les étapes simultanées des autres threads ne mesurent
+que le temps et la mémoire. Une erreur du profilage n'interrompt jamais le traitement.
+"""
+
+import os
+import io
+import json
+import time
+import threading
+import contextlib
+import tracemalloc
+from typing import Any, Dict, List, Optional
+
+# cProfile et pstats sont importés au premier profilage: importer ce module ne coûte presque rien
+
+# Allocations des mesures elles-mêmes, exclues des instantanés
+_PROFILER_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+]
+
+# Profileurs actifs ayant démarré tracemalloc (arrêté quand le dernier se termine)
+_tracing_users = 0
+_tracing_lock = threading.Lock()
+
+
+def _start_tracing():
+    """Démarre tracemalloc pour un profileur."""
+    global _tracing_users
+    with _tracing_lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _tracing_users += 1
+
+
+def _stop_tracing():
+    """Arrête tracemalloc quand plus aucun profileur ne s'en sert."""
+    global _tracing_users
+    with _tracing_lock:
+        _tracing_users -= 1
+        if _tracing_users == 0:
+            tracemalloc.stop()
+
+
+# Thread qui détient cProfile pour tout le processus (un seul profileur actif depuis Python 3.12)
+_cprofile_lock = threading.Lock()
+_cprofile_thread = None
+
+
+def _acquire_cprofile() -> bool:
+    """
+    Réserve cProfile pour le thread courant, sans attendre.
+
+    Returns:
+        True si ce thread vient d'obtenir la réservation (à libérer avec _release_cprofile)
+    """
+    global _cprofile_thread
+    if _cprofile_lock.acquire(blocking=False):
+        _cprofile_thread = threading.get_ident()
+        return True
+    return False
+
+
+def _release_cprofile():
+    """Libère la réservation de cProfile."""
+    global _cprofile_thread
+    _cprofile_thread = None
+    _cprofile_lock.release()
+
+
+def _reset_peak():
+    """Remet à zéro le pic de tracemalloc (Python 3.9+)."""
+    if hasattr(tracemalloc, "reset_peak"):
+        tracemalloc.reset_peak()
+
+
+def _traced_peak() -> int:
+    """Pic de mémoire depuis le dernier _reset_peak; avant Python 3.9, mémoire actuelle (minorant)."""
+    current, peak = tracemalloc.get_traced_memory()
+    return peak if hasattr(tracemalloc, "reset_peak") else current
+
+
+def _is_profiler_entry(filename: str) -> bool:
+    """Fonctions du profileur lui-même (entrée et sortie des étapes), masquées dans les résumés."""
+    return filename in (__file__, contextlib.__file__)
+
+
+class _Frame:
+    """Étape en cours dans un thread."""
+
+    def __init__(self, name: str, profile, owns_cprofile: bool = False):
+        self.name = name
+        # None si cProfile est pris par un autre thread: seuls le temps et la mémoire sont mesurés
+        self.profile = profile
+        self.owns_cprofile = owns_cprofile
+        self.start = 0.0
+        self.child_seconds = 0.0
+        self.memory_start = 0
+        self.memory_peak = 0
+        self.snapshot = None
+
+
+def _enable(frame: _Frame) -> bool:
+    """
+    Active le profil cProfile d'une étape s'il en a un.
+
+    Returns:
+        False si l'étape n'est pas profilée (cProfile pris par un autre outil de profilage)
+    """
+    if frame.profile is None:
+        return False
+    try:
+        frame.profile.enable()
+    except ValueError:
+        # "Another profiling tool is already active" (débogueur, autre profileur...)
+        frame.profile = None
+        return False
+    return True
+
+
+def _disable(frame: _Frame):
+    """Désactive le profil cProfile d'une étape s'il en a un."""
+    if frame.profile is not None:
+        frame.profile.disable()
+
+
+class StageProfiler:
+    """Mesure le temps, les fonctions appelées et la mémoire de chaque étape d'un traitement."""
+
+    def __init__(self, top: int = 15, trace_memory: bool = True, snapshot_calls: int = 3):
+        """
+        Initialise le profileur.
+
+        Args:
+            top: Nombre de fonctions et d'allocations retenues par étape
+            trace_memory: Mesurer la mémoire avec tracemalloc (ralentit nettement les allocations)
+            snapshot_calls: Nombre d'appels de chaque étape pour lesquels les allocations sont
+                            détaillées (une comparaison d'instantanés tracemalloc est coûteuse)
+        """
+        self.top = top
+        self.trace_memory = trace_memory
+        self.snapshot_calls = snapshot_calls
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._tracing = False
+        # Par étape: appels, secondes (hors sous-étapes), pic de mémoire, profils cProfile, allocations
+        self._stages: Dict[str, Dict[str, Any]] = {}
+
+    def _stage_data(self, name: str) -> Dict[str, Any]:
+        """Données d'une étape (créées au premier appel)."""
+        with self._lock:
+            if name not in self._stages:
+                self._stages[name] = {"calls": 0, "profiled_calls": 0, "seconds": 0.0, "peak_bytes": 0,
+                                      "profiles": [], "allocations": {}}
+            return self._stages[name]
+
+    def _thread_profile(self, name: str):
+        """Profil cProfile de l'étape pour le thread courant (un objet ne sert qu'à un thread)."""
+        import cProfile
+        profiles = getattr(self._local, "profiles", None)
+        if profiles is None:
+            profiles = self._local.profiles = {}
+        if name not in profiles:
+            profiles[name] = cProfile.Profile()
+            data = self._stage_data(name)
+            with self._lock:
+                data["profiles"].append(profiles[name])
+        return profiles[name]
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        """
+        Mesure une étape. Les étapes peuvent s'imbriquer: le temps et les fonctions d'une
+        sous-étape ne sont comptés que dans celle-ci.
+
+        Args:
+            name: Nom de l'étape (upload, ocr, write...)
+        """
+        if self.trace_memory and not self._tracing:
+            with self._lock:
+                if not self._tracing:
+                    _start_tracing()
+                    self._tracing = True
+
+        # Le coût des mesures (instantanés mémoire) n'est compté ni dans l'étape ni dans l'étape parente
+        entered = time.perf_counter()
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        data = self._stage_data(name)
+        with self._lock:
+            data["calls"] += 1
+            take_snapshot = self.trace_memory and data["calls"] <= self.snapshot_calls
+
+        parent = stack[-1] if stack else None
+        if parent is not None:
+            _disable(parent)
+        # Les sous-étapes d'un thread qui détient cProfile sont profilées; les autres threads ne
+        # l'obtiennent qu'une fois libéré
+        owns_cprofile = _cprofile_thread != threading.get_ident() and _acquire_cprofile()
+        profile = None
+        if _cprofile_thread == threading.get_ident():
+            try:
+                profile = self._thread_profile(name)
+            except Exception:
+                profile = None
+        frame = _Frame(name, profile, owns_cprofile)
+        if self.trace_memory:
+            if parent is not None:
+                parent.memory_peak = max(parent.memory_peak, _traced_peak())
+            _reset_peak()
+            frame.memory_start = tracemalloc.get_traced_memory()[0]
+            if take_snapshot:
+                frame.snapshot = tracemalloc.take_snapshot().filter_traces(_PROFILER_FILTERS)
+        stack.append(frame)
+        frame.start = time.perf_counter()
+        if _enable(frame):
+            with self._lock:
+                data["profiled_calls"] += 1
+        try:
+            yield
+        finally:
+            _disable(frame)
+            if frame.owns_cprofile:
+                _release_cprofile()
+            elapsed = time.perf_counter() - frame.start
+            stack.pop()
+            if self.trace_memory and tracemalloc.is_tracing():
+                frame.memory_peak = max(frame.memory_peak, _traced_peak())
+                if frame.snapshot is not None:
+                    snapshot = tracemalloc.take_snapshot().filter_traces(_PROFILER_FILTERS)
+                    self._record_allocations(data, snapshot.compare_to(frame.snapshot, "lineno"))
+            with self._lock:
+                data["seconds"] += elapsed - frame.child_seconds
+                data["peak_bytes"] = max(data["peak_bytes"], frame.memory_peak - frame.memory_start)
+            if parent is not None:
+                parent.child_seconds += time.perf_counter() - entered
+                parent.memory_peak = max(parent.memory_peak, frame.memory_peak)
+                _enable(parent)
+
+    def _record_allocations(self, data: Dict[str, Any], differences):
+        """Cumule les allocations d'un appel d'étape, par ligne de code."""
+        with self._lock:
+            allocations = data["allocations"]
+            for difference in differences[:self.top * 4]:
+                if difference.size_diff <= 0:
+                    continue
+                frame = difference.traceback[0]
+                key = f"{frame.filename}:{frame.lineno}"
+                size, count = allocations.get(key, (0, 0))
+                allocations[key] = (size + difference.size_diff, count + difference.count_diff)
+
+    def stop(self):
+        """Arrête la mesure de la mémoire (à appeler une fois le traitement terminé)."""
+        with self._lock:
+            if self._tracing:
+                _stop_tracing()
+                self._tracing = False
+
+    def _stats(self, name: str):
+        """Statistiques cProfile (pstats.Stats) d'une étape, tous threads confondus, ou None."""
+        import pstats
+        profiles = [profile for profile in self._stages[name]["profiles"] if profile.getstats()]
+        if not profiles:
+            return None
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        return stats
+
+    def summary(self, top: Optional[int] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Résume les mesures de chaque étape.
+
+        Args:
+            top: Nombre de fonctions et d'allocations retenues par étape (par défaut: celui du profileur)
+
+        Returns:
+            Par étape: appels, secondes (hors sous-étapes), pic de mémoire (Mo), fonctions
+            les plus coûteuses en temps cumulé et lignes ayant le plus alloué
+        """
+        top = self.top if top is None else top
+        summary = {}
+        for name in list(self._stages):
+            data = self._stages[name]
+            functions = []
+            stats = self._stats(name)
+            if stats is not None:
+                entries = sorted(
+                    (item for item in stats.stats.items() if not _is_profiler_entry(item[0][0])),
+                    key=lambda item: item[1][3], reverse=True
+                )
+                for (filename, lineno, function), (_, calls, own, cumulative, _) in entries[:top]:
+                    functions.append({
+                        "function": f"{os.path.basename(filename)}:{lineno}({function})",
+                        "calls": calls,
+                        "own_seconds": round(own, 4),
+                        "cumulative_seconds": round(cumulative, 4),
+                    })
+            allocations = sorted(data["allocations"].items(), key=lambda item: item[1][0], reverse=True)
+            summary[name] = {
+                "calls": data["calls"],
+                # Appels mesurés par cProfile (les autres se sont déroulés pendant une étape d'un autre thread)
+                "profiled_calls": data["profiled_calls"],
+                "seconds": round(data["seconds"], 4),
+                "memory_peak_mb": round(data["peak_bytes"] / (1024 * 1024), 2) if self.trace_memory else None,
+                "top_functions": functions,
+                "top_allocations": [
+                    {"line": line, "size_kb": round(size / 1024, 1), "count": count}
+                    for line, (size, count) in allocations[:top]
+                ],
+            }
+        return summary
+
+    def save(self, base_output: str) -> List[str]:
+        """
+        Enregistre le profil à côté des sorties: <base>_profile.json (résumé) et, par étape,
+        <base>_profile/<étape>.prof (lisible avec pstats, snakeviz...).
+
+        Args:
+            base_output: Chemin de sortie sans extension
+
+        Returns:
+            Liste des fichiers écrits
+        """
+        written = []
+        profile_dir = base_output + "_profile"
+        for name in list(self._stages):
+            stats = self._stats(name)
+            if stats is None:
+                continue
+            os.makedirs(profile_dir, exist_ok=True)
+            prof_file = os.path.join(profile_dir, f"{name}.prof")
+            stats.dump_stats(prof_file)
+            written.append(prof_file)
+
+        summary_file = base_output + "_profile.json"
+        with open(summary_file, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+        written.insert(0, summary_file)
+        return written
+
+
+def format_profile(summary: Dict[str, Dict[str, Any]], functions: int = 3) -> str:
+    """
+    Formate le résumé d'un profil pour l'affichage.
+
+    Args:
+        summary: Résumé retourné par StageProfiler.summary
+        functions: Nombre de fonctions affichées par étape
+
+    Returns:
+        Texte lisible, une ligne par étape suivie de ses fonctions les plus coûteuses
+    """
+    out = io.StringIO()
+    out.write(f"{'étape':<14} {'appels':>7} {'secondes':>9} {'pic Mo':>8}\n")
+    for name, stage in sorted(summary.items(), key=lambda item: item[1]["seconds"], reverse=True):
+        peak = "-" if stage["memory_peak_mb"] is None else f"{stage['memory_peak_mb']:.1f}"
+        out.write(f"{name:<14} {stage['calls']:>7} {stage['seconds']:>9.3f} {peak:>8}\n")
+        for function in stage["top_functions"][:functions]:
+            out.write(f"    {function['cumulative_seconds']:>8.3f} s  {function['function']}\n")
+        if stage["top_allocations"]:
+            allocation = stage["top_allocations"][0]
+            out.write(f"    {allocation['size_kb']:>8.0f} Ko  {allocation['line']}\n")
+    return out.getvalue().rstrip("\n")
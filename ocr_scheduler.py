@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+File d'attente des traitements OCR de l'application web, ordonnancée selon leur coût estimé.
+Les travaux courts passent en premier (shortest-job-first); l'attente réduit progressivement
+le score d'un travail (vieillissement), si bien qu'un gros document finit toujours par passer.
+Des classes de priorité par clé API pondèrent le coût estimé.
+"""
+
+import io
+import os
+import re
+import time
+import itertools
+import threading
+import importlib.util
+from typing import Callable, Dict, Any, List, Optional, Tuple, Union
+
+# pypdf (optionnel) donne le nombre exact de pages; sinon il est estimé à partir du fichier
+PYPDF_AVAILABLE = importlib.util.find_spec("pypdf") is not None
+
+# Pondération du coût selon la classe de priorité
+PRIORITY_WEIGHTS = {"high": 0.25, "normal": 1.0, "low": 4.0}
+
+# Coût estimé (en secondes de traitement) par page et par Mo, et surcoût par page des formats de sortie
+_COST_PER_PAGE = 1.0
+_COST_PER_MB = 0.2
+_FORMAT_COST_PER_PAGE = {"json": 0.0, "md": 0.02, "html": 0.1, "html-pages": 0.1, "pdf": 0.5}
+# Nombre de pages supposé quand il ne peut pas être déterminé (URL)
+_DEFAULT_PAGE_COUNT = 5
+
+_PDF_PAGE_PATTERN = re.compile(rb"/Type\s*/Page(?![a-zA-Z])")
+
+
+def count_pdf_pages(file_path: Union[str, bytes]) -> int:
+    """
+    Compte les pages d'un PDF (exactement avec pypdf, sinon par recherche des objets page).
+
+    Args:
+        file_path: Chemin du PDF, ou son contenu
+
+    Returns:
+        Nombre de pages (au moins 1)
+    """
+    if PYPDF_AVAILABLE:
+        try:
+            from pypdf import PdfReader
+            source = io.BytesIO(file_path) if isinstance(file_path, bytes) else file_path
+            return max(1, len(PdfReader(source).pages))
+        except Exception:
+            pass
+    if isinstance(file_path, bytes):
+        return max(1, len(_PDF_PAGE_PATTERN.findall(file_path)))
+    with open(file_path, "rb") as f:
+        return max(1, len(_PDF_PAGE_PATTERN.findall(f.read())))
+
+
+def estimate_job_cost(file_path: Union[str, bytes, None] = None, output_formats: Optional[List[str]] = None,
+                      page_count: Optional[int] = None, file_name: Optional[str] = None) -> float:
+    """
+    Estime la durée de traitement d'un travail à partir du fichier et des formats demandés.
+
+    Args:
+        file_path: Fichier à traiter, ou son contenu (None pour une URL)
+        output_formats: Formats de sortie demandés
+        page_count: Nombre de pages s'il est déjà connu
+        file_name: Nom du fichier, pour en déduire le type quand le contenu est fourni
+
+    Returns:
+        Coût estimé, en secondes
+    """
+    size_mb = 0.0
+    if isinstance(file_path, bytes) or (file_path and os.path.exists(file_path)):
+        is_bytes = isinstance(file_path, bytes)
+        size_mb = (len(file_path) if is_bytes else os.path.getsize(file_path)) / (1024 * 1024)
+        name = file_name or ("" if is_bytes else file_path)
+        if page_count is None:
+            page_count = count_pdf_pages(file_path) if name.lower().endswith(".pdf") else 1
+    if page_count is None:
+        page_count = _DEFAULT_PAGE_COUNT
+
+    per_page = _COST_PER_PAGE + sum(_FORMAT_COST_PER_PAGE.get(f, 0.0) for f in (output_formats or []))
+    return 1.0 + page_count * per_page + size_mb * _COST_PER_MB
+
+
+def parse_priority_classes(spec: str) -> List[Tuple[str, str]]:
+    """
+    Lit la configuration des classes de priorité par clé API.
+
+    Args:
+        spec: Liste "préfixe_de_clé:classe" séparée par des virgules (ex: "mis_ab12:high,mis_cd34:low")
+
+    Returns:
+        Liste de (préfixe, classe), les préfixes les plus longs en premier
+    """
+    classes = []
+    for item in spec.split(","):
+        if ":" not in item:
+            continue
+        prefix, priority = (part.strip() for part in item.rsplit(":", 1))
+        if prefix and priority in PRIORITY_WEIGHTS:
+            classes.append((prefix, priority))
+    return sorted(classes, key=lambda c: len(c[0]), reverse=True)
+
+
+class JobScheduler:
+    """Exécute les travaux soumis avec un nombre limité de workers, les moins coûteux d'abord."""
+
+    def __init__(self, workers: int = 4, aging_rate: float = 0.5, policy: str = "sjf"):
+        """
+        Prépare la file (les workers démarrent à la première soumission).
+
+        Args:
+            workers: Nombre de travaux exécutés simultanément
+            aging_rate: Réduction du score par seconde d'attente (0 pour un SJF strict)
+            policy: "sjf" (coût estimé et vieillissement) ou "fifo" (ordre d'arrivée)
+        """
+        if policy not in ("sjf", "fifo"):
+            raise ValueError(f"Politique d'ordonnancement inconnue: {policy}")
+        self.workers = max(1, workers)
+        self.aging_rate = aging_rate
+        self.policy = policy
+
+        self._condition = threading.Condition()
+        # Travaux en attente: (numéro d'arrivée, coût pondéré, soumis le, fonction, arguments)
+        self._pending: List[Tuple[int, float, float, Callable, tuple]] = []
+        self._sequence = itertools.count()
+        self._threads: List[threading.Thread] = []
+        self._running = 0
+
+    def submit(self, func: Callable, *args, cost: float = 1.0, priority: str = "normal"):
+        """
+        Ajoute un travail à la file.
+
+        Args:
+            func: Fonction à exécuter
+            *args: Arguments de la fonction
+            cost: Coût estimé du travail (voir estimate_job_cost)
+            priority: Classe de priorité (high, normal ou low)
+        """
+        weighted = cost * PRIORITY_WEIGHTS.get(priority, 1.0)
+        with self._condition:
+            self._pending.append((next(self._sequence), weighted, time.monotonic(), func, args))
+            self._ensure_workers()
+            self._condition.notify()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Retourne l'état de la file.
+
+        Returns:
+            Nombre de travaux en attente et en cours, et attente du plus ancien
+        """
+        now = time.monotonic()
+        with self._condition:
+            oldest = min((job[2] for job in self._pending), default=now)
+            return {
+                "policy": self.policy,
+                "workers": self.workers,
+                "queued": len(self._pending),
+                "running": self._running,
+                "oldest_queued_seconds": round(now - oldest, 1),
+            }
+
+    def drain(self, timeout: float) -> bool:
+        """
+        Attend que tous les travaux soumis, en attente ou en cours, soient terminés.
+
+        Args:
+            timeout: Attente maximale en secondes
+
+        Returns:
+            True si la file est vide et aucun travail n'est en cours
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while (self._pending or self._running) and time.monotonic() < deadline:
+                self._condition.wait(min(1.0, max(0.0, deadline - time.monotonic())))
+            return not self._pending and not self._running
+
+    def _ensure_workers(self):
+        """Démarre les workers manquants (appelé sous le verrou)."""
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._worker, daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _next_job(self) -> Tuple[int, float, float, Callable, tuple]:
+        """Retire de la file le travail au plus petit score (appelé sous le verrou)."""
+        if self.policy == "fifo":
+            best = min(range(len(self._pending)), key=lambda i: self._pending[i][0])
+        else:
+            now = time.monotonic()
+            best = min(
+                range(len(self._pending)),
+                key=lambda i: (self._pending[i][1] - self.aging_rate * (now - self._pending[i][2]),
+                               self._pending[i][0])
+            )
+        return self._pending.pop(best)
+
+    def _worker(self):
+        """Boucle d'un worker: exécute les travaux dans l'ordre du score."""
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                _, _, _, func, args = self._next_job()
+                self._running += 1
+            try:
+                func(*args)
+            except Exception as e:
+                print(f"Erreur lors de l'exécution d'un travail: {str(e)}")
+            finally:
+                with self._condition:
+                    self._running -= 1
+                    self._condition.notify_all()
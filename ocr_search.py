@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Index plein texte des résultats OCR Mistral.
+Ce module maintient un index inversé SQLite FTS5, alimenté page par page,
+qui permet de retrouver rapidement un passage parmi tous les documents traités.
+Il fournit aussi un index d'extraits en mémoire pour les questions sur un document.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Optional, Dict, Any, List
+
+# Chemin par défaut de l'index (surchargeable par la variable MISTRAL_OCR_INDEX_DB, voir default_index_path)
+DEFAULT_INDEX_PATH = "ocr_index.db"
+
+# Les tokens de recherche sont extraits ainsi pour éviter les erreurs de syntaxe FTS5
+_QUERY_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def default_index_path() -> str:
+    """
+    Chemin de l'index par défaut, lu à l'appel pour tenir compte du fichier .env chargé entre-temps.
+
+    Returns:
+        MISTRAL_OCR_INDEX_DB, ou DEFAULT_INDEX_PATH si la variable n'est pas définie
+    """
+    return os.environ.get("MISTRAL_OCR_INDEX_DB", DEFAULT_INDEX_PATH)
+
+
+class OCRSearchIndex:
+    """Index plein texte incrémental des pages OCR, basé sur SQLite FTS5."""
+
+    def __init__(self, db_path: Optional[str] = None):
+        """
+        Ouvre (ou crée) l'index.
+
+        Args:
+            db_path: Chemin du fichier SQLite de l'index (par défaut: default_index_path())
+        """
+        self.db_path = db_path or default_index_path()
+        db_dir = os.path.dirname(os.path.abspath(self.db_path))
+        os.makedirs(db_dir, exist_ok=True)
+
+        # Une seule connexion partagée entre les threads, protégée par un verrou
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        with self._lock:
+            # WAL permet des lectures concurrentes pendant l'indexation
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    doc_id TEXT PRIMARY KEY,
+                    source TEXT,
+                    page_count INTEGER NOT NULL DEFAULT 0,
+                    indexed_at REAL NOT NULL,
+                    owner TEXT
+                )
+            """)
+            # Index créé avant l'ajout du propriétaire des documents
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(documents)")]
+            if "owner" not in columns:
+                self._conn.execute("ALTER TABLE documents ADD COLUMN owner TEXT")
+            self._conn.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS pages USING fts5(
+                    doc_id UNINDEXED,
+                    page_index UNINDEXED,
+                    content,
+                    tokenize = 'unicode61 remove_diacritics 2'
+                )
+            """)
+            self._conn.commit()
+
+    def close(self):
+        """Ferme la connexion à l'index."""
+        with self._lock:
+            self._conn.close()
+
+    def index_page(self, doc_id: str, page_index: int, markdown: str, source: Optional[str] = None):
+        """
+        Ajoute ou remplace une page dans l'index.
+
+        Args:
+            doc_id: Identifiant du document (ex: identifiant de tâche ou nom de fichier)
+            page_index: Index de la page dans le document
+            markdown: Contenu markdown de la page
+            source: Fichier ou URL d'origine du document
+        """
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM pages WHERE doc_id = ? AND page_index = ?",
+                (doc_id, page_index)
+            )
+            self._conn.execute(
+                "INSERT INTO pages (doc_id, page_index, content) VALUES (?, ?, ?)",
+                (doc_id, page_index, markdown or "")
+            )
+            self._conn.execute("""
+                INSERT INTO documents (doc_id, source, page_count, indexed_at)
+                VALUES (?, ?, (SELECT COUNT(*) FROM pages WHERE doc_id = ?), ?)
+                ON CONFLICT(doc_id) DO UPDATE SET
+                    source = COALESCE(excluded.source, documents.source),
+                    page_count = excluded.page_count,
+                    indexed_at = excluded.indexed_at
+            """, (doc_id, source, doc_id, time.time()))
+            self._conn.commit()
+
+    def index_document(self, doc_id: str, result: Dict[str, Any], source: Optional[str] = None,
+                       owner: Optional[str] = None) -> int:
+        """
+        Indexe toutes les pages d'un résultat OCR, en remplaçant une éventuelle version précédente.
+
+        Args:
+            doc_id: Identifiant du document
+            result: Résultat de l'OCR (avec une liste "pages")
+            source: Fichier ou URL d'origine du document
+            owner: Propriétaire du document, seul à le retrouver avec search(owner=...)
+
+        Returns:
+            Nombre de pages indexées
+        """
+        pages = result.get("pages", [])
+        rows = [
+            (doc_id, page.get("index", i), page.get("markdown", "") or "")
+            for i, page in enumerate(pages)
+        ]
+
+        with self._lock:
+            self._conn.execute("DELETE FROM pages WHERE doc_id = ?", (doc_id,))
+            self._conn.executemany(
+                "INSERT INTO pages (doc_id, page_index, content) VALUES (?, ?, ?)",
+                rows
+            )
+            self._conn.execute("""
+                INSERT INTO documents (doc_id, source, page_count, indexed_at, owner)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(doc_id) DO UPDATE SET
+                    source = COALESCE(excluded.source, documents.source),
+                    page_count = excluded.page_count,
+                    indexed_at = excluded.indexed_at,
+                    owner = excluded.owner
+            """, (doc_id, source, len(rows), time.time(), owner))
+            self._conn.commit()
+
+        return len(rows)
+
+    def remove_document(self, doc_id: str):
+        """
+        Retire un document de l'index.
+
+        Args:
+            doc_id: Identifiant du document
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM pages WHERE doc_id = ?", (doc_id,))
+            self._conn.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+            self._conn.commit()
+
+    def search(self, query: str, limit: int = 20, offset: int = 0,
+               highlight: tuple = ("<mark>", "</mark>"), raw: bool = False,
+               owner: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Recherche des pages correspondant à une requête.
+
+        Args:
+            query: Texte recherché (tous les mots doivent être présents)
+            limit: Nombre maximal de résultats
+            offset: Décalage pour la pagination
+            highlight: Balises entourant les termes trouvés dans l'extrait
+            raw: Transmettre la requête telle quelle à FTS5 (syntaxe avancée: OR, NEAR, "phrase"...)
+            owner: Ne chercher que dans les documents de ce propriétaire (None: tous les documents)
+
+        Returns:
+            Liste des pages trouvées, triées par pertinence
+        """
+        match_query = query if raw else _build_match_query(query)
+        if not match_query:
+            return []
+
+        # Classement d'abord, puis extraits des seules pages retournées: snippet(), coûteux, n'est
+        # pas calculé pour toutes les pages contenant un terme courant
+        with self._lock:
+            if owner is None:
+                ranked = self._conn.execute(
+                    "SELECT rowid FROM pages WHERE pages MATCH ? ORDER BY rank LIMIT ? OFFSET ?",
+                    (match_query, limit, offset)
+                ).fetchall()
+            else:
+                ranked = self._conn.execute(
+                    "SELECT p.rowid FROM pages AS p JOIN documents AS d ON d.doc_id = p.doc_id "
+                    "WHERE pages MATCH ? AND d.owner = ? ORDER BY p.rank LIMIT ? OFFSET ?",
+                    (match_query, owner, limit, offset)
+                ).fetchall()
+            if not ranked:
+                return []
+            rowids = [rowid for (rowid,) in ranked]
+            placeholders = ",".join("?" * len(rowids))
+            rows = self._conn.execute(f"""
+                SELECT p.doc_id, p.page_index, d.source,
+                       snippet(pages, 2, ?, ?, '…', 16) AS snippet,
+                       bm25(pages) AS score
+                FROM pages AS p
+                LEFT JOIN documents AS d ON d.doc_id = p.doc_id
+                WHERE pages MATCH ? AND p.rowid IN ({placeholders})
+                ORDER BY score
+            """, [highlight[0], highlight[1], match_query] + rowids).fetchall()
+
+        return [
+            {
+                "doc_id": doc_id,
+                "page_index": page_index,
+                "source": source,
+                "snippet": snippet,
+                "score": -score  # bm25() renvoie des scores négatifs: plus petit = plus pertinent
+            }
+            for doc_id, page_index, source, snippet, score in rows
+        ]
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Retourne le nombre de documents et de pages indexés.
+
+        Returns:
+            Dictionnaire avec les clés "documents" et "pages"
+        """
+        with self._lock:
+            documents, pages = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(page_count), 0) FROM documents"
+            ).fetchone()
+        return {"documents": documents, "pages": pages}
+
+
+class ChunkIndex:
+    """Index lexical en mémoire des extraits d'un résultat OCR, pour la recherche de contexte."""
+
+    def __init__(self, result: Dict[str, Any], max_chars: int = 1500):
+        """
+        Découpe les pages du résultat en extraits et les indexe.
+
+        Args:
+            result: Résultat de l'OCR (avec une liste "pages")
+            max_chars: Taille maximale approximative d'un extrait en caractères
+        """
+        self.chunks = []
+        for i, page in enumerate(result.get("pages", [])):
+            page_index = page.get("index", i)
+            for text in chunk_markdown(page.get("markdown", "") or "", max_chars=max_chars):
+                self.chunks.append({"page_index": page_index, "text": text})
+
+        self._conn = sqlite3.connect(":memory:", check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute(
+                "CREATE VIRTUAL TABLE chunks USING fts5(text, tokenize = 'unicode61 remove_diacritics 2')"
+            )
+            self._conn.executemany(
+                "INSERT INTO chunks (rowid, text) VALUES (?, ?)",
+                [(i, chunk["text"]) for i, chunk in enumerate(self.chunks)]
+            )
+
+    def top_k(self, question: str, k: int = 5) -> List[Dict[str, Any]]:
+        """
+        Retourne les extraits les plus pertinents pour une question.
+
+        Args:
+            question: Question posée
+            k: Nombre d'extraits à retourner
+
+        Returns:
+            Extraits (page_index, text) dans l'ordre du document
+        """
+        # N'importe quel mot de la question suffit: BM25 pondère les mots rares
+        match_query = _build_match_query(question, operator=" OR ")
+        rowids = []
+        if match_query:
+            with self._lock:
+                rowids = [row[0] for row in self._conn.execute(
+                    "SELECT rowid FROM chunks WHERE chunks MATCH ? ORDER BY bm25(chunks) LIMIT ?",
+                    (match_query, k)
+                )]
+
+        # Sans correspondance lexicale, on se rabat sur le début du document
+        if not rowids:
+            rowids = list(range(min(k, len(self.chunks))))
+
+        return [self.chunks[i] for i in sorted(rowids)]
+
+
+def chunk_markdown(markdown: str, max_chars: int = 1500) -> List[str]:
+    """
+    Découpe un contenu markdown en extraits, sans couper les paragraphes ni les tableaux
+    tant qu'ils tiennent dans un extrait. Un bloc plus long est découpé par lignes, puis
+    par phrases, puis par mots.
+
+    Args:
+        markdown: Contenu markdown d'une page
+        max_chars: Taille maximale d'un extrait en caractères
+
+    Returns:
+        Liste des extraits non vides
+    """
+    blocks = [block.strip() for block in re.split(r"\n\s*\n", markdown)]
+    return _pack_parts([block for block in blocks if block], "\n\n", max_chars)
+
+
+# Séparateurs essayés, du plus grossier au plus fin, pour découper un bloc trop long
+_SPLIT_LEVELS = ((r"\n", "\n"), (r"(?<=[.!?;:])\s+", " "), (r"\s+", " "))
+
+
+def _pack_parts(parts: List[str], separator: str, max_chars: int, level: int = 0) -> List[str]:
+    """
+    Regroupe des morceaux consécutifs en extraits d'au plus max_chars caractères.
+
+    Args:
+        parts: Morceaux non vides, dans l'ordre
+        separator: Séparateur inséré entre deux morceaux d'un même extrait
+        max_chars: Taille maximale d'un extrait
+        level: Premier niveau de _SPLIT_LEVELS utilisé pour redécouper un morceau trop long
+
+    Returns:
+        Liste des extraits
+    """
+    chunks = []
+    current = ""
+    for part in parts:
+        if len(part) > max_chars:
+            if level < len(_SPLIT_LEVELS):
+                pattern, sub_separator = _SPLIT_LEVELS[level]
+                sub_parts = [p.strip() for p in re.split(pattern, part)]
+                pieces = _pack_parts([p for p in sub_parts if p], sub_separator, max_chars, level + 1)
+            else:
+                # Mot unique plus long qu'un extrait (URL, base64...)
+                pieces = [part[i:i + max_chars] for i in range(0, len(part), max_chars)]
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.extend(pieces[:-1])
+            current = pieces[-1]
+            continue
+        if current and len(current) + len(separator) + len(part) > max_chars:
+            chunks.append(current)
+            current = ""
+        current = f"{current}{separator}{part}" if current else part
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _build_match_query(query: str, operator: str = " ") -> str:
+    """
+    Transforme un texte libre en requête FTS5 sûre (chaque mot entre guillemets).
+
+    Args:
+        query: Texte saisi par l'utilisateur
+        operator: Séparateur entre les mots (" " = tous requis, " OR " = au moins un)
+
+    Returns:
+        Requête FTS5, ou chaîne vide si aucun mot n'a été trouvé
+    """
+    tokens = _QUERY_TOKEN_PATTERN.findall(query or "")
+    return operator.join(f'"{token}"' for token in tokens)
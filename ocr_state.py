@@ -0,0 +1,679 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+État de l'application web partagé entre plusieurs processus, dans une base SQLite.
+Les dictionnaires d'état (tâches, lots, soumissions en cours...), les flux des pages et la file
+des traitements y sont conservés: n'importe quel processus répond à /status ou /stream pour une
+tâche traitée par un autre, et un processus arrêté laisse ses travaux aux suivants.
+Les travaux sont réservés par bail, comme dans ocr_journal: le bail d'un processus disparu
+expire et son travail est repris par un autre.
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from ocr_scheduler import PRIORITY_WEIGHTS
+
+# Durée par défaut d'une réservation de travail, prolongée tant que le processus est en vie
+DEFAULT_LEASE_SECONDS = 60
+# Nombre de réservations d'un travail au-delà duquel il est abandonné (processus arrêtés en plein traitement)
+MAX_JOB_ATTEMPTS = 3
+
+_MISSING = object()
+
+
+def _json_path(path: Iterable[str]) -> str:
+    """Chemin JSON SQLite ($."clé"."sous-clé") d'une valeur imbriquée."""
+    return "$" + "".join("." + json.dumps(str(key)) for key in path)
+
+
+class SharedLock:
+    """Verrou commun à tous les processus: les opérations faites sous ce verrou forment une transaction."""
+
+    def __init__(self, state: "SharedState"):
+        self._state = state
+
+    def __enter__(self):
+        self._state._begin()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self._state._end(commit=exc_type is None)
+        return False
+
+
+class SharedState:
+    """Base SQLite de l'état partagé par les processus de l'application web."""
+
+    def __init__(self, db_path: str, lease_seconds: int = DEFAULT_LEASE_SECONDS):
+        """
+        Ouvre (ou crée) la base.
+
+        Args:
+            db_path: Chemin du fichier SQLite, accessible à tous les processus
+            lease_seconds: Durée de réservation d'un travail par un processus
+        """
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        # Identifiant unique de ce processus pour les réservations
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        # Les transactions (SharedLock) peuvent s'imbriquer dans un même thread
+        self._lock = threading.RLock()
+        self._depth = 0
+        # isolation_level=None: les transactions sont gérées explicitement (BEGIN IMMEDIATE)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=60, isolation_level=None)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS streams (
+                    task_id TEXT PRIMARY KEY,
+                    closed INTEGER NOT NULL DEFAULT 0,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS stream_records (
+                    task_id TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    record TEXT NOT NULL,
+                    PRIMARY KEY (task_id, position)
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    handler TEXT NOT NULL,
+                    args TEXT NOT NULL,
+                    weighted_cost REAL NOT NULL,
+                    submitted_at REAL NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    owner TEXT,
+                    lease_until REAL
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS secrets (
+                    name TEXT PRIMARY KEY,
+                    value BLOB NOT NULL
+                )
+            """)
+        # La base contient les clés API des travaux en attente et la clé des sessions:
+        # elle n'est lisible que par son propriétaire
+        try:
+            os.chmod(db_path, 0o600)
+        except OSError:
+            pass
+
+    def close(self):
+        """Ferme la connexion à la base."""
+        with self._lock:
+            self._conn.close()
+
+    def lock(self) -> SharedLock:
+        """Verrou commun à tous les processus (remplace un threading.Lock de l'état local)."""
+        return SharedLock(self)
+
+    def _begin(self):
+        """Commence une transaction (ou s'imbrique dans celle du thread)."""
+        self._lock.acquire()
+        self._depth += 1
+        if self._depth == 1:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+            except Exception:
+                self._depth -= 1
+                self._lock.release()
+                raise
+
+    def _end(self, commit: bool = True):
+        """Termine la transaction commencée par _begin."""
+        try:
+            self._depth -= 1
+            if self._depth == 0:
+                self._conn.execute("COMMIT" if commit else "ROLLBACK")
+        finally:
+            self._lock.release()
+
+    def _execute(self, sql: str, params: tuple = ()) -> int:
+        """Exécute une modification (dans la transaction du thread, s'il y en a une); retourne le nombre de lignes touchées."""
+        with self._lock:
+            return self._conn.execute(sql, params).rowcount
+
+    def _query(self, sql: str, params: tuple = ()) -> List[tuple]:
+        """Exécute une lecture et retourne ses lignes (lues sous le verrou: la connexion est commune aux threads)."""
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _query_one(self, sql: str, params: tuple = ()) -> Optional[tuple]:
+        """Première ligne d'une lecture, ou None."""
+        rows = self._query(sql, params)
+        return rows[0] if rows else None
+
+    def mapping(self, namespace: str) -> "SharedMapping":
+        """Dictionnaire partagé de clés texte vers des valeurs JSON."""
+        return SharedMapping(self, namespace)
+
+    def streams(self) -> "SharedStreams":
+        """Flux des pages des tâches, lisibles depuis tous les processus."""
+        return SharedStreams(self)
+
+    def job_queue(self, handlers: Dict[str, Callable], **kwargs) -> "SharedJobQueue":
+        """File des traitements partagée (voir SharedJobQueue)."""
+        return SharedJobQueue(self, handlers, **kwargs)
+
+    def secret(self, name: str, nbytes: int = 24) -> bytes:
+        """
+        Secret commun à tous les processus, tiré au hasard par le premier qui le demande
+        et conservé d'un redémarrage à l'autre (non supprimé par prune).
+
+        Args:
+            name: Nom du secret (ex: "session_key")
+            nbytes: Taille du secret, s'il doit être créé
+
+        Returns:
+            Valeur du secret
+        """
+        with self.lock():
+            self._execute("INSERT OR IGNORE INTO secrets (name, value) VALUES (?, ?)", (name, os.urandom(nbytes)))
+            return self._query_one("SELECT value FROM secrets WHERE name = ?", (name,))[0]
+
+    def prune(self, max_age_seconds: float) -> int:
+        """
+        Supprime l'état des tâches et des lots inchangés depuis max_age_seconds
+        (l'état local disparaissait au redémarrage; la base, elle, grandirait sans fin).
+
+        Returns:
+            Nombre d'entrées supprimées
+        """
+        cutoff = time.time() - max_age_seconds
+        with self.lock():
+            removed = self._execute("DELETE FROM entries WHERE updated_at < ?", (cutoff,))
+            self._execute("DELETE FROM stream_records WHERE task_id IN "
+                          "(SELECT task_id FROM streams WHERE updated_at < ?)", (cutoff,))
+            self._execute("DELETE FROM streams WHERE updated_at < ?", (cutoff,))
+        return removed
+
+    # Valeurs des dictionnaires partagés
+
+    def _get(self, namespace: str, key: str) -> Any:
+        row = self._query_one("SELECT value FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+        return json.loads(row[0]) if row else _MISSING
+
+    def _put(self, namespace: str, key: str, value: Any):
+        self._execute(
+            "INSERT OR REPLACE INTO entries (namespace, key, value, updated_at) VALUES (?, ?, ?, ?)",
+            (namespace, key, json.dumps(value, ensure_ascii=False), time.time())
+        )
+
+    def _delete(self, namespace: str, key: str):
+        self._execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def _set_paths(self, namespace: str, key: str, assignments: List[Tuple[Tuple[str, ...], Any]]):
+        """Modifie des valeurs imbriquées d'une entrée, sans réécrire les autres (écritures concurrentes)."""
+        if not assignments:
+            return
+        placeholders = ", ".join("?, json(?)" for _ in assignments)
+        params = []
+        for path, value in assignments:
+            params.extend((_json_path(path), json.dumps(value, ensure_ascii=False)))
+        self._execute(
+            f"UPDATE entries SET value = json_set(value, {placeholders}), updated_at = ? "
+            "WHERE namespace = ? AND key = ?",
+            tuple(params) + (time.time(), namespace, key)
+        )
+
+    def _remove_path(self, namespace: str, key: str, path: Tuple[str, ...]):
+        self._execute("UPDATE entries SET value = json_remove(value, ?), updated_at = ? "
+                      "WHERE namespace = ? AND key = ?", (_json_path(path), time.time(), namespace, key))
+
+    def _append_path(self, namespace: str, key: str, path: Tuple[str, ...], value: Any):
+        self._execute("UPDATE entries SET value = json_insert(value, ?, json(?)), updated_at = ? "
+                      "WHERE namespace = ? AND key = ?",
+                      (_json_path(path) + "[#]", json.dumps(value, ensure_ascii=False), time.time(),
+                       namespace, key))
+
+
+def _wrap(value: Any, state: SharedState, namespace: str, key: str, path: Tuple[str, ...]) -> Any:
+    """Valeur lue dans la base: les dictionnaires et listes répercutent leurs modifications."""
+    if isinstance(value, dict):
+        return SharedDict(value, state, namespace, key, path)
+    if isinstance(value, list):
+        return SharedList(value, state, namespace, key, path)
+    return value
+
+
+class SharedDict(dict):
+    """
+    Dictionnaire lu dans la base, dont chaque modification est écrite aussitôt.
+    Seule la valeur modifiée est réécrite: deux threads ou processus qui modifient des clés
+    différentes d'une même tâche ne s'écrasent pas.
+    """
+
+    def __init__(self, value: Dict[str, Any], state: SharedState, namespace: str, key: str,
+                 path: Tuple[str, ...] = ()):
+        super().__init__({k: _wrap(v, state, namespace, key, path + (k,)) for k, v in value.items()})
+        self._location = (state, namespace, key, path)
+
+    def __setitem__(self, name, value):
+        state, namespace, key, path = self._location
+        state._set_paths(namespace, key, [(path + (name,), value)])
+        super().__setitem__(name, _wrap(value, state, namespace, key, path + (name,)))
+
+    def update(self, *args, **kwargs):
+        state, namespace, key, path = self._location
+        changes = dict(*args, **kwargs)
+        state._set_paths(namespace, key, [(path + (name,), value) for name, value in changes.items()])
+        for name, value in changes.items():
+            super().__setitem__(name, _wrap(value, state, namespace, key, path + (name,)))
+
+    def __delitem__(self, name):
+        state, namespace, key, path = self._location
+        super().__delitem__(name)
+        state._remove_path(namespace, key, path + (name,))
+
+    def pop(self, name, default=_MISSING):
+        if name in self:
+            value = self[name]
+            del self[name]
+            return value
+        if default is _MISSING:
+            raise KeyError(name)
+        return default
+
+
+class SharedList(list):
+    """Liste lue dans la base; les ajouts (append) sont écrits aussitôt."""
+
+    def __init__(self, value: List[Any], state: SharedState, namespace: str, key: str, path: Tuple[str, ...]):
+        super().__init__(value)
+        self._location = (state, namespace, key, path)
+
+    def append(self, value):
+        state, namespace, key, path = self._location
+        state._append_path(namespace, key, path, value)
+        super().append(value)
+
+
+class SharedMapping:
+    """
+    Dictionnaire partagé par les processus, utilisable comme le dictionnaire d'état local.
+    Chaque lecture relit la base; les valeurs dictionnaires et listes lues répercutent leurs
+    modifications (ocr_tasks[task_id]['status'] = ...). Les lectures-modifications qui doivent
+    être atomiques entre processus se font sous SharedState.lock().
+    """
+
+    def __init__(self, state: SharedState, namespace: str):
+        self._state = state
+        self._namespace = namespace
+
+    def __getitem__(self, key: str) -> Any:
+        value = self._state._get(self._namespace, key)
+        if value is _MISSING:
+            raise KeyError(key)
+        return _wrap(value, self._state, self._namespace, key, ())
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key: str) -> bool:
+        return self._state._query_one("SELECT 1 FROM entries WHERE namespace = ? AND key = ?",
+                                      (self._namespace, key)) is not None
+
+    def __setitem__(self, key: str, value: Any):
+        self._state._put(self._namespace, key, value)
+
+    def __delitem__(self, key: str):
+        self._state._delete(self._namespace, key)
+
+    def pop(self, key: str, default: Any = _MISSING) -> Any:
+        with self._state.lock():
+            value = self._state._get(self._namespace, key)
+            if value is _MISSING:
+                if default is _MISSING:
+                    raise KeyError(key)
+                return default
+            self._state._delete(self._namespace, key)
+        return value
+
+    def setdefault(self, key: str, default: Any = None) -> Any:
+        with self._state.lock():
+            if key not in self:
+                self[key] = default
+            return self[key]
+
+    def __len__(self) -> int:
+        return self._state._query_one("SELECT COUNT(*) FROM entries WHERE namespace = ?", (self._namespace,))[0]
+
+
+class SharedPageStream:
+    """Enregistrements par page d'une tâche, lisibles depuis tous les processus (interface de PageStream)."""
+
+    # Intervalle de relecture de la base par les lecteurs, en secondes
+    poll_interval = 0.2
+
+    def __init__(self, state: SharedState, task_id: str):
+        self._state = state
+        self.task_id = task_id
+
+    @property
+    def records(self) -> List[Dict[str, Any]]:
+        return self._read(0)
+
+    @property
+    def closed(self) -> bool:
+        row = self._state._query_one("SELECT closed FROM streams WHERE task_id = ?", (self.task_id,))
+        return row is None or bool(row[0])
+
+    def append(self, record: Dict[str, Any]):
+        """Ajoute une page."""
+        with self._state.lock():
+            self._state._execute("""
+                INSERT INTO stream_records (task_id, position, record)
+                VALUES (?, (SELECT COUNT(*) FROM stream_records WHERE task_id = ?), ?)
+            """, (self.task_id, self.task_id, json.dumps(record, ensure_ascii=False)))
+            self._state._execute("UPDATE streams SET updated_at = ? WHERE task_id = ?", (time.time(), self.task_id))
+
+    def close(self):
+        """Indique qu'aucune page ne sera plus ajoutée."""
+        self._state._execute("UPDATE streams SET closed = 1, updated_at = ? WHERE task_id = ?",
+                             (time.time(), self.task_id))
+
+    def _read(self, position: int) -> List[Dict[str, Any]]:
+        rows = self._state._query(
+            "SELECT record FROM stream_records WHERE task_id = ? AND position >= ? ORDER BY position",
+            (self.task_id, position)
+        )
+        return [json.loads(row[0]) for row in rows]
+
+    def _poll(self, position: int) -> Tuple[List[Dict[str, Any]], bool]:
+        """Pages produites depuis position, et fermeture du flux (lue avant les pages: aucune n'est perdue)."""
+        closed = self.closed
+        return self._read(position), closed
+
+    def follow(self):
+        """Itère sur les pages déjà produites puis sur les suivantes, jusqu'à la fermeture."""
+        position = 0
+        while True:
+            available, closed = self._poll(position)
+            yield from available
+            position += len(available)
+            if closed:
+                return
+            if not available:
+                time.sleep(self.poll_interval)
+
+    async def follow_async(self):
+        """Comme follow, sans bloquer la boucle d'événements."""
+        import asyncio
+        position = 0
+        while True:
+            available, closed = self._poll(position)
+            for record in available:
+                yield record
+            position += len(available)
+            if closed:
+                return
+            if not available:
+                await asyncio.sleep(self.poll_interval)
+
+
+class SharedStreams:
+    """Flux des pages des tâches (remplace le dictionnaire task_streams de l'état local)."""
+
+    def __init__(self, state: SharedState):
+        self._state = state
+
+    def __setitem__(self, task_id: str, stream: Any):
+        # Le flux local passé est remplacé par un flux partagé, vide et ouvert
+        with self._state.lock():
+            self._state._execute("DELETE FROM stream_records WHERE task_id = ?", (task_id,))
+            self._state._execute("INSERT OR REPLACE INTO streams (task_id, closed, updated_at) VALUES (?, 0, ?)",
+                                 (task_id, time.time()))
+
+    def __getitem__(self, task_id: str) -> SharedPageStream:
+        stream = self.get(task_id)
+        if stream is None:
+            raise KeyError(task_id)
+        return stream
+
+    def get(self, task_id: str, default: Any = None) -> Optional[SharedPageStream]:
+        row = self._state._query_one("SELECT 1 FROM streams WHERE task_id = ?", (task_id,))
+        return SharedPageStream(self._state, task_id) if row else default
+
+    def __contains__(self, task_id: str) -> bool:
+        return self.get(task_id) is not None
+
+
+class SharedJobQueue:
+    """
+    File des traitements partagée par les processus, avec l'interface de JobScheduler.
+    Chaque processus exécute jusqu'à `workers` travaux à la fois, pris dans la file commune selon
+    le même ordonnancement (coût estimé et vieillissement, ou ordre d'arrivée). Les fonctions
+    exécutables sont déclarées à la création: un travail n'enregistre que le nom de sa fonction
+    et ses arguments (JSON).
+    """
+
+    def __init__(self, state: SharedState, handlers: Dict[str, Callable], workers: int = 4,
+                 aging_rate: float = 0.5, policy: str = "sjf", poll_interval: float = 0.5,
+                 abandon: Optional[Callable] = None):
+        """
+        Prépare la file (les workers démarrent avec start ou à la première soumission).
+
+        Args:
+            state: Base de l'état partagé
+            handlers: Fonctions exécutables, par nom
+            workers: Nombre de travaux exécutés simultanément par ce processus
+            aging_rate: Réduction du score par seconde d'attente (0 pour un SJF strict)
+            policy: "sjf" (coût estimé et vieillissement) ou "fifo" (ordre d'arrivée)
+            poll_interval: Intervalle de consultation de la file quand elle est vide, en secondes
+            abandon: Fonction appelée avec les arguments d'un travail abandonné après MAX_JOB_ATTEMPTS réservations
+        """
+        if policy not in ("sjf", "fifo"):
+            raise ValueError(f"Politique d'ordonnancement inconnue: {policy}")
+        self.state = state
+        self.handlers = handlers
+        self.workers = max(1, workers)
+        self.aging_rate = aging_rate
+        self.policy = policy
+        self.poll_interval = poll_interval
+        self.abandon = abandon
+
+        self._condition = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        # Travaux en cours dans ce processus (identifiants)
+        self._running: set = set()
+        self._draining = False
+
+    def submit(self, func: Callable, *args, cost: float = 1.0, priority: str = "normal"):
+        """
+        Ajoute un travail à la file commune.
+
+        Args:
+            func: Fonction à exécuter (déclarée dans handlers)
+            *args: Arguments de la fonction (sérialisables en JSON)
+            cost: Coût estimé du travail (voir estimate_job_cost)
+            priority: Classe de priorité (high, normal ou low)
+        """
+        name = func.__name__
+        if self.handlers.get(name) is not func:
+            raise ValueError(f"Fonction non déclarée dans la file partagée: {name}")
+        weighted = cost * PRIORITY_WEIGHTS.get(priority, 1.0)
+        self.state._execute(
+            "INSERT INTO jobs (handler, args, weighted_cost, submitted_at) VALUES (?, ?, ?, ?)",
+            (name, json.dumps(args, ensure_ascii=False), weighted, time.time())
+        )
+        with self._condition:
+            self._ensure_workers()
+            self._condition.notify()
+
+    def start(self):
+        """Démarre les workers de ce processus (pour reprendre les travaux déjà en file)."""
+        with self._condition:
+            self._ensure_workers()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Retourne l'état de la file.
+
+        Returns:
+            Travaux en attente (tous processus), en cours (dans ce processus et au total),
+            et attente du plus ancien
+        """
+        now = time.time()
+        queued, oldest = self.state._query_one(
+            "SELECT COUNT(*), MIN(submitted_at) FROM jobs WHERE owner IS NULL OR lease_until < ?", (now,)
+        )
+        running_total = self.state._query_one(
+            "SELECT COUNT(*) FROM jobs WHERE owner IS NOT NULL AND lease_until >= ?", (now,)
+        )[0]
+        with self._condition:
+            running = len(self._running)
+        return {
+            "policy": self.policy,
+            "workers": self.workers,
+            "queued": queued,
+            "running": running,
+            "running_all_processes": running_total,
+            "oldest_queued_seconds": round(now - oldest, 1) if oldest else 0.0,
+            "owner": self.state.owner,
+            "draining": self._draining,
+        }
+
+    def drain(self, timeout: float) -> bool:
+        """
+        Cesse de prendre des travaux et attend la fin de ceux en cours dans ce processus.
+        Les travaux encore en cours après timeout sont remis dans la file pour un autre processus.
+
+        Args:
+            timeout: Attente maximale en secondes
+
+        Returns:
+            True si tous les travaux en cours se sont terminés
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            self._draining = True
+            self._condition.notify_all()
+            while self._running and time.monotonic() < deadline:
+                self._condition.wait(min(1.0, max(0.0, deadline - time.monotonic())))
+            unfinished = list(self._running)
+        for job_id in unfinished:
+            # Remise en file sans compter la réservation interrompue
+            self.state._execute(
+                "UPDATE jobs SET owner = NULL, lease_until = NULL, attempts = MAX(0, attempts - 1) "
+                "WHERE id = ? AND owner = ?", (job_id, self.state.owner)
+            )
+        return not unfinished
+
+    def _ensure_workers(self):
+        """Démarre les workers manquants et le renouvellement des baux (appelé sous le verrou)."""
+        if self._draining:
+            return
+        if not self._threads:
+            thread = threading.Thread(target=self._renew_leases, daemon=True)
+            self._threads.append(thread)
+            thread.start()
+        while len(self._threads) < self.workers + 1:
+            thread = threading.Thread(target=self._worker, daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _claim(self) -> Optional[Tuple[int, str, list]]:
+        """Réserve le travail au plus petit score, libre ou dont le bail a expiré."""
+        now = time.time()
+        order = "id" if self.policy == "fifo" else "weighted_cost - ? * (? - submitted_at), id"
+        order_params = () if self.policy == "fifo" else (self.aging_rate, now)
+        abandoned = []
+        with self.state.lock():
+            while True:
+                row = self.state._query_one(
+                    f"SELECT id, handler, args, attempts FROM jobs WHERE owner IS NULL OR lease_until < ? "
+                    f"ORDER BY {order} LIMIT 1", (now,) + order_params
+                )
+                if row is None:
+                    job = None
+                    break
+                job_id, handler, args, attempts = row
+                if attempts >= MAX_JOB_ATTEMPTS:
+                    self.state._execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+                    abandoned.append((handler, json.loads(args)))
+                    continue
+                self.state._execute("UPDATE jobs SET owner = ?, lease_until = ?, attempts = attempts + 1 WHERE id = ?",
+                                    (self.state.owner, now + self.state.lease_seconds, job_id))
+                job = (job_id, handler, json.loads(args))
+                break
+        for handler, args in abandoned:
+            print(f"Travail abandonné après {MAX_JOB_ATTEMPTS} tentatives: {handler}")
+            if self.abandon is not None:
+                try:
+                    self.abandon(*args)
+                except Exception as e:
+                    print(f"Erreur lors de l'abandon d'un travail: {str(e)}")
+        return job
+
+    def _renew_leases(self):
+        """Prolonge les baux des travaux en cours dans ce processus."""
+        while True:
+            time.sleep(self.state.lease_seconds / 3)
+            with self._condition:
+                running = list(self._running)
+            for job_id in running:
+                try:
+                    self.state._execute("UPDATE jobs SET lease_until = ? WHERE id = ? AND owner = ?",
+                                        (time.time() + self.state.lease_seconds, job_id, self.state.owner))
+                except Exception as e:
+                    print(f"Erreur lors du renouvellement d'un bail: {str(e)}")
+
+    def _worker(self):
+        """Boucle d'un worker: exécute les travaux de la file commune dans l'ordre du score."""
+        while True:
+            with self._condition:
+                if self._draining:
+                    return
+            try:
+                job = self._claim()
+            except sqlite3.Error as e:
+                print(f"Erreur lors de la lecture de la file partagée: {str(e)}")
+                job = None
+            if job is None:
+                with self._condition:
+                    if not self._draining:
+                        self._condition.wait(self.poll_interval)
+                continue
+
+            job_id, handler, args = job
+            with self._condition:
+                self._running.add(job_id)
+            try:
+                self.handlers[handler](*args)
+            except Exception as e:
+                print(f"Erreur lors de l'exécution d'un travail: {str(e)}")
+            finally:
+                self.state._execute("DELETE FROM jobs WHERE id = ? AND owner = ?", (job_id, self.state.owner))
+                with self._condition:
+                    self._running.discard(job_id)
+                    self._condition.notify_all()
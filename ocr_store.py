@@ -0,0 +1,608 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Stockage compact des résultats OCR Mistral.
+Les pages sont enregistrées colonne par colonne (index, markdown, dimensions, images...)
+dans des fichiers JSONL compressés par blocs, ou dans un fichier Parquet si pyarrow est installé.
+Les images sont extraites dans des fichiers séparés. Le lecteur peut charger une seule page
+ou une seule colonne sans décompresser tout le document.
+Le module fournit aussi un cache des résultats par page, indexé par l'empreinte du contenu
+de chaque page, pour ne refaire l'OCR que des pages nouvelles ou modifiées, et un cache des
+documents distants, revalidés par une requête conditionnelle (ETag, Last-Modified).
+"""
+
+import os
+import json
+import gzip
+import hashlib
+import base64
+import time
+import shutil
+import sqlite3
+import threading
+import importlib.util
+from typing import Optional, Dict, Any, List, Iterator
+
+# Parquet est optionnel et nécessite pyarrow (importé seulement à l'usage, car lourd)
+PARQUET_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+
+STORE_VERSION = 1
+
+# Nombre de pages par bloc gzip: compromis entre taux de compression et accès aléatoire
+DEFAULT_BLOCK_SIZE = 32
+
+# Clés possibles pour le contenu base64 d'une image dans la réponse de l'API
+_IMAGE_BASE64_KEYS = ("image_base64", "base64")
+
+# Taille maximale d'un document distant téléchargé pour le cache des URL (limite de l'API Mistral)
+URL_FETCH_MAX_BYTES = int(52.4 * 1024 * 1024)
+
+# Marque une colonne absente d'une page (différent d'une valeur null)
+_MISSING = object()
+
+
+def write_result_store(result: Dict[str, Any], store_dir: str, format: str = "jsonl",
+                       block_size: int = DEFAULT_BLOCK_SIZE) -> str:
+    """
+    Écrit un résultat OCR dans un répertoire de stockage compact.
+
+    Args:
+        result: Résultat de l'OCR
+        store_dir: Répertoire de destination (remplacé s'il existe déjà)
+        format: "jsonl" (JSONL gzip par colonne) ou "parquet" (nécessite pyarrow)
+        block_size: Nombre de pages par bloc compressé (format jsonl)
+
+    Returns:
+        Chemin du répertoire écrit
+    """
+    if format not in ("jsonl", "parquet"):
+        raise ValueError(f"Format de stockage inconnu: {format}")
+    if format == "parquet" and not PARQUET_AVAILABLE:
+        raise RuntimeError("Le format parquet nécessite pyarrow. Installez-le avec: pip install pyarrow")
+
+    if os.path.exists(store_dir):
+        shutil.rmtree(store_dir)
+    images_dir = os.path.join(store_dir, "images")
+    os.makedirs(images_dir)
+
+    pages = result.get("pages", [])
+    records = [_extract_images(page, i, store_dir, images_dir) for i, page in enumerate(pages)]
+
+    # Toutes les clés rencontrées deviennent des colonnes
+    columns = []
+    for record in records:
+        for key in record:
+            if key not in columns:
+                columns.append(key)
+
+    meta = {
+        "version": STORE_VERSION,
+        "format": format,
+        "block_size": block_size,
+        "page_count": len(records),
+        "columns": columns,
+        "document": {key: value for key, value in result.items() if key != "pages"}
+    }
+
+    if format == "parquet":
+        import pyarrow
+        import pyarrow.parquet as pq
+        # Les valeurs sont sérialisées en JSON pour garder un schéma simple et stable
+        table = pyarrow.table({
+            column: [
+                json.dumps(record[column], ensure_ascii=False) if column in record else None
+                for record in records
+            ]
+            for column in columns
+        })
+        pq.write_table(table, os.path.join(store_dir, "pages.parquet"),
+                       compression="zstd", row_group_size=block_size)
+    else:
+        meta["offsets"] = {}
+        for column in columns:
+            meta["offsets"][column] = _write_column(
+                os.path.join(store_dir, f"{column}.jsonl.gz"),
+                [record.get(column, _MISSING) for record in records],
+                block_size
+            )
+
+    with open(os.path.join(store_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+    return store_dir
+
+
+def _extract_images(page: Dict[str, Any], position: int, store_dir: str, images_dir: str) -> Dict[str, Any]:
+    """
+    Copie une page en remplaçant le contenu base64 des images par un fichier séparé.
+
+    Args:
+        page: Page du résultat OCR
+        position: Position de la page dans le résultat
+        store_dir: Répertoire du stockage
+        images_dir: Répertoire des images
+
+    Returns:
+        Page sans contenu base64, avec une référence "blob" pour chaque image
+    """
+    record = dict(page)
+    images = []
+    for i, img in enumerate(page.get("images", []) or []):
+        img = dict(img)
+        for key in _IMAGE_BASE64_KEYS:
+            data = img.pop(key, None)
+            if not data:
+                continue
+            mime_prefix = ""
+            if data.startswith("data:"):
+                mime_prefix, data = data.split(",", 1)
+                mime_prefix += ","
+            img_name = img.get("id") or f"img-{i}"
+            blob_path = os.path.join(images_dir, f"page_{position}_{os.path.basename(img_name)}")
+            with open(blob_path, "wb") as f:
+                f.write(base64.b64decode(data))
+            img["blob"] = os.path.relpath(blob_path, store_dir)
+            img["blob_key"] = key
+            img["blob_prefix"] = mime_prefix
+        images.append(img)
+    if "images" in page:
+        record["images"] = images
+    return record
+
+
+def _write_column(path: str, values: List[Any], block_size: int) -> List[int]:
+    """
+    Écrit une colonne en JSONL, compressée par blocs gzip indépendants.
+
+    Args:
+        path: Chemin du fichier de la colonne
+        values: Valeurs de la colonne, une par page
+        block_size: Nombre de pages par bloc
+
+    Returns:
+        Positions (en octets) du début de chaque bloc dans le fichier
+    """
+    offsets = []
+    with open(path, "wb") as f:
+        for start in range(0, len(values), block_size):
+            offsets.append(f.tell())
+            # Une ligne vide représente une colonne absente de la page
+            lines = "".join(
+                ("" if value is _MISSING else json.dumps(value, ensure_ascii=False, separators=(",", ":"))) + "\n"
+                for value in values[start:start + block_size]
+            )
+            # Des membres gzip concaténés forment un fichier gzip valide
+            f.write(gzip.compress(lines.encode("utf-8"), compresslevel=6))
+    return offsets
+
+
+class OCRResultStore:
+    """Lecteur d'un résultat OCR écrit par write_result_store."""
+
+    def __init__(self, store_dir: str):
+        """
+        Ouvre un stockage existant.
+
+        Args:
+            store_dir: Répertoire du stockage
+        """
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.page_count = self.meta["page_count"]
+        self.columns = self.meta["columns"]
+        self._parquet_file = None
+
+    @property
+    def document(self) -> Dict[str, Any]:
+        """Champs du résultat hors pages (model, usage_info...)."""
+        return self.meta["document"]
+
+    def read_column(self, column: str) -> List[Any]:
+        """
+        Charge une seule colonne pour toutes les pages (ex: "markdown").
+
+        Args:
+            column: Nom de la colonne
+
+        Returns:
+            Valeurs de la colonne, dans l'ordre des pages (None si la colonne est absente d'une page)
+        """
+        return [None if value is _MISSING else value for value in self._read_column_values(column)]
+
+    def _read_column_values(self, column: str) -> List[Any]:
+        """Charge une colonne en conservant le marqueur des colonnes absentes."""
+        if column not in self.columns:
+            raise KeyError(f"Colonne inconnue: {column}")
+
+        if self.meta["format"] == "parquet":
+            import pyarrow.parquet as pq
+            table = pq.read_table(os.path.join(self.store_dir, "pages.parquet"), columns=[column])
+            return [_decode_value(value) for value in table.column(column).to_pylist()]
+
+        with gzip.open(os.path.join(self.store_dir, f"{column}.jsonl.gz"), "rt", encoding="utf-8") as f:
+            return [_decode_value(line.rstrip("\n")) for line in f]
+
+    def read_page(self, position: int, with_images: bool = False) -> Dict[str, Any]:
+        """
+        Charge une seule page en ne décompressant que les blocs qui la contiennent.
+
+        Args:
+            position: Position de la page dans le résultat
+            with_images: Recharger le contenu base64 des images
+
+        Returns:
+            Page au format de la réponse de l'API
+        """
+        if not 0 <= position < self.page_count:
+            raise IndexError(f"Page {position} hors limites (0-{self.page_count - 1})")
+
+        if self.meta["format"] == "parquet":
+            if self._parquet_file is None:
+                import pyarrow.parquet as pq
+                self._parquet_file = pq.ParquetFile(os.path.join(self.store_dir, "pages.parquet"))
+            # Un groupe de lignes Parquet correspond à un bloc de pages
+            block_size = self.meta["block_size"]
+            table = self._parquet_file.read_row_group(position // block_size)
+            row = position % block_size
+            page = {column: _decode_value(table.column(column)[row].as_py()) for column in self.columns}
+        else:
+            page = {column: self._read_cell(column, position) for column in self.columns}
+
+        # Les colonnes absentes de cette page ne sont pas restituées
+        page = {key: value for key, value in page.items() if value is not _MISSING}
+        return self._restore_images(page) if with_images else page
+
+    def iter_pages(self, with_images: bool = False) -> Iterator[Dict[str, Any]]:
+        """
+        Parcourt toutes les pages.
+
+        Args:
+            with_images: Recharger le contenu base64 des images
+
+        Yields:
+            Pages au format de la réponse de l'API
+        """
+        values = {column: self._read_column_values(column) for column in self.columns}
+        for position in range(self.page_count):
+            page = {
+                column: values[column][position]
+                for column in self.columns
+                if values[column][position] is not _MISSING
+            }
+            yield self._restore_images(page) if with_images else page
+
+    def to_result(self, with_images: bool = True) -> Dict[str, Any]:
+        """
+        Reconstruit le résultat OCR complet.
+
+        Args:
+            with_images: Recharger le contenu base64 des images
+
+        Returns:
+            Résultat au format de la réponse de l'API
+        """
+        result = dict(self.document)
+        result["pages"] = list(self.iter_pages(with_images=with_images))
+        return result
+
+    def _read_cell(self, column: str, position: int) -> Any:
+        """Lit la valeur d'une colonne pour une page, en décompressant un seul bloc."""
+        block_size = self.meta["block_size"]
+        offsets = self.meta["offsets"][column]
+        block = position // block_size
+        path = os.path.join(self.store_dir, f"{column}.jsonl.gz")
+        with open(path, "rb") as f:
+            f.seek(offsets[block])
+            end = offsets[block + 1] if block + 1 < len(offsets) else None
+            data = f.read(end - offsets[block]) if end is not None else f.read()
+        # Séparer sur "\n" seulement: json.dumps laisse U+2028, \x1c, \f... tels quels dans les valeurs
+        lines = gzip.decompress(data).decode("utf-8").split("\n")
+        return _decode_value(lines[position % block_size])
+
+    def _restore_images(self, page: Dict[str, Any]) -> Dict[str, Any]:
+        """Remplace les références "blob" des images par leur contenu base64."""
+        if not page.get("images"):
+            return page
+        images = []
+        for img in page["images"]:
+            img = dict(img)
+            blob = img.pop("blob", None)
+            key = img.pop("blob_key", "image_base64")
+            prefix = img.pop("blob_prefix", "")
+            if blob:
+                with open(os.path.join(self.store_dir, blob), "rb") as f:
+                    img[key] = prefix + base64.b64encode(f.read()).decode("utf-8")
+            images.append(img)
+        page = dict(page)
+        page["images"] = images
+        return page
+
+
+def _decode_value(serialized: Optional[str]) -> Any:
+    """Désérialise une valeur de colonne (vide ou None = colonne absente de la page)."""
+    if serialized is None or serialized == "":
+        return _MISSING
+    return json.loads(serialized)
+
+
+class PageResultStore:
+    """Cache SQLite des résultats OCR page par page, indexé par l'empreinte du contenu de la page."""
+
+    def __init__(self, db_path: str):
+        """
+        Ouvre (ou crée) le cache.
+
+        Args:
+            db_path: Chemin du fichier SQLite du cache
+        """
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS page_results (
+                    page_hash TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    include_images INTEGER NOT NULL,
+                    page BLOB NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (page_hash, model, include_images)
+                )
+            """)
+            self._conn.commit()
+
+    def close(self):
+        """Ferme la connexion au cache."""
+        with self._lock:
+            self._conn.close()
+
+    def get_many(self, page_hashes: List[str], model: str, include_images: bool) -> Dict[str, Dict[str, Any]]:
+        """
+        Recherche les pages déjà traitées.
+
+        Args:
+            page_hashes: Empreintes des pages
+            model: Modèle OCR utilisé
+            include_images: Les images en base64 étaient-elles demandées
+
+        Returns:
+            Dictionnaire empreinte -> page (sans index) pour les pages trouvées
+        """
+        found = {}
+        unique = list(dict.fromkeys(page_hashes))
+        with self._lock:
+            # Requêtes par paquets pour rester sous la limite de paramètres de SQLite
+            for start in range(0, len(unique), 500):
+                chunk = unique[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT page_hash, page FROM page_results WHERE model = ? AND include_images = ? "
+                    f"AND page_hash IN ({placeholders})",
+                    [model, int(include_images)] + chunk
+                ).fetchall()
+                for page_hash, blob in rows:
+                    found[page_hash] = json.loads(gzip.decompress(blob).decode("utf-8"))
+        return found
+
+    def put_many(self, pages: Dict[str, Dict[str, Any]], model: str, include_images: bool):
+        """
+        Enregistre des pages traitées.
+
+        Args:
+            pages: Dictionnaire empreinte -> page
+            model: Modèle OCR utilisé
+            include_images: Les images en base64 étaient-elles demandées
+        """
+        now = time.time()
+        rows = []
+        for page_hash, page in pages.items():
+            page = {key: value for key, value in page.items() if key != "index"}
+            blob = gzip.compress(json.dumps(page, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+            rows.append((page_hash, model, int(include_images), blob, now))
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO page_results (page_hash, model, include_images, page, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+
+
+def fetch_url(url: str, etag: Optional[str] = None, last_modified: Optional[str] = None,
+              timeout: float = 30, max_bytes: int = URL_FETCH_MAX_BYTES,
+              allow_private: bool = False) -> Dict[str, Any]:
+    """
+    Télécharge un document, ou vérifie seulement qu'il n'a pas changé (GET conditionnel).
+
+    Args:
+        url: URL du document
+        etag: ETag de la version connue (en-tête If-None-Match)
+        last_modified: Date de la version connue (en-tête If-Modified-Since)
+        timeout: Délai maximal de chaque lecture, en secondes
+        max_bytes: Taille maximale du document (ValueError au-delà)
+        allow_private: Accepter les hôtes non publics (boucle locale, réseau privé, lien local);
+                       à réserver aux URL choisies par l'opérateur (voir ocr_http)
+
+    Returns:
+        {"modified": False} si la version connue est à jour, sinon {"modified": True, "content",
+        "content_type", "etag", "last_modified"}
+    """
+    # urllib.request importe ssl et http.client: seulement au premier téléchargement
+    import urllib.error
+    import urllib.request
+    from ocr_http import open_url
+
+    headers = {"User-Agent": "mistral-ocr"}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    request = urllib.request.Request(url, headers=headers)
+    try:
+        response = open_url(request, timeout, allow_private=allow_private)
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return {"modified": False}
+        raise
+    with response:
+        length = response.headers.get("Content-Length")
+        if length and length.isdigit() and int(length) > max_bytes:
+            raise ValueError(f"Document trop volumineux ({int(length)} octets)")
+        content = response.read(max_bytes + 1)
+        if len(content) > max_bytes:
+            raise ValueError(f"Document trop volumineux (plus de {max_bytes} octets)")
+        return {
+            "modified": True,
+            "content": content,
+            "content_type": response.headers.get_content_type(),
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }
+
+
+class URLResultStore:
+    """
+    Cache SQLite des résultats OCR des documents distants: pour chaque URL, les validateurs HTTP
+    (ETag, Last-Modified) et l'empreinte de la dernière version, et pour chaque empreinte le résultat.
+    Un document inchangé (réponse 304, ou même contenu) n'est pas soumis à nouveau à l'OCR.
+    """
+
+    def __init__(self, db_path: str, allow_private_hosts: bool = False):
+        """
+        Ouvre (ou crée) le cache.
+
+        Args:
+            db_path: Chemin du fichier SQLite du cache
+            allow_private_hosts: Télécharger aussi depuis des hôtes non publics (boucle locale, réseau
+                                 privé, lien local). Refusé par défaut: sur un serveur, les URL viennent
+                                 des utilisateurs, et le document est alors transmis à l'API par son URL
+        """
+        self.db_path = db_path
+        self.allow_private_hosts = allow_private_hosts
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS url_versions (
+                    url TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    include_images INTEGER NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    content_hash TEXT NOT NULL,
+                    checked_at REAL NOT NULL,
+                    PRIMARY KEY (url, model, include_images)
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS url_results (
+                    content_hash TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    include_images INTEGER NOT NULL,
+                    result BLOB NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (content_hash, model, include_images)
+                )
+            """)
+            self._conn.commit()
+
+    def close(self):
+        """Ferme la connexion au cache."""
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def content_hash(content: bytes) -> str:
+        """Empreinte du contenu d'un document."""
+        return hashlib.sha256(content).hexdigest()
+
+    def get_version(self, url: str, model: str, include_images: bool) -> Optional[Dict[str, Any]]:
+        """
+        Dernière version connue d'une URL dont le résultat est en cache.
+
+        Args:
+            url: URL du document
+            model: Modèle OCR utilisé
+            include_images: Les images en base64 étaient-elles demandées
+
+        Returns:
+            {"etag", "last_modified", "content_hash"}, ou None si l'URL est inconnue
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT v.etag, v.last_modified, v.content_hash FROM url_versions v "
+                "JOIN url_results r ON r.content_hash = v.content_hash AND r.model = v.model "
+                "AND r.include_images = v.include_images "
+                "WHERE v.url = ? AND v.model = ? AND v.include_images = ?",
+                (url, model, int(include_images))
+            ).fetchone()
+        if row is None:
+            return None
+        return {"etag": row[0], "last_modified": row[1], "content_hash": row[2]}
+
+    def get_result(self, content_hash: str, model: str, include_images: bool) -> Optional[Dict[str, Any]]:
+        """
+        Résultat OCR d'un contenu déjà traité.
+
+        Args:
+            content_hash: Empreinte du contenu
+            model: Modèle OCR utilisé
+            include_images: Les images en base64 étaient-elles demandées
+
+        Returns:
+            Résultat de l'OCR, ou None s'il n'est pas en cache
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result FROM url_results WHERE content_hash = ? AND model = ? AND include_images = ?",
+                (content_hash, model, int(include_images))
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(gzip.decompress(row[0]).decode("utf-8"))
+
+    def put(self, url: str, model: str, include_images: bool, content_hash: str, etag: Optional[str],
+            last_modified: Optional[str], result: Optional[Dict[str, Any]] = None):
+        """
+        Enregistre la version d'une URL, et le résultat OCR de son contenu s'il est fourni.
+
+        Args:
+            url: URL du document
+            model: Modèle OCR utilisé
+            include_images: Les images en base64 étaient-elles demandées
+            content_hash: Empreinte du contenu
+            etag: En-tête ETag de la réponse
+            last_modified: En-tête Last-Modified de la réponse
+            result: Résultat de l'OCR (None s'il est déjà en cache)
+        """
+        now = time.time()
+        with self._lock:
+            if result is not None:
+                blob = gzip.compress(json.dumps(result, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO url_results (content_hash, model, include_images, result, created_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (content_hash, model, int(include_images), blob, now)
+                )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO url_versions "
+                "(url, model, include_images, etag, last_modified, content_hash, checked_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, model, int(include_images), etag, last_modified, content_hash, now)
+            )
+            self._conn.commit()
+
+    def touch(self, url: str, model: str, include_images: bool):
+        """Note qu'une URL vient d'être revalidée (réponse 304)."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE url_versions SET checked_at = ? WHERE url = ? AND model = ? AND include_images = ?",
+                (time.time(), url, model, int(include_images))
+            )
+            self._conn.commit()
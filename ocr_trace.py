@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Traces des traitements, sur le modèle d'OpenTelemetry et sans dépendance ni réseau.
+Chaque traitement forme une trace: un arbre de spans (envoi, URL signée, appel OCR, cache des
+pages, rendu de chaque page, écriture...) avec leur durée, leurs attributs et leurs erreurs.
+Les spans terminés sont exportés dans un fichier JSONL et/ou sur la console, et les lignes
+affichées pendant un span sont préfixées par l'identifiant de sa trace.
+Le traçage est désactivé par défaut: un span ne coûte alors qu'un appel de fonction.
+
+Pour construire un flame graph (flamegraph.pl, speedscope) à partir d'un fichier de spans:
+    python ocr_trace.py traces.jsonl > traces.folded
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+import functools
+import contextlib
+import contextvars
+from typing import Any, Dict, Iterable, List, Optional, TextIO
+
+# Span en cours (suivi par thread et par tâche asyncio)
+_current_span = contextvars.ContextVar("ocr_current_span", default=None)
+
+# Traceur configuré par configure_tracing (None: traçage désactivé)
+_tracer = None
+
+
+def new_trace_id() -> str:
+    """Identifiant de trace (128 bits, en hexadécimal comme dans OpenTelemetry)."""
+    return os.urandom(16).hex()
+
+
+class Span:
+    """Opération mesurée d'une trace."""
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.events: List[Dict[str, Any]] = []
+        self.error: Optional[str] = None
+        self.start_ns = time.time_ns()
+        self._start = time.perf_counter()
+        self.duration = None
+
+    def set_attribute(self, key: str, value: Any):
+        """Ajoute ou remplace un attribut du span."""
+        self.attributes[key] = value
+
+    def add_event(self, name: str, **attributes):
+        """Enregistre un événement daté dans le span (nouvelle tentative, doublon...)."""
+        self.events.append({"name": name, "time_unix_nano": time.time_ns(), "attributes": attributes})
+
+    def record_error(self, error: BaseException):
+        """Marque le span en échec."""
+        self.error = f"{type(error).__name__}: {error}"
+
+    def end(self):
+        """Termine le span."""
+        self.duration = time.perf_counter() - self._start
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Span au format JSON exporté (noms de champs d'OpenTelemetry)."""
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_id,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": self.start_ns + int(self.duration * 1e9),
+            "duration_ms": round(self.duration * 1000, 3),
+            "attributes": self.attributes,
+            "events": self.events,
+            "status": {"code": "ERROR", "message": self.error} if self.error else {"code": "OK"},
+            "thread": threading.current_thread().name,
+        }
+
+
+class _NoopSpan:
+    """Span sans effet, utilisé quand le traçage est désactivé."""
+
+    trace_id = None
+    span_id = None
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def add_event(self, name: str, **attributes):
+        pass
+
+    def record_error(self, error: BaseException):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class FileSpanExporter:
+    """Ajoute chaque span terminé, en JSON, à un fichier JSONL."""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class ConsoleSpanExporter:
+    """Affiche une ligne par span terminé (sur la sortie d'erreur par défaut)."""
+
+    def __init__(self, stream: Optional[TextIO] = None):
+        self.stream = stream
+
+    def export(self, span: Span):
+        attributes = " ".join(f"{key}={value}" for key, value in span.attributes.items())
+        status = f" ERREUR {span.error}" if span.error else ""
+        stream = self.stream or sys.__stderr__
+        stream.write(f"[trace={span.trace_id} span={span.span_id}] {span.name} "
+                     f"{span.duration * 1000:.1f} ms {attributes}{status}\n")
+        stream.flush()
+
+    def close(self):
+        pass
+
+
+class _TracedOutput:
+    """Sortie qui préfixe les lignes écrites pendant un span par l'identifiant de sa trace."""
+
+    def __init__(self, stream: TextIO):
+        self._stream = stream
+        self._local = threading.local()
+
+    def write(self, text: str) -> int:
+        span = _current_span.get()
+        if span is None:
+            if text:
+                self._local.line_start = text.endswith("\n")
+            return self._stream.write(text)
+        pieces = []
+        line_start = getattr(self._local, "line_start", True)
+        for piece in text.splitlines(keepends=True):
+            if line_start and piece != "\n":
+                pieces.append(f"[trace={span.trace_id}] ")
+            pieces.append(piece)
+            line_start = piece.endswith("\n")
+        self._local.line_start = line_start
+        return self._stream.write("".join(pieces))
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class Tracer:
+    """Transmet les spans terminés aux exportateurs."""
+
+    def __init__(self, exporters: List[Any]):
+        self.exporters = exporters
+
+    def export(self, span: Span):
+        for exporter in self.exporters:
+            try:
+                exporter.export(span)
+            except Exception as e:
+                # Une trace perdue ne doit jamais faire échouer le traitement
+                sys.__stderr__.write(f"Erreur lors de l'export d'un span: {str(e)}\n")
+
+    def close(self):
+        for exporter in self.exporters:
+            exporter.close()
+
+
+def configure_tracing(file_path: Optional[str] = None, console: bool = False, annotate_output: bool = True):
+    """
+    Active le traçage pour tout le processus.
+
+    Args:
+        file_path: Fichier JSONL où ajouter les spans (None pour aucun)
+        console: Afficher chaque span terminé sur la sortie d'erreur
+        annotate_output: Préfixer les lignes affichées (print) pendant un span par l'identifiant de la trace
+    """
+    global _tracer
+    exporters = []
+    if file_path:
+        exporters.append(FileSpanExporter(file_path))
+    if console:
+        exporters.append(ConsoleSpanExporter())
+    if not exporters:
+        return
+    shutdown_tracing()
+    _tracer = Tracer(exporters)
+    if annotate_output and not isinstance(sys.stdout, _TracedOutput):
+        sys.stdout = _TracedOutput(sys.stdout)
+
+
+def shutdown_tracing():
+    """Désactive le traçage et ferme les fichiers de spans."""
+    global _tracer
+    if _tracer is not None:
+        _tracer.close()
+        _tracer = None
+    if isinstance(sys.stdout, _TracedOutput):
+        sys.stdout = sys.stdout._stream
+
+
+def tracing_enabled() -> bool:
+    """Indique si le traçage est activé."""
+    return _tracer is not None
+
+
+@contextlib.contextmanager
+def span(name: str, trace_id: Optional[str] = None, **attributes):
+    """
+    Mesure une opération dans la trace en cours (ou démarre une trace).
+
+    Args:
+        name: Nom de l'opération (ex: "ocr.process")
+        trace_id: Identifiant de la trace à démarrer, si aucun span n'est en cours
+        **attributes: Attributs du span
+
+    Returns:
+        Gestionnaire de contexte donnant le span (NOOP_SPAN si le traçage est désactivé)
+    """
+    tracer = _tracer
+    if tracer is None:
+        yield NOOP_SPAN
+        return
+    parent = _current_span.get()
+    if parent is not None:
+        current = Span(name, parent.trace_id, parent.span_id, attributes)
+    else:
+        current = Span(name, trace_id or new_trace_id(), None, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.record_error(e)
+        raise
+    finally:
+        current.end()
+        _current_span.reset(token)
+        tracer.export(current)
+
+
+# Indicateur des fonctions async (inspect.CO_COROUTINE, sans importer inspect)
+_CO_COROUTINE = 0x0080
+
+
+def traced(name: str):
+    """
+    Décorateur: chaque appel de la fonction (ou coroutine) décorée forme un span.
+
+    Args:
+        name: Nom du span
+    """
+    def decorate(func):
+        if func.__code__.co_flags & _CO_COROUTINE:
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if _tracer is None:
+                    return await func(*args, **kwargs)
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return func(*args, **kwargs)
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def current_span():
+    """Span en cours (NOOP_SPAN si aucun)."""
+    return _current_span.get() or NOOP_SPAN
+
+
+def fold_spans(spans: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    Convertit des spans exportés en piles repliées pour un flame graph.
+
+    Args:
+        spans: Spans au format exporté (to_dict)
+
+    Returns:
+        Temps propre (hors spans enfants) en microsecondes par pile "racine;enfant;...;span"
+    """
+    by_id = {}
+    children_ms: Dict[str, float] = {}
+    for item in spans:
+        by_id[(item["trace_id"], item["span_id"])] = item
+    for (trace_id, _), item in by_id.items():
+        if item.get("parent_span_id"):
+            key = (trace_id, item["parent_span_id"])
+            children_ms[key] = children_ms.get(key, 0.0) + item["duration_ms"]
+
+    folded: Dict[str, int] = {}
+    for key, item in by_id.items():
+        names = [item["name"]]
+        parent = by_id.get((item["trace_id"], item.get("parent_span_id")))
+        while parent is not None:
+            names.append(parent["name"])
+            parent = by_id.get((parent["trace_id"], parent.get("parent_span_id")))
+        own_us = int(max(0.0, item["duration_ms"] - children_ms.get(key, 0.0)) * 1000)
+        stack = ";".join(reversed(names))
+        folded[stack] = folded.get(stack, 0) + own_us
+    return folded
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python ocr_trace.py traces.jsonl [...] > traces.folded")
+        sys.exit(1)
+    loaded = []
+    for trace_file in sys.argv[1:]:
+        with open(trace_file, encoding="utf-8") as f:
+            loaded.extend(json.loads(line) for line in f if line.strip())
+    for stack, value in sorted(fold_spans(loaded).items()):
+        if value > 0:
+            print(f"{stack} {value}")
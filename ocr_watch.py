@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Surveillance d'un dossier de dépôt pour l'OCR automatique.
+Les nouveaux fichiers sont détectés par inotify (via watchdog, si installé) ou à défaut
+par des parcours périodiques du dossier. Un fichier n'est traité qu'une fois stable
+(taille et date inchangées pendant un délai), avec un nombre limité de traitements simultanés.
+"""
+
+import os
+import time
+import threading
+import importlib.util
+import concurrent.futures
+from collections import deque
+from typing import Callable, Dict, Any, Optional, Tuple
+
+# watchdog est optionnel: sans lui, on se rabat sur des parcours périodiques
+WATCHDOG_AVAILABLE = importlib.util.find_spec("watchdog") is not None
+
+# Nombre de traitements terminés conservés pour les statistiques glissantes
+_STATS_WINDOW = 500
+
+
+class FolderWatcher:
+    """Surveille un dossier et transmet chaque nouveau fichier stable à une fonction de traitement."""
+
+    def __init__(self, watch_dir: str, handler: Callable[[str], str], extensions: Tuple[str, ...],
+                 workers: int = 4, settle_seconds: float = 5.0, poll_interval: float = 2.0,
+                 report_interval: float = 60.0, ignore_dir_names: Tuple[str, ...] = (),
+                 force_polling: bool = False):
+        """
+        Prépare la surveillance.
+
+        Args:
+            watch_dir: Dossier surveillé (récursivement)
+            handler: Fonction appelée avec le chemin absolu de chaque fichier prêt; retourne une issue
+                     ("written", "skipped" ou "failed")
+            extensions: Extensions des fichiers à traiter (en minuscules, avec le point)
+            workers: Nombre maximal de fichiers traités simultanément
+            settle_seconds: Délai sans modification avant de considérer un fichier comme complet
+            poll_interval: Intervalle des vérifications (et des parcours en mode polling)
+            report_interval: Intervalle d'affichage des statistiques (0 pour désactiver)
+            ignore_dir_names: Noms de dossiers ignorés (ex: dossiers de sortie)
+            force_polling: Utiliser le polling même si watchdog est disponible
+        """
+        self.watch_dir = os.path.abspath(watch_dir)
+        self.handler = handler
+        self.extensions = extensions
+        self.workers = max(1, workers)
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.report_interval = report_interval
+        self.ignore_dir_names = set(ignore_dir_names)
+        self.use_watchdog = WATCHDOG_AVAILABLE and not force_polling
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        # Fichiers en attente de stabilisation: chemin -> (taille, mtime, vu le, dernier changement)
+        self._candidates: Dict[str, Tuple[int, float, float, float]] = {}
+        # Fichiers stables en attente d'un worker: (chemin, vu le)
+        self._queue = deque()
+        self._queued = set()
+        self._in_flight = set()
+        # Signature (taille, mtime) des fichiers déjà pris en charge, pour ne pas les retraiter;
+        # une entrée est retirée quand le fichier disparaît
+        self._seen: Dict[str, Tuple[int, float]] = {}
+
+        self._started_at = None
+        self._counts = {"written": 0, "skipped": 0, "failed": 0}
+        # (terminé le, latence depuis la détection) des derniers traitements
+        self._completed = deque(maxlen=_STATS_WINDOW)
+
+    def notify(self, path: str):
+        """
+        Signale un fichier créé ou modifié.
+
+        Args:
+            path: Chemin du fichier
+        """
+        path = os.path.abspath(path)
+        if not self._is_candidate(path):
+            return
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        now = time.time()
+        with self._lock:
+            if path in self._queued or path in self._in_flight:
+                return
+            if self._seen.get(path) == (stat.st_size, stat.st_mtime):
+                return
+            previous = self._candidates.get(path)
+            first_seen = previous[2] if previous else now
+            if previous is None or previous[:2] != (stat.st_size, stat.st_mtime):
+                self._candidates[path] = (stat.st_size, stat.st_mtime, first_seen, now)
+
+    def forget(self, path: str):
+        """
+        Signale un fichier supprimé ou déplacé hors de son chemin.
+
+        Args:
+            path: Chemin du fichier
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            self._seen.pop(path, None)
+            self._candidates.pop(path, None)
+
+    def run(self):
+        """Lance la surveillance jusqu'à stop() ou Ctrl+C."""
+        self._started_at = time.time()
+        mode = "inotify (watchdog)" if self.use_watchdog else f"polling toutes les {self.poll_interval:g} s"
+        print(f"Surveillance de {self.watch_dir} ({mode}), {self.workers} traitement(s) simultané(s)")
+
+        observer = None
+        if self.use_watchdog:
+            observer = _start_watchdog_observer(self)
+
+        # Les fichiers déjà présents sont pris en compte au démarrage
+        self._scan()
+        last_scan = last_report = time.time()
+
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            while not self._stop.is_set():
+                now = time.time()
+                if not self.use_watchdog and now - last_scan >= self.poll_interval:
+                    self._scan()
+                    last_scan = now
+                self._promote_stable_files(now)
+                self._dispatch(executor)
+                if self.report_interval and now - last_report >= self.report_interval:
+                    self.report()
+                    last_report = now
+                self._stop.wait(min(self.poll_interval, 1.0))
+        except KeyboardInterrupt:
+            print("\nArrêt demandé, attente des traitements en cours...")
+        finally:
+            if observer is not None:
+                observer.stop()
+                observer.join()
+            executor.shutdown(wait=True)
+            self.report()
+
+    def stop(self):
+        """Demande l'arrêt de la surveillance."""
+        self._stop.set()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Retourne les statistiques de débit et de latence.
+
+        Returns:
+            Dictionnaire des compteurs, de la file d'attente, du débit et de la latence
+        """
+        now = time.time()
+        with self._lock:
+            completed = list(self._completed)
+            stats = dict(self._counts)
+            stats.update({
+                "waiting_to_settle": len(self._candidates),
+                "queued": len(self._queue),
+                "in_flight": len(self._in_flight),
+                # Ancienneté du plus vieux fichier en attente d'un worker
+                "oldest_queued_seconds": round(now - self._queue[0][1], 1) if self._queue else 0.0,
+            })
+
+        elapsed = max(now - (self._started_at or now), 1e-9)
+        stats["uptime_seconds"] = round(elapsed, 1)
+        stats["throughput_per_minute"] = round(60 * (stats["written"] + stats["failed"]) / elapsed, 2)
+
+        # Débit et latence sur la fenêtre glissante des derniers traitements
+        recent = [c for c in completed if now - c[0] <= 300]
+        window_minutes = min(5.0, elapsed / 60)
+        stats["throughput_last_5min_per_minute"] = round(len(recent) / max(window_minutes, 1e-9), 2)
+        lags = sorted(c[1] for c in completed)
+        if lags:
+            stats["lag_p50_seconds"] = round(lags[len(lags) // 2], 1)
+            stats["lag_p95_seconds"] = round(lags[min(len(lags) - 1, int(len(lags) * 0.95))], 1)
+            stats["lag_max_seconds"] = round(lags[-1], 1)
+        return stats
+
+    def report(self):
+        """Affiche une ligne de statistiques."""
+        s = self.stats()
+        line = (f"[watch] écrits={s['written']} échecs={s['failed']} ignorés={s['skipped']} "
+                f"en cours={s['in_flight']} file={s['queued']} stabilisation={s['waiting_to_settle']} "
+                f"débit={s['throughput_last_5min_per_minute']}/min")
+        if "lag_p50_seconds" in s:
+            line += f" latence p50={s['lag_p50_seconds']}s p95={s['lag_p95_seconds']}s"
+        print(line)
+
+    def _is_candidate(self, path: str) -> bool:
+        """Indique si un chemin correspond à un document à traiter."""
+        if not path.lower().endswith(self.extensions):
+            return False
+        relative_dirs = os.path.relpath(os.path.dirname(path), self.watch_dir).split(os.sep)
+        return not any(
+            (part.startswith(".") and part != ".") or part in self.ignore_dir_names
+            for part in relative_dirs
+        )
+
+    def _scan(self):
+        """Parcourt le dossier surveillé, signale chaque fichier trouvé et oublie les fichiers disparus."""
+        found = set()
+        for root, dirs, names in os.walk(self.watch_dir):
+            dirs[:] = [d for d in dirs if not d.startswith(".") and d not in self.ignore_dir_names]
+            for name in names:
+                if name.lower().endswith(self.extensions):
+                    path = os.path.abspath(os.path.join(root, name))
+                    found.add(path)
+                    self.notify(path)
+        with self._lock:
+            # Les fichiers en cours de traitement sont oubliés à la fin de celui-ci
+            for path in [p for p in self._seen if p not in found and p not in self._in_flight]:
+                del self._seen[path]
+
+    def _promote_stable_files(self, now: float):
+        """Place dans la file les fichiers inchangés depuis settle_seconds."""
+        with self._lock:
+            paths = list(self._candidates)
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # Fichier supprimé ou déplacé avant d'être complet
+                with self._lock:
+                    self._candidates.pop(path, None)
+                continue
+            with self._lock:
+                size, mtime, first_seen, last_change = self._candidates[path]
+                if (stat.st_size, stat.st_mtime) != (size, mtime):
+                    self._candidates[path] = (stat.st_size, stat.st_mtime, first_seen, now)
+                elif stat.st_size > 0 and now - last_change >= self.settle_seconds:
+                    del self._candidates[path]
+                    self._seen[path] = (size, mtime)
+                    self._queue.append((path, first_seen))
+                    self._queued.add(path)
+
+    def _dispatch(self, executor: concurrent.futures.ThreadPoolExecutor):
+        """Confie des fichiers de la file aux workers libres."""
+        with self._lock:
+            while self._queue and len(self._in_flight) < self.workers:
+                path, first_seen = self._queue.popleft()
+                self._queued.discard(path)
+                self._in_flight.add(path)
+                executor.submit(self._process, path, first_seen)
+
+    def _process(self, path: str, first_seen: float):
+        """Traite un fichier, le reprend s'il a changé pendant le traitement et met à jour les statistiques."""
+        # Signature du contenu effectivement lu: notify() ignore les événements pendant le traitement
+        signature = _signature(path)
+        if signature is not None:
+            with self._lock:
+                self._seen[path] = signature
+        try:
+            outcome = self.handler(path)
+        except Exception as e:
+            print(f"Erreur lors du traitement de {path}: {str(e)}")
+            outcome = "failed"
+        finished = time.time()
+        current = _signature(path)
+        with self._lock:
+            self._in_flight.discard(path)
+            if current is None:
+                self._seen.pop(path, None)
+            elif current != signature:
+                # Fichier réécrit pendant le traitement: il repasse par la stabilisation
+                self._seen.pop(path, None)
+                self._candidates[path] = current + (finished, finished)
+            self._counts[outcome] = self._counts.get(outcome, 0) + 1
+            if outcome != "skipped":
+                self._completed.append((finished, finished - first_seen))
+        print(f"[watch] {outcome}: {path} ({finished - first_seen:.1f} s depuis la détection)")
+
+
+def _signature(path: str) -> Optional[Tuple[int, float]]:
+    """Retourne (taille, mtime) d'un fichier, ou None s'il n'existe plus."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime
+
+
+def _start_watchdog_observer(watcher: FolderWatcher):
+    """
+    Démarre un observateur watchdog (inotify) qui relaie les événements au FolderWatcher.
+
+    Args:
+        watcher: Surveillance à notifier
+
+    Returns:
+        Observateur démarré
+    """
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+
+    class WatchdogHandler(FileSystemEventHandler):
+        def on_created(self, event):
+            if not event.is_directory:
+                watcher.notify(event.src_path)
+
+        def on_modified(self, event):
+            if not event.is_directory:
+                watcher.notify(event.src_path)
+
+        def on_deleted(self, event):
+            if not event.is_directory:
+                watcher.forget(event.src_path)
+
+        def on_moved(self, event):
+            if not event.is_directory:
+                watcher.forget(event.src_path)
+                watcher.notify(event.dest_path)
+
+    observer = Observer()
+    observer.schedule(WatchdogHandler(), watcher.watch_dir, recursive=True)
+    observer.start()
+    return observer
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Envoi de notifications signées (webhooks) à la fin des traitements OCR.
+Chaque notification est un POST JSON signé par HMAC-SHA256 avec un secret partagé:
+l'en-tête X-OCR-Timestamp contient l'heure d'envoi et X-OCR-Signature vaut
+"sha256=" + HMAC(secret, timestamp + "." + corps). Les envois ont lieu dans un petit groupe
+de threads, avec de nouvelles tentatives en cas d'échec: dans l'ordre pour un même destinataire,
+en parallèle pour des destinataires différents (un destinataire injoignable ne retarde pas les autres).
+Les destinataires doivent être des adresses publiques, sauf les hôtes explicitement autorisés.
+"""
+
+import hmac
+import json
+import time
+import queue
+import socket
+import hashlib
+import threading
+import collections
+import urllib.request
+from urllib.parse import urlparse
+from typing import Dict, Any, Iterable
+
+from ocr_http import open_url, is_public_address
+
+# Écart maximal accepté par défaut entre l'heure de signature et la vérification
+DEFAULT_TOLERANCE_SECONDS = 300
+
+
+def sign_payload(secret: str, timestamp: str, body: bytes) -> str:
+    """
+    Calcule la signature d'une notification.
+
+    Args:
+        secret: Secret partagé avec le destinataire
+        timestamp: Heure d'envoi (secondes depuis l'epoch, en texte)
+        body: Corps JSON envoyé
+
+    Returns:
+        Signature hexadécimale
+    """
+    return hmac.new(secret.encode("utf-8"), timestamp.encode("ascii") + b"." + body, hashlib.sha256).hexdigest()
+
+
+def verify_signature(secret: str, timestamp: str, body: bytes, signature: str,
+                     tolerance: float = DEFAULT_TOLERANCE_SECONDS) -> bool:
+    """
+    Vérifie une notification reçue (à utiliser côté destinataire).
+
+    Args:
+        secret: Secret partagé
+        timestamp: Valeur de l'en-tête X-OCR-Timestamp
+        body: Corps reçu, tel quel
+        signature: Valeur de l'en-tête X-OCR-Signature
+        tolerance: Ancienneté maximale de la notification en secondes
+
+    Returns:
+        True si la signature est valide et récente
+    """
+    try:
+        if abs(time.time() - float(timestamp)) > tolerance:
+            return False
+    except ValueError:
+        return False
+    expected = "sha256=" + sign_payload(secret, timestamp, body)
+    return hmac.compare_digest(expected, signature)
+
+
+def is_valid_webhook_url(url: str, allowed_hosts: Iterable[str] = ()) -> bool:
+    """
+    Indique si une URL de notification est acceptable: http ou https, vers un hôte dont toutes
+    les adresses sont publiques (pas de boucle locale, de réseau privé ni de lien local).
+
+    Args:
+        url: URL du destinataire
+        allowed_hosts: Hôtes acceptés même s'ils ne sont pas publics (noms en minuscules)
+
+    Returns:
+        True si l'URL peut recevoir des notifications
+    """
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        return False
+    if parsed.hostname.lower() in allowed_hosts:
+        return True
+    try:
+        port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        addresses = socket.getaddrinfo(parsed.hostname, port, type=socket.SOCK_STREAM)
+    except (OSError, UnicodeError, ValueError):
+        return False
+    # L'adresse connectée est vérifiée à nouveau à chaque envoi (le nom peut changer d'adresse)
+    return all(is_public_address(address[4][0]) for address in addresses)
+
+
+class WebhookSender:
+    """Envoie les notifications en arrière-plan, dans l'ordre par destinataire, avec nouvelles tentatives."""
+
+    def __init__(self, secret: str, max_attempts: int = 5, timeout: float = 10.0, backoff: float = 1.0,
+                 workers: int = 4, allowed_hosts: Iterable[str] = ()):
+        """
+        Prépare l'envoi (les threads démarrent à la première notification).
+
+        Args:
+            secret: Secret de signature partagé avec les destinataires
+            max_attempts: Nombre maximal de tentatives par notification
+            timeout: Délai maximal d'une tentative en secondes
+            backoff: Attente avant la deuxième tentative, doublée ensuite
+            workers: Destinataires servis en parallèle
+            allowed_hosts: Hôtes joignables même s'ils ne sont pas publics (noms en minuscules)
+        """
+        self.secret = secret
+        self.max_attempts = max(1, max_attempts)
+        self.timeout = timeout
+        self.backoff = backoff
+        self.workers = max(1, workers)
+        self.allowed_hosts = frozenset(allowed_hosts)
+
+        # Notifications en attente par destinataire, et destinataires prêts à être servis
+        # (un destinataire n'est servi que par un thread à la fois, ce qui garde l'ordre de ses notifications)
+        self._pending: Dict[str, collections.deque] = {}
+        self._ready = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._counts = {"sent": 0, "failed": 0, "retries": 0}
+        # Notifications programmées et pas encore envoyées (ni abandonnées)
+        self._unfinished = 0
+        self._idle = threading.Condition(self._lock)
+
+    def send(self, url: str, payload: Dict[str, Any]):
+        """
+        Programme l'envoi d'une notification.
+
+        Args:
+            url: URL du destinataire
+            payload: Contenu JSON de la notification
+        """
+        destination = urlparse(url).netloc.lower()
+        with self._lock:
+            if not self._threads:
+                for _ in range(self.workers):
+                    thread = threading.Thread(target=self._worker, daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+            self._unfinished += 1
+            pending = self._pending.get(destination)
+            if pending is None:
+                self._pending[destination] = collections.deque([(url, payload)])
+                self._ready.put(destination)
+            else:
+                pending.append((url, payload))
+
+    def wait_idle(self, timeout: float) -> bool:
+        """
+        Attend l'envoi (ou l'abandon) de toutes les notifications programmées.
+
+        Args:
+            timeout: Attente maximale en secondes
+
+        Returns:
+            True si aucune notification n'est plus en attente
+        """
+        with self._idle:
+            return self._idle.wait_for(lambda: self._unfinished == 0, timeout)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Retourne les compteurs d'envoi.
+
+        Returns:
+            Notifications envoyées, en échec, tentatives supplémentaires et en attente
+        """
+        with self._lock:
+            stats = dict(self._counts)
+            stats["pending"] = sum(len(pending) for pending in self._pending.values())
+        return stats
+
+    def _worker(self):
+        """Boucle d'envoi: sert un destinataire à la fois, une notification par tour."""
+        while True:
+            destination = self._ready.get()
+            with self._lock:
+                url, payload = self._pending[destination].popleft()
+            delivered = False
+            for attempt in range(self.max_attempts):
+                if attempt:
+                    with self._lock:
+                        self._counts["retries"] += 1
+                    time.sleep(self.backoff * (2 ** (attempt - 1)))
+                try:
+                    self._deliver(url, payload)
+                    delivered = True
+                    break
+                except Exception as e:
+                    print(f"Échec de la notification vers {url} (tentative {attempt + 1}/{self.max_attempts}): {str(e)}")
+            with self._lock:
+                self._counts["sent" if delivered else "failed"] += 1
+                self._unfinished -= 1
+                self._idle.notify_all()
+                # Les notifications suivantes du destinataire passent après celles des autres
+                if self._pending[destination]:
+                    self._ready.put(destination)
+                else:
+                    del self._pending[destination]
+
+    def _deliver(self, url: str, payload: Dict[str, Any]):
+        """Envoie une notification signée (lève une exception si le destinataire ne répond pas 2xx)."""
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        timestamp = str(int(time.time()))
+        request = urllib.request.Request(url, data=body, method="POST", headers={
+            "Content-Type": "application/json",
+            "User-Agent": "mistral-ocr-webhook",
+            "X-OCR-Timestamp": timestamp,
+            "X-OCR-Signature": "sha256=" + sign_payload(self.secret, timestamp, body),
+        })
+        host = (urlparse(url).hostname or "").lower()
+        with open_url(request, self.timeout, allow_private=host in self.allowed_hosts) as response:
+            if not 200 <= response.status < 300:
+                raise RuntimeError(f"réponse HTTP {response.status}")
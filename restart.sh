@@ -28,21 +28,73 @@ if [ $? -ne 0 ]; then
     exit 1
 fi
 
-# Vérifier si un processus Flask est en cours d'exécution
-echo "Vérification des processus existants..."
-PID=$(ps aux | grep "python mistral_ocr_web/app.py" | grep -v grep | awk '{print $2}')
-
-if [ ! -z "$PID" ]; then
-    echo "Arrêt du processus existant (PID: $PID)..."
-    kill $PID
-    sleep 2
-    
-    # Vérifier si le processus a bien été arrêté
-    if ps -p $PID > /dev/null; then
-        echo "ATTENTION: Le processus n'a pas pu être arrêté proprement."
-        echo "Tentative d'arrêt forcé..."
-        kill -9 $PID
+# Nombre de processus de l'application: plusieurs processus partagent l'état des tâches
+# et la file des traitements dans la base MISTRAL_OCR_SHARED_STATE
+PROCESSES=${MISTRAL_OCR_PROCESSES:-1}
+if [ "$PROCESSES" -gt 1 ] && [ -z "$MISTRAL_OCR_SHARED_STATE" ]; then
+    echo "ERREUR: plusieurs processus nécessitent un état partagé."
+    echo "Définissez MISTRAL_OCR_SHARED_STATE (ex: export MISTRAL_OCR_SHARED_STATE=\$PWD/mistral_ocr_web/state.db)."
+    exit 1
+fi
+
+# Un processus arrêté (SIGTERM) termine ses traitements en cours avant de s'arrêter
+DRAIN_TIMEOUT=${MISTRAL_OCR_DRAIN_TIMEOUT:-600}
+STOP_TIMEOUT=$(( ${DRAIN_TIMEOUT%.*} + 30 ))
+RUN_DIR=mistral_ocr_web/run
+mkdir -p "$RUN_DIR"
+
+# Attendre l'arrêt d'un processus (arrêt forcé au-delà du délai)
+wait_for_exit() {
+    local pid=$1
+    local waited=0
+    while kill -0 "$pid" 2>/dev/null; do
+        if [ "$waited" -ge "$STOP_TIMEOUT" ]; then
+            echo "ATTENTION: le processus $pid ne s'est pas arrêté après ${STOP_TIMEOUT} s."
+            echo "Tentative d'arrêt forcé..."
+            kill -9 "$pid"
+            sleep 1
+            break
+        fi
         sleep 1
+        waited=$((waited + 1))
+    done
+}
+
+# Arrêter un processus proprement
+stop_process() {
+    local pid=$1
+    echo "Arrêt du processus $pid (fin des traitements en cours)..."
+    kill -TERM "$pid" 2>/dev/null
+    wait_for_exit "$pid"
+}
+
+# Démarrer un processus et attendre qu'il écoute (il écrit alors son PID dans le fichier indiqué)
+start_process() {
+    local pid_file=$1
+    rm -f "$pid_file"
+    MISTRAL_OCR_PID_FILE="$pid_file" python mistral_ocr_web/app.py >> app.log 2>&1 &
+    local pid=$!
+    local waited=0
+    while [ ! -s "$pid_file" ]; do
+        if ! kill -0 "$pid" 2>/dev/null || [ "$waited" -ge 60 ]; then
+            echo "ERREUR: l'application n'a pas pu démarrer."
+            echo "Veuillez consulter le fichier app.log pour plus de détails."
+            return 1
+        fi
+        sleep 1
+        waited=$((waited + 1))
+    done
+    echo "Processus $pid démarré."
+}
+
+# Processus lancé par une version précédente de ce script (sans fichier PID)
+echo "Vérification des processus existants..."
+if [ ! -f "$RUN_DIR/worker-1.pid" ]; then
+    LEGACY_PID=$(ps aux | grep "python mistral_ocr_web/app.py" | grep -v grep | awk '{print $2}')
+    if [ ! -z "$LEGACY_PID" ]; then
+        for pid in $LEGACY_PID; do
+            stop_process "$pid"
+        done
     fi
 fi
 
@@ -50,18 +102,45 @@ fi
 mkdir -p mistral_ocr_web/uploads
 echo "Dossier uploads vérifié."
 
-# Démarrer l'application en arrière-plan
-echo "Démarrage de l'application..."
-python mistral_ocr_web/app.py > app.log 2>&1 &
+# Remplacer les processus un par un. Avec l'état partagé, le remplaçant démarre sur le même
+# port (SO_REUSEPORT) avant l'arrêt de l'ancien: le service n'est jamais interrompu et les
+# traitements en file sont pris par les autres processus. Sans état partagé, l'unique
+# processus termine ses traitements puis est redémarré.
+echo "Démarrage de l'application ($PROCESSES processus)..."
+for i in $(seq 1 "$PROCESSES"); do
+    PID_FILE="$RUN_DIR/worker-$i.pid"
+    OLD_PID=""
+    if [ -f "$PID_FILE" ] && kill -0 "$(cat "$PID_FILE")" 2>/dev/null; then
+        OLD_PID=$(cat "$PID_FILE")
+    fi
 
-# Vérifier si l'application a démarré
-if [ $? -ne 0 ]; then
-    echo "ERREUR: L'application n'a pas pu démarrer."
-    echo "Veuillez consulter le fichier app.log pour plus de détails."
-    exit 1
-fi
+    if [ -n "$MISTRAL_OCR_SHARED_STATE" ]; then
+        start_process "$RUN_DIR/worker-$i.new.pid" || exit 1
+        if [ -n "$OLD_PID" ]; then
+            stop_process "$OLD_PID"
+        fi
+        mv "$RUN_DIR/worker-$i.new.pid" "$PID_FILE"
+    else
+        if [ -n "$OLD_PID" ]; then
+            stop_process "$OLD_PID"
+        fi
+        start_process "$PID_FILE" || exit 1
+    fi
+done
+
+# Arrêter les processus en trop (nombre de processus réduit)
+for PID_FILE in "$RUN_DIR"/worker-*.pid; do
+    [ -f "$PID_FILE" ] || continue
+    INDEX=$(basename "$PID_FILE" .pid | cut -d- -f2)
+    if ! [ "$INDEX" -le "$PROCESSES" ] 2>/dev/null; then
+        if kill -0 "$(cat "$PID_FILE")" 2>/dev/null; then
+            stop_process "$(cat "$PID_FILE")"
+        fi
+        rm -f "$PID_FILE"
+    fi
+done
 
 echo "Application démarrée avec succès!"
-echo "Vous pouvez accéder à l'application à l'adresse: http://127.0.0.1:5001"
+echo "Vous pouvez accéder à l'application à l'adresse: http://127.0.0.1:${MISTRAL_OCR_PORT:-5001}"
 echo "Les logs sont disponibles dans le fichier: app.log"
-echo "===================================================================" 
\ No newline at end of file
+echo "==================================================================="
\ No newline at end of file